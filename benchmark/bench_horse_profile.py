@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the horse profile parser against the previous label-scan parser.
+
+usage: python benchmark/bench_horse_profile.py [--repeat 50]
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py.horse_profile import available_backends, parse_horse_profile  # noqa: E402
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_parse(html):
+    # the parser scrape_horses used before: one full-tree search per label
+    soup = BeautifulSoup(html, 'html.parser')
+
+    name_tag = soup.find('span', class_='title_text')
+    horse_name = 'na'
+    if name_tag:
+        match = re.match(r'^([^\(]+)', name_tag.get_text())
+        horse_name = match.group(1).strip() if match else name_tag.get_text()
+
+    def get_info(label_text):
+        label = soup.find('td', string=lambda text: text and label_text in text)
+        return label.find_next().find_next().get_text(strip=True) if label else 'na'
+
+    return {
+        'Horse_name': horse_name,
+        'Origin / Age': get_info('Country of Origin'),
+        'Colour / Sex': get_info('Colour / Sex'),
+        'Import type': get_info('Import Type'),
+        'Sire': get_info('Sire'),
+        'Dam': get_info('Dam'),
+        'Dam sire': get_info("Dam's Sire"),
+    }
+
+
+def time_parser(parse, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            parse(html)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(fixture_dir, 'horse_*.html')))
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+
+    expected = [legacy_parse(html) for html in pages]
+
+    candidates = [('legacy html.parser', legacy_parse)]
+    for backend in available_backends():
+        candidates.append((backend, lambda html, backend=backend: parse_horse_profile(html, backend=backend)))
+
+    print(f'{len(pages)} fixture pages, {args.repeat} rounds')
+    baseline = None
+    for name, parse in candidates:
+        for path, html, record in zip(paths, pages, expected):
+            if parse(html) != record:
+                print(f'{name}: output differs from legacy parser on {os.path.basename(path)}')
+                return 1
+
+        per_page = time_parser(parse, pages, args.repeat)
+        baseline = baseline or per_page
+        print(f'{name:<20} {per_page * 1000:8.3f} ms/page  x{baseline / per_page:5.1f}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
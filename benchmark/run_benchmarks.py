@@ -0,0 +1,283 @@
+"""
+End-to-end benchmark of the pipeline stages, offline against the local stand-in server.
+
+Every stage runs in its own process so its peak memory is its own; per stage the report has the
+wall time, the requests the stand-in server answered, the peak RSS and the rows per second.
+
+  scrape_horses   scrape_horses over the card's horse pages
+  obtain_odds     obtain_odds through the json odds source
+  scrape_race     scrape_current_race: card, horse pages and odds of every race
+  update_history  fetch_meetings: results pages and horse record pages
+  clean           clean_race_data on the synthetic raw history
+  features        add_history_features on the cleaned history
+  train           build_feature_matrix and a CatBoostRanker fit
+  predict         InferenceEngine.score_meeting with the trained model and a FeatureStore
+
+usage: python benchmark/run_benchmarks.py [--output results.json] [--compare before.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stand_in import StandInServer  # noqa: E402
+
+stages = ['scrape_horses', 'obtain_odds', 'scrape_race', 'update_history', 'clean', 'features', 'train', 'predict']
+
+# stages reading what an earlier one wrote to the work folder
+requires = {'features': 'clean', 'train': 'features', 'predict': 'train'}
+
+race_date = '2025/09/07'
+card_horses = ['J256', 'H057', 'K335', 'E430', 'J180', 'K004', 'K080', 'H115', 'J499', 'K021', 'J183', 'K400',
+               'K007', 'H376']
+
+
+def _peak_rss_mb():
+    from py.cv import _peak_rss_mb
+
+    return _peak_rss_mb()
+
+
+def stage_scrape_horses(ctx):
+    from py.race_function import scrape_horses
+
+    links = [f"{ctx['base_url']}/racing/information/English/Horse/Horse.aspx?HorseId=HK_2023_{brand}"
+             for _ in range(ctx['repeat']) for brand in card_horses]
+    df = scrape_horses(links, max_workers=ctx['workers'], rate_limit=ctx['rate_limit'])
+    return len(df)
+
+
+def stage_obtain_odds(ctx):
+    from py.odds import HttpOddsSource
+    from py.race_function import obtain_odds
+
+    source = HttpOddsSource(endpoint=ctx['odds_endpoint'])
+    rows = 0
+    for race_no in range(1, ctx['races'] + 1):
+        rows += len(obtain_odds(f'https://bet.hkjc.com/en/racing/wp/2025-09-07/ST/{race_no}', source=source))
+    source.close()
+    return rows
+
+
+def stage_scrape_race(ctx):
+    from py.http_client import make_session
+    from py.odds import HttpOddsSource
+    from py.race_function import scrape_current_race
+
+    session = make_session(pool_size=ctx['workers'])
+    source = HttpOddsSource(endpoint=ctx['odds_endpoint'], session=session)
+    rows = 0
+    for race_no in range(1, ctx['races'] + 1):
+        race_url = ctx['card_url'].format(date=race_date, venue='ST', race_no=race_no)
+        odds_url = f'https://bet.hkjc.com/en/racing/wp/2025-09-07/ST/{race_no}'
+        rows += len(scrape_current_race(race_url, odds_url, session=session, odds_source=source))
+    session.close()
+    return rows
+
+
+def stage_update_history(ctx):
+    import pandas as pd
+
+    from py.http_client import HostRateLimiter
+    from py.updater import fetch_meetings
+
+    rate_limiter = HostRateLimiter(ctx['rate_limit'], burst=ctx['workers']) if ctx['rate_limit'] else None
+    df, found, incomplete = fetch_meetings([(pd.Timestamp(2025, 9, 14), 'ST')], max_race_no=ctx['races'] + 2,
+                                           max_workers=ctx['workers'], rate_limiter=rate_limiter,
+                                           results_base_url=ctx['results_url'])
+    return len(df)
+
+
+def stage_clean(ctx):
+    import pandas as pd
+
+    from py.cleaning import clean_race_data
+
+    raw = pd.read_pickle(os.path.join(ctx['work_dir'], 'race_data.pkl'))
+    df = clean_race_data(raw, start_date=None)
+    # the notebooks hand the cleaned data on as csv
+    df.to_csv(os.path.join(ctx['work_dir'], 'cleaned.csv'), index=False)
+    return len(raw)
+
+
+def stage_features(ctx):
+    import pandas as pd
+
+    from py.features import add_history_features
+
+    df = pd.read_csv(os.path.join(ctx['work_dir'], 'cleaned.csv'))
+    df['Date'] = pd.to_datetime(df['Date'])
+    df = add_history_features(df)
+    df.to_pickle(os.path.join(ctx['work_dir'], 'features.pkl'))
+    return len(df)
+
+
+def stage_train(ctx):
+    import joblib
+    import pandas as pd
+    from catboost import CatBoostRanker
+
+    from py.feature_matrix import build_feature_matrix
+    from py.feature_store import FeatureStore
+
+    df = pd.read_pickle(os.path.join(ctx['work_dir'], 'features.pkl'))
+    fm = build_feature_matrix(df, os.path.join(ctx['work_dir'], 'feature_matrix'))
+    train, val = fm.split_dates(df['Date'].quantile(0.8))
+
+    num_imputer = train.fit_imputer(strategy='median')
+    model = CatBoostRanker(iterations=ctx['iterations'], learning_rate=0.05, depth=6, loss_function='YetiRank',
+                           eval_metric='NDCG:top=4', has_time=True, verbose=0, allow_writing_files=False)
+    model.fit(train.pool(num_imputer), eval_set=val.pool(num_imputer))
+
+    model.save_model(os.path.join(ctx['work_dir'], 'model.cbm'))
+    joblib.dump(num_imputer, os.path.join(ctx['work_dir'], 'num_imputer.pkl'))
+    FeatureStore.from_history(df).save(os.path.join(ctx['work_dir'], 'feature_store.pkl'))
+    return len(df)
+
+
+def stage_predict(ctx):
+    from py.inference import InferenceEngine
+
+    engine = InferenceEngine(model_path=os.path.join(ctx['work_dir'], 'model.cbm'),
+                             imputer_path=os.path.join(ctx['work_dir'], 'num_imputer.pkl'),
+                             history=os.path.join(ctx['work_dir'], 'feature_store.pkl'),
+                             max_workers=ctx['workers'], card_url=ctx['card_url'], rate_limit=ctx['rate_limit'])
+    scores = engine.score_meeting(race_date, 'ST', range(1, ctx['races'] + 1))
+    return len(scores)
+
+
+def _run_stage(name, ctx):
+    # runs in its own process
+    started = time.perf_counter()
+    rows = globals()[f'stage_{name}'](ctx)
+    return rows, time.perf_counter() - started, _peak_rss_mb()
+
+
+def run(selected, ctx, server):
+    """
+    run the stages in order, each in a fresh process, returns one result dict per stage
+    """
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for name in selected:
+        requests_before = server.requests()
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            rows, seconds, peak_rss_mb = executor.submit(_run_stage, name, ctx).result()
+        result = {
+            'stage': name,
+            'seconds': round(seconds, 4),
+            'requests': server.requests() - requests_before,
+            'peak_rss_mb': round(peak_rss_mb, 1),
+            'rows': rows,
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        }
+        results.append(result)
+        print(f"{name:<15} {result['seconds']:9.3f}s {result['requests']:6d} req {result['peak_rss_mb']:8.1f} MB"
+              f" {rows:9d} rows {result['rows_per_sec'] or 0:12.1f} rows/s")
+    return results
+
+
+def compare(results, before):
+    """
+    print the time of every stage against an earlier run
+    """
+    previous = {stage['stage']: stage for stage in before['stages']}
+    print(f"\ncompared with {before.get('git_commit') or 'previous run'} ({before.get('started', '')})")
+    for stage in results:
+        old = previous.get(stage['stage'])
+        if old is None or not stage['seconds']:
+            continue
+        print(f"{stage['stage']:<15} {old['seconds']:9.3f}s -> {stage['seconds']:9.3f}s  x{old['seconds'] / stage['seconds']:5.2f}"
+              f"   {old['peak_rss_mb']:8.1f} -> {stage['peak_rss_mb']:8.1f} MB")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', choices=stages, default=stages,
+                        help='stages to run, the ones they read from are added')
+    parser.add_argument('--seasons', type=int, default=3, help='seasons of synthetic history')
+    parser.add_argument('--races', type=int, default=10, help='races per meeting')
+    parser.add_argument('--repeat', type=int, default=4, help='rounds over the card horses in scrape_horses')
+    parser.add_argument('--iterations', type=int, default=200, help='catboost iterations of the train stage')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent requests / races')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second, default no limit')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stand-in holds every response')
+    parser.add_argument('--work-dir', default=None, help='folder for the stage outputs, default a temporary one')
+    parser.add_argument('--output', default=None, help='json file for the results')
+    parser.add_argument('--compare', default=None, help='json of an earlier run to compare with')
+    args = parser.parse_args()
+
+    selected = set(args.stages)
+    for name in list(selected):
+        while name in requires:
+            name = requires[name]
+            selected.add(name)
+    selected = [name for name in stages if name in selected]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='hkjc_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    if 'clean' in selected:
+        from synthetic import synthetic_race_data
+
+        raw = synthetic_race_data(n_seasons=args.seasons, races_per_meeting=args.races)
+        raw.to_pickle(os.path.join(work_dir, 'race_data.pkl'))
+        print(f'synthetic history: {len(raw)} rows over {args.seasons} season(s) in {work_dir}')
+
+    with StandInServer(races_per_meeting=args.races, latency=args.latency) as server:
+        ctx = {
+            'base_url': server.base_url,
+            'card_url': server.card_url,
+            'results_url': server.results_url,
+            'odds_endpoint': server.odds_endpoint,
+            'work_dir': work_dir,
+            'races': args.races,
+            'repeat': args.repeat,
+            'iterations': args.iterations,
+            'workers': args.workers,
+            'rate_limit': args.rate_limit,
+        }
+        started = datetime.now().isoformat(timespec='seconds')
+        results = run(selected, ctx, server)
+
+    report = {
+        'started': started,
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'args': vars(args),
+        'stages': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f'results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
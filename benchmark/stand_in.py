@@ -0,0 +1,193 @@
+"""
+Local stand-in for the racing and betting sites, serving the recorded pages in benchmark/fixtures.
+
+  RaceCard.aspx       the recorded race card, whatever the date / venue / race number
+  Horse.aspx          horse_<brand no.>.html, another recorded horse for brands without a page
+  LocalResults.aspx   the recorded results page up to 'races_per_meeting', an empty page after
+  /racing/wp/         the recorded betting page with the rendered odds table
+  POST (any path)     the recorded win odds json of the graphql endpoint
+
+'failing' holds parts of request paths that get a 503 instead, to stand in for pages that fail to load
+
+usage: python benchmark/stand_in.py [--port 8000]
+"""
+
+import argparse
+import glob
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+card_path = '/racing/information/English/racing/RaceCard.aspx'
+results_path = '/racing/information/English/Racing/LocalResults.aspx'
+odds_path = '/graphql/base/'
+betting_path = '/en/racing/wp/'
+
+no_results_page = b'<html><body><div class="race_tab">No information.</div></body></html>'
+
+
+def _read(name):
+    with open(os.path.join(fixture_dir, name), 'rb') as f:
+        return f.read()
+
+
+class StandInServer:
+    """
+    threaded http server on 127.0.0.1 serving the fixtures, counts the requests of every kind
+
+    'races_per_meeting': race numbers with a results page, higher ones get the empty page
+    'latency': seconds every response is held back, to stand in for the network
+    """
+
+    def __init__(self, port=0, races_per_meeting=10, latency=0.0):
+        self.races_per_meeting = races_per_meeting
+        self.latency = latency
+        self.card = _read('racecard_20250907_ST_2.html')
+        self.results = _read('results_20250914_ST_1.html')
+        self.odds = _read('odds_20250907_ST_2.json')
+        self.odds_page = _read('odds_20250907_ST_2.html')
+        self.horses = {}
+        for path in sorted(glob.glob(os.path.join(fixture_dir, 'horse_*.html'))):
+            self.horses[os.path.basename(path)[6:-5]] = _read(os.path.basename(path))
+        self.fallback = sorted(self.horses)
+
+        self.failing = set()
+
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def card_url(self):
+        # InferenceEngine 'card_url' template
+        return self.base_url + card_path + '?RaceDate={date}&Racecourse={venue}&RaceNo={race_no}'
+
+    @property
+    def results_url(self):
+        return self.base_url + results_path
+
+    @property
+    def odds_endpoint(self):
+        return self.base_url + odds_path
+
+    def odds_url(self, date='2025-09-07', venue='ST', race_no=2):
+        # betting page url obtain_odds takes
+        return self.base_url + betting_path + f'{date}/{venue}/{race_no}'
+
+    def requests(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+    def _count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def horse_page(self, horse_id):
+        brand = horse_id.split('_')[-1]
+        if brand not in self.horses:
+            brand = self.fallback[zlib.crc32(brand.encode()) % len(self.fallback)]
+        return self.horses[brand]
+
+    def page(self, path):
+        """
+        (kind, body) of a GET request, body None for unknown paths and kind 'failed' for the failing ones
+        """
+        lower = path.lower()
+        if any(part in path for part in self.failing):
+            return 'failed', None
+        if 'racecard.aspx' in lower:
+            return 'card', self.card
+        if 'horse.aspx' in lower:
+            match = re.search(r'HorseId=([A-Za-z0-9_]+)', path)
+            return 'horse', self.horse_page(match.group(1)) if match else None
+        if 'localresults.aspx' in lower:
+            match = re.search(r'RaceNo=(\d+)', path)
+            race_no = int(match.group(1)) if match else 1
+            return 'results', self.results if race_no <= self.races_per_meeting else no_results_page
+        if betting_path in lower:
+            return 'odds_page', self.odds_page
+        return 'unknown', None
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, kind, body, content_type):
+                stand_in._count(kind)
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                if kind == 'failed':
+                    self.send_response(503)
+                    body = b'service unavailable'
+                elif body is None:
+                    self.send_response(404)
+                    body = b'not found'
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                kind, body = stand_in.page(self.path)
+                self._send(kind, body, 'text/html; charset=utf-8')
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self._send('odds', stand_in.odds, 'application/json')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--races-per-meeting', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.races_per_meeting, args.latency)
+    print(f'serving the fixtures on {server.base_url}, race cards at {server.card_url}')
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Synthetic multi-season race history in the layout of the scraped race_data csv, and cleaned with
+clean_race_data into the cleaned-data schema the features and training read.
+
+usage: python benchmark/synthetic.py out.csv [--seasons 3] [--cleaned]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py.cleaning import clean_race_data  # noqa: E402
+
+origins = ['AUS', 'NZ', 'GB', 'IRE', 'FR', 'USA', 'GER', 'JPN']
+colour_sex = ['Bay / Gelding', 'Brown / Gelding', 'Chestnut / Gelding', 'Grey / Gelding', 'Bay / Horse',
+              'Dark Bay / Brown / Gelding', 'Bay / Mare']
+import_types = ['PPG', 'PP', 'ISG', 'VIS']
+goings = ['G', 'GF', 'GY', 'Y', 'S', 'WS', 'GD']
+gears = ['--', 'B', 'TT', 'B/TT', 'H', 'CP/TT', 'V', 'XB']
+
+venues = {
+    # weekday of the meeting, courses and distances of the venue
+    'ST': (6, ['ST / Turf / "A"', 'ST / Turf / "A+3"', 'ST / Turf / "B"', 'ST / Turf / "C+3"', 'ST / AWT'],
+           [1000, 1200, 1400, 1600, 1650, 1800, 2000, 2400]),
+    'HV': (2, ['HV / Turf / "A"', 'HV / Turf / "B"', 'HV / Turf / "C"', 'HV / Turf / "C+3"'],
+           [1000, 1200, 1650, 1800, 2200]),
+}
+
+
+def _names(prefix, n):
+    return np.array([f'{prefix} {i}' for i in range(n)], dtype=object)
+
+
+def meetings(n_seasons=3, first_season=2020, meetings_per_season=88):
+    """
+    (date, venue) of the meetings: Sunday at Sha Tin and Wednesday at Happy Valley from September to mid July
+    """
+    rows = []
+    for season in range(first_season, first_season + n_seasons):
+        days = pd.date_range(f'{season}-09-06', f'{season + 1}-07-16', freq='D')
+        season_rows = []
+        for venue, (weekday, _, _) in venues.items():
+            season_rows += [(day, venue) for day in days[days.weekday == weekday]]
+        rows += sorted(season_rows)[:meetings_per_season]
+    return rows
+
+
+def synthetic_race_data(n_seasons=3, races_per_meeting=10, field=12, n_horses=1500, n_jockeys=45,
+                        n_trainers=25, first_season=2020, meetings_per_season=88, seed=0):
+    """
+    raw race rows as update_data.ipynb scrapes them: one row per runner, text columns like the
+    horse record pages ('dd/mm/yy' dates, 'ST / Turf / "A"', 'AUS / 5', ...) and the profile fields
+    about 'n_seasons' * 'meetings_per_season' * 'races_per_meeting' * 'field' rows
+    """
+    rng = np.random.default_rng(seed)
+    meeting_list = meetings(n_seasons, first_season, meetings_per_season)
+
+    # one row per race
+    race_date = np.repeat([date for date, _ in meeting_list], races_per_meeting)
+    race_venue = np.repeat([venue for _, venue in meeting_list], races_per_meeting)
+    n_races = len(race_date)
+    season = pd.DatetimeIndex(race_date).year - first_season - (pd.DatetimeIndex(race_date).month < 9)
+    race_index = np.zeros(n_races, dtype=np.int64)
+    for s in np.unique(season):
+        race_index[season == s] = np.arange(1, (season == s).sum() + 1)
+
+    rc = np.empty(n_races, dtype=object)
+    dist = np.empty(n_races, dtype=np.int64)
+    for venue, (_, courses, distances) in venues.items():
+        at = race_venue == venue
+        rc[at] = rng.choice(courses, at.sum())
+        dist[at] = rng.choice(distances, at.sum())
+    going = rng.choice(goings, n_races)
+    race_class = rng.choice(['1', '2', '3', '4', '5'], n_races, p=[0.05, 0.15, 0.3, 0.3, 0.2])
+
+    # every horse has its own profile and trainer, an ability that drives its finishing places
+    horse_id = np.array([f'{chr(65 + i % 26)}{i % 1000:03d}' for i in range(n_horses)], dtype=object)
+    horse_age = rng.integers(2, 6, n_horses)
+    horse_origin = rng.choice(origins, n_horses)
+    horse_colour_sex = rng.choice(colour_sex, n_horses)
+    horse_import = rng.choice(import_types, n_horses)
+    horse_sire = rng.choice(_names('Sire', 300), n_horses)
+    horse_dam = _names('Dam', n_horses)
+    horse_dam_sire = rng.choice(_names('Dam Sire', 200), n_horses)
+    horse_trainer = rng.choice(_names('Trainer', n_trainers), n_horses)
+    horse_weight = rng.integers(1000, 1250, n_horses)
+    ability = rng.normal(0, 1, n_horses)
+    jockeys = _names('Jockey', n_jockeys)
+
+    # one row per runner
+    horse = np.concatenate([rng.choice(n_horses, field, replace=False) for _ in range(n_races)])
+    race = np.repeat(np.arange(n_races), field)
+    performance = ability[horse] + rng.normal(0, 1.5, len(horse))
+    order = np.lexsort((-performance, race))
+    place = np.empty(len(horse), dtype=np.int64)
+    place[order] = np.tile(np.arange(1, field + 1), n_races)
+
+    pla = place.astype(str).astype(object)
+    withdrawn = rng.random(len(horse)) < 0.01
+    pla[withdrawn] = rng.choice(['WV', 'WX', 'WV-A'], withdrawn.sum())
+    dead_heat = (rng.random(len(horse)) < 0.005) & ~withdrawn
+    pla[dead_heat] = pla[dead_heat] + ' DH'
+
+    age = horse_age[horse] + season[race]
+    seconds = dist[race] / 16.5 + place * 0.15 + rng.normal(0, 0.5, len(horse))
+    finish_time = [f'{int(s // 60)}.{int(s % 60):02d}.{int(s * 100 % 100):02d}' for s in seconds]
+    dates = pd.DatetimeIndex(race_date[race]).strftime('%d/%m/%y')
+
+    return pd.DataFrame({
+        'RaceIndex': race_index[race].astype(str),
+        'Pla.': pla,
+        'Date': dates,
+        'RC/Track/Course': rc[race],
+        'Dist.': dist[race].astype(str),
+        'G': going[race],
+        'RaceClass': race_class[race],
+        'Dr.': (np.tile(np.arange(1, field + 1), n_races)).astype(str),
+        'Rtg.': np.clip(np.round(60 + 15 * ability[horse]), 10, 130).astype(int).astype(str),
+        'Trainer': horse_trainer[horse],
+        'Jockey': rng.choice(jockeys, len(horse)),
+        'LBW': np.where(place == 1, '-', (place * 0.75).round(2).astype(str)),
+        'Win Odds': np.round(np.exp(rng.normal(2.5, 0.8, len(horse))), 1).astype(str),
+        'Act.Wt.': rng.integers(113, 136, len(horse)).astype(str),
+        'RunningPosition': [f'{a} {b} {c}' for a, b, c in rng.integers(1, field + 1, (len(horse), 3))],
+        'Finish Time': finish_time,
+        'Declar.Horse Wt.': (horse_weight[horse] + rng.integers(-15, 16, len(horse))).astype(str),
+        'Gear': rng.choice(gears, len(horse)),
+        'Horse_id': horse_id[horse],
+        'Origin / Age': [f'{o} / {a}' for o, a in zip(horse_origin[horse], age)],
+        'Colour / Sex': horse_colour_sex[horse],
+        'Import type': horse_import[horse],
+        'Sire': horse_sire[horse],
+        'Dam': horse_dam[horse],
+        'Dam sire': horse_dam_sire[horse],
+    })
+
+
+def synthetic_history(start_date=None, **kwargs):
+    """
+    synthetic race rows cleaned by clean_race_data, the input of add_history_features
+    keyword arguments are passed to synthetic_race_data
+    """
+    return clean_race_data(synthetic_race_data(**kwargs), start_date=start_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output')
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--races-per-meeting', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cleaned', action='store_true', help='write the cleaned rows instead of the raw ones')
+    args = parser.parse_args()
+
+    make = synthetic_history if args.cleaned else synthetic_race_data
+    df = make(n_seasons=args.seasons, races_per_meeting=args.races_per_meeting, seed=args.seed)
+    df.to_csv(args.output, index=False)
+    print(f'{len(df)} rows written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
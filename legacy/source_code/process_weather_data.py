@@ -3,94 +3,175 @@ import xml.etree.ElementTree as ET
 import os
 import re
 from datetime import datetime
-import glob
 
-def extract_temperature_from_xml(xml_file_path, location_name):
+# Map venue codes to location names in XML
+venue_mapping = {
+    'ST': 'Sha Tin',
+    'HV': 'Happy Valley'
+}
+
+# Hours to take the temperature from, in order of preference
+# ST (Sha Tin) -> afternoon time (14:00-15:00)
+# HV (Happy Valley) -> night time (19:00-20:00)
+venue_hours = {
+    'ST': [14, 15],
+    'HV': [19, 20]
+}
+
+# One row of the temperature table in the CDATA of the report
+temperature_pattern = re.compile(
+    r'<tr><td><font size="-1">([^<]+)</font></td><td width="100" align="right"><font size="-1">(\d+) degrees'
+)
+
+# Report files are named yyyymmdd-hhmm-CurrentWeather.xml
+xml_name_pattern = re.compile(r'^(\d{8}-\d{4})-.*\.xml$')
+
+index_columns = ['timestamp', 'location', 'temperature']
+
+
+def extract_temperatures_from_xml(xml_file_path, locations=None):
     """
-    Extract temperature for a specific location from XML file.
+    Extract the temperature of every location (or only 'locations') from one XML file, parsed once.
+    xml_file_path can also be an open file, e.g. a member of the downloaded ZIP.
+    Returns: {location: temperature}
     """
+    temperatures = {}
     try:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-        
-        # Find the description element containing CDATA
+        root = ET.parse(xml_file_path).getroot()
+
         for item in root.findall(".//item"):
             description = item.find("description")
             if description is not None and description.text:
-                cdata_content = description.text
-                
-                # Look for the temperature table and extract the specific location temperature
-                pattern = rf'<tr><td><font size="-1">{location_name}</font></td><td width="100" align="right"><font size="-1">(\d+) degrees'
-                match = re.search(pattern, cdata_content)
-                if match:
-                    return int(match.group(1))
-                    
-        return None
+                for location, temperature in temperature_pattern.findall(description.text):
+                    if locations is None or location in locations:
+                        temperatures.setdefault(location, int(temperature))
+
     except Exception as e:
         print(f"Error processing XML file {xml_file_path}: {e}")
-        return None
+    return temperatures
+
 
-def find_xml_file(date_str, venue, hourly_temp_dir):
+def extract_temperature_from_xml(xml_file_path, location_name):
     """
-    Find appropriate XML file based on date and venue.
-    ST (Sha Tin) -> afternoon time (14:00-15:00)
-    HV (Happy Valley) -> night time (19:00-20:00)
+    Extract temperature for a specific location from XML file.
     """
-    try:
-        # Parse the date
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-        year = date_obj.strftime('%Y')
-        month = date_obj.strftime('%m')
-        day = date_obj.strftime('%d')
-        
-        # Construct the directory path
-        xml_dir = os.path.join(hourly_temp_dir, year, month, day)
-        
-        if not os.path.exists(xml_dir):
-            return None
-            
-        # Define time patterns based on venue
-        if venue == 'ST':  # Sha Tin - afternoon (14:00-15:00)
-            time_patterns = ['14*', '15*']
-        elif venue == 'HV':  # Happy Valley - night (19:00-20:00)
-            time_patterns = ['19*', '20*']
-        else:
-            return None
-        
-        # Look for XML files with appropriate time patterns
-        date_prefix = date_obj.strftime('%Y%m%d')
-        
-        for time_pattern in time_patterns:
-            pattern = f"{date_prefix}-{time_pattern}-*.xml"
-            xml_files = glob.glob(os.path.join(xml_dir, pattern))
-            if xml_files:
-                return xml_files[0]  # Return the first matching file
-                
-        return None
-        
-    except Exception as e:
-        print(f"Error finding XML file for {date_str}, {venue}: {e}")
-        return None
-
-def get_temperature_for_venue(date_str, venue, hourly_temp_dir):
-    """
-    Get temperature for a specific venue and date.
-    """
-    xml_file = find_xml_file(date_str, venue, hourly_temp_dir)
-    if xml_file is None:
-        return None
-        
-    # Map venue codes to location names in XML
-    venue_mapping = {
-        'ST': 'Sha Tin',
-        'HV': 'Happy Valley'
-    }
-    
-    location_name = venue_mapping.get(venue)
-    if location_name is None:
-        return None
-        
-    return extract_temperature_from_xml(xml_file, location_name)
+    return extract_temperatures_from_xml(xml_file_path, [location_name]).get(location_name)
+
+
+def scan_xml_files(hourly_temp_dir):
+    """
+    Yield (timestamp, path) of every report file in the yyyy/mm/dd directory structure.
+    """
+    stack = [hourly_temp_dir]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                    continue
+                match = xml_name_pattern.match(entry.name)
+                if match:
+                    yield pd.Timestamp(datetime.strptime(match.group(1), '%Y%m%d-%H%M')), entry.path
+
+
+def read_weather_index(index_path='weather_index.csv'):
+    """
+    Load the weather index, an empty table when it doesn't exist yet.
+    """
+    if os.path.exists(index_path):
+        return pd.read_csv(index_path, parse_dates=['timestamp'])
+    return pd.DataFrame(columns=index_columns)
+
+
+def index_rows(timestamp, temperatures, locations):
+    """
+    Index rows of one report, with an empty temperature for locations it has no reading for.
+    """
+    return [(timestamp, location, temperatures.get(location)) for location in locations]
+
+
+def save_weather_index(index, rows, index_path='weather_index.csv'):
+    """
+    Add new (timestamp, location, temperature) rows to the index and write it to index_path.
+    """
+    if not rows:
+        return index
+    new = pd.DataFrame(rows, columns=index_columns)
+    index = pd.concat([index, new], ignore_index=True) if len(index) else new
+    index = index.drop_duplicates(['timestamp', 'location'], keep='last')
+    index = index.sort_values(['timestamp', 'location']).reset_index(drop=True)
+    index.to_csv(index_path, index=False)
+    return index
+
+
+def build_weather_index(hourly_temp_dir, index_path='weather_index.csv', locations=None):
+    """
+    Parse every hourly XML file once into a (timestamp, location, temperature) table saved at index_path.
+    An existing index is extended with the files it doesn't have yet, so new downloads are cheap to add.
+    Files without a reading for a location are kept with an empty temperature so they aren't parsed again.
+    """
+    locations = list(venue_mapping.values()) if locations is None else locations
+
+    index = read_weather_index(index_path)
+    indexed = set(index['timestamp'])
+
+    rows = []
+    n_files = 0
+    for timestamp, path in scan_xml_files(hourly_temp_dir):
+        if timestamp in indexed:
+            continue
+        indexed.add(timestamp)
+        n_files += 1
+        rows.extend(index_rows(timestamp, extract_temperatures_from_xml(path, locations), locations))
+
+        if n_files % 1000 == 0:
+            print(f"Indexed {n_files} new files")
+
+    index = save_weather_index(index, rows, index_path)
+
+    print(f"Weather index: {n_files} new files, {len(index)} rows in {index_path}")
+    return index
+
+
+def venue_temperatures(index):
+    """
+    One temperature per (date, venue) from the weather index: the first reading in the venue's
+    preferred hour, the next hour when the first has none.
+    Returns: dataframe with date, venue, temperature
+    """
+    index = index.dropna(subset=['temperature'])
+    timestamps = pd.to_datetime(index['timestamp'])
+
+    tables = []
+    for venue, hours in venue_hours.items():
+        keep = (index['location'] == venue_mapping[venue]).to_numpy() & timestamps.dt.hour.isin(hours).to_numpy()
+        table = pd.DataFrame({
+            'date': timestamps[keep].dt.normalize(),
+            'priority': timestamps[keep].dt.hour.map(hours.index),
+            'timestamp': timestamps[keep],
+            'temperature': index.loc[keep, 'temperature'],
+        })
+        table = table.sort_values(['date', 'priority', 'timestamp']).drop_duplicates('date')
+        table['venue'] = venue
+        tables.append(table[['date', 'venue', 'temperature']])
+
+    return pd.concat(tables, ignore_index=True)
+
+
+def add_temperature(df, index, date_col='date', venue_col='venue'):
+    """
+    Join the temperature onto every runner with one merge on (date, venue).
+    """
+    temperatures = venue_temperatures(index)
+    keys = pd.DataFrame({
+        'date': pd.to_datetime(df[date_col]).dt.normalize().to_numpy(),
+        'venue': df[venue_col].to_numpy(),
+    })
+    merged = keys.merge(temperatures, on=['date', 'venue'], how='left')
+    df = df.copy()
+    df['temperature'] = merged['temperature'].to_numpy()
+    return df
+
 
 def process_combined_performance_data():
     """
@@ -110,23 +191,13 @@ def process_combined_performance_data():
     print(f"After removing columns: {df.shape}")
     print(f"Remaining columns: {df.columns.tolist()}")
     
-    # Add temperature column
-    df['temperature'] = None
-    
-    # Process each row to get temperature
+    # Parse the XML files once (new files only when the index exists) and join on (date, venue)
     hourly_temp_dir = 'hourly_temperature'
-    
+
     print("Processing temperature data...")
-    for index, row in df.iterrows():
-        if index % 100 == 0:
-            print(f"Processing row {index}/{len(df)}")
-            
-        date_str = row['date']
-        venue = row['venue']
-        
-        temperature = get_temperature_for_venue(date_str, venue, hourly_temp_dir)
-        df.at[index, 'temperature'] = temperature
-    
+    index = build_weather_index(hourly_temp_dir)
+    df = add_temperature(df, index)
+
     # Sort by date from earliest to latest
     print("Sorting data by date...")
     df['date'] = pd.to_datetime(df['date'])
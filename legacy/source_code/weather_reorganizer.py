@@ -2,17 +2,33 @@
 """
 Weather XML File Reorganizer
 
-This script reorganizes weather XML files from the current structure 
-into a yyyy/mm/dd directory structure.
+This script reorganizes weather XML files from the current structure
+into a yyyy/mm/dd directory structure, reading either a folder or the
+downloaded ZIP, and adds the Sha Tin / Happy Valley temperatures of every
+file to the weather index used by process_weather_data.py in the same pass.
 
 Expected file format: yyyymmdd-hhmm-CurrentWeather.xml
 Target structure: /yyyy/mm/dd/yyyymmdd-hhmm-CurrentWeather.xml
+
+Usage:
+    python weather_reorganizer.py weather_info --target hourly_temperature
+    python weather_reorganizer.py weather_download.zip --workers 4
+    python weather_reorganizer.py weather_info --dry-run
 """
 
+import argparse
+import io
 import os
 import shutil
 import re
-from pathlib import Path
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from itertools import islice
+
+from process_weather_data import (extract_temperatures_from_xml, index_rows, read_weather_index,
+                                  save_weather_index, venue_mapping)
 
 def extract_date_from_filename(filename):
     """
@@ -22,7 +38,7 @@ def extract_date_from_filename(filename):
     # Pattern to match: yyyymmdd-hhmm-*.xml
     pattern = r'^(\d{4})(\d{2})(\d{2})-\d{4}-.*\.xml$'
     match = re.match(pattern, filename)
-    
+
     if match:
         year, month, day = match.groups()
         return year, month, day
@@ -30,119 +46,205 @@ def extract_date_from_filename(filename):
 
 def find_xml_files(base_path):
     """
-    Find all XML files in the current directory structure
-    Returns: list of (full_path, filename) tuples
+    Stream the XML files below base_path with os.scandir, without listing them all first
+    Yields: (full_path, filename) tuples
     """
-    xml_files = []
-    base_path = Path(base_path)
-    
-    for root, dirs, files in os.walk(base_path):
-        for file in files:
-            if file.endswith('.xml'):
-                full_path = Path(root) / file
-                xml_files.append((full_path, file))
-    
-    return xml_files
-
-def reorganize_files(source_dir, target_dir, dry_run=False):
+    stack = [str(base_path)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.xml'):
+                    yield entry.path, entry.name
+
+def find_zip_members(zip_path):
     """
-    Reorganize XML files from source_dir to target_dir in yyyy/mm/dd structure
-    
-    Args:
-        source_dir: Path to the weather_info directory
-        target_dir: Path to the new organized directory
-        dry_run: If True, only print what would be done without actually moving files
+    The XML files inside the downloaded ZIP, read without extracting it
+    Yields: (member_name, filename) tuples
     """
-    source_path = Path(source_dir)
-    target_path = Path(target_dir)
-    
-    # Find all XML files
-    xml_files = find_xml_files(source_path)
-    
-    if not xml_files:
-        print("No XML files found in the source directory.")
-        return
-    
-    print(f"Found {len(xml_files)} XML files to reorganize.")
-    
-    # Statistics
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            filename = os.path.basename(info.filename)
+            if not info.is_dir() and filename.endswith('.xml'):
+                yield info.filename, filename
+
+def batches(items, size):
+    """
+    Split a stream into lists of at most size items
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+def process_batch(batch, target_dir, zip_path=None, dry_run=False, copy=False, locations=None):
+    """
+    Worker: file (or extract) one batch into the yyyy/mm/dd structure and read its temperatures
+    Returns: (moved_count, failed_count, index rows)
+    """
+    locations = list(venue_mapping.values()) if locations is None else locations
+    archive = zipfile.ZipFile(zip_path) if zip_path else None
+
     moved_count = 0
     failed_count = 0
-    
-    for file_path, filename in xml_files:
-        # Extract date from filename
-        date_parts = extract_date_from_filename(filename)
-        
-        if not date_parts:
-            print(f"Warning: Could not parse date from filename: {filename}")
-            failed_count += 1
-            continue
-        
-        year, month, day = date_parts
-        
-        # Create target directory structure
-        target_file_dir = target_path / year / month / day
-        target_file_path = target_file_dir / filename
-        
-        if dry_run:
-            print(f"Would move: {file_path} -> {target_file_path}")
-        else:
-            # Create directory if it doesn't exist
-            target_file_dir.mkdir(parents=True, exist_ok=True)
-            
+    rows = []
+    created = set()
+    try:
+        for source, filename in batch:
+            # Extract date from filename
+            date_parts = extract_date_from_filename(filename)
+            if not date_parts:
+                print(f"Warning: Could not parse date from filename: {filename}")
+                failed_count += 1
+                continue
+
+            year, month, day = date_parts
+            target_file_dir = os.path.join(target_dir, year, month, day)
+            target_file_path = os.path.join(target_file_dir, filename)
+            timestamp = datetime.strptime(filename[:13], '%Y%m%d-%H%M')
+
             try:
-                # Move the file
-                shutil.move(str(file_path), str(target_file_path))
+                if archive is not None:
+                    data = archive.read(source)
+                    temperatures = extract_temperatures_from_xml(io.BytesIO(data), locations)
+                else:
+                    temperatures = extract_temperatures_from_xml(source, locations)
+                rows.extend(index_rows(timestamp, temperatures, locations))
+
+                if dry_run:
+                    moved_count += 1
+                    continue
+
+                if target_file_dir not in created:
+                    os.makedirs(target_file_dir, exist_ok=True)
+                    created.add(target_file_dir)
+
+                if archive is not None:
+                    with open(target_file_path, 'wb') as f:
+                        f.write(data)
+                elif copy:
+                    shutil.copy2(source, target_file_path)
+                else:
+                    shutil.move(source, target_file_path)
                 moved_count += 1
-                print(f"Moved: {filename} -> {year}/{month}/{day}/")
             except Exception as e:
                 print(f"Error moving {filename}: {e}")
                 failed_count += 1
-    
+    finally:
+        if archive is not None:
+            archive.close()
+
+    return moved_count, failed_count, rows
+
+def reorganize_files(source, target_dir, index_path='weather_index.csv', workers=None, batch_size=500,
+                     dry_run=False, copy=False, update_index=True, progress_every=5.0):
+    """
+    Reorganize XML files from source (a folder or a ZIP) to target_dir in yyyy/mm/dd structure
+    and add their temperatures to the weather index in the same pass
+
+    Args:
+        source: Path to the weather_info directory or the downloaded ZIP
+        target_dir: Path to the new organized directory
+        index_path: Weather index the temperatures are added to
+        workers: Number of worker processes, defaults to the number of cores
+        batch_size: Files handed to a worker at a time
+        dry_run: If True, only count what would be done without actually moving files
+        copy: Copy instead of move when the source is a folder
+        update_index: If False, only reorganize
+        progress_every: Seconds between progress lines
+    """
+    source = str(source)
+    is_zip = zipfile.is_zipfile(source) if os.path.isfile(source) else False
+    files = find_zip_members(source) if is_zip else find_xml_files(source)
+    workers = workers or os.cpu_count() or 1
+
+    print(f"Source: {source} ({'zip' if is_zip else 'directory'})")
+    print(f"Target directory: {target_dir}")
+    print(f"Workers: {workers}, batch size: {batch_size}{', DRY RUN' if dry_run else ''}")
+
+    # Statistics
+    moved_count = 0
+    failed_count = 0
+    rows = []
+    started = time.perf_counter()
+    last_report = started
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        done = moved_count + failed_count
+        rate = done / elapsed if elapsed > 0 else 0.0
+        label = 'Done' if final else 'Progress'
+        print(f"{label}: {done} files ({failed_count} failed) in {elapsed:.1f}s, {rate:.0f} files/s")
+
+    # Bounded number of batches in flight, so the listing is streamed and never held in memory
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for batch in batches(files, batch_size):
+            pending.add(executor.submit(process_batch, batch, target_dir, source if is_zip else None,
+                                        dry_run, copy))
+            if len(pending) < 2 * workers:
+                continue
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                moved, failed, batch_rows = future.result()
+                moved_count += moved
+                failed_count += failed
+                rows.extend(batch_rows)
+
+            if time.perf_counter() - last_report >= progress_every:
+                report()
+                last_report = time.perf_counter()
+
+        for future in pending:
+            moved, failed, batch_rows = future.result()
+            moved_count += moved
+            failed_count += failed
+            rows.extend(batch_rows)
+
+    report(final=True)
+
+    if moved_count + failed_count == 0:
+        print("No XML files found in the source.")
+        return
+
     print(f"\nSummary:")
-    print(f"Successfully moved: {moved_count} files")
-    print(f"Failed to move: {failed_count} files")
-    print(f"Total processed: {len(xml_files)} files")
+    print(f"Successfully {'checked' if dry_run else 'copied' if copy or is_zip else 'moved'}: {moved_count} files")
+    print(f"Failed: {failed_count} files")
+
+    if update_index and not dry_run:
+        index = save_weather_index(read_weather_index(index_path), rows, index_path)
+        print(f"Weather index: {len(rows) // len(venue_mapping)} files added, {len(index)} rows in {index_path}")
 
-def main():
+def main(argv=None):
     """Main function"""
-    print("Weather XML File Reorganizer")
-    print("=" * 40)
-    
-    # Current directory setup
-    current_dir = Path.cwd()
-    weather_info_dir = current_dir / "weather_info"
-    organized_dir = current_dir / "weather_organized"
-    
-    if not weather_info_dir.exists():
-        print(f"Error: weather_info directory not found at {weather_info_dir}")
-        return
-    
-    print(f"Source directory: {weather_info_dir}")
-    print(f"Target directory: {organized_dir}")
-    print()
-    
-    # Ask user for confirmation
-    while True:
-        choice = input("Run in dry-run mode first? (y/n): ").lower().strip()
-        if choice in ['y', 'yes']:
-            print("\n--- DRY RUN MODE ---")
-            reorganize_files(weather_info_dir, organized_dir, dry_run=True)
-            
-            print("\n" + "=" * 40)
-            proceed = input("Proceed with actual file movement? (y/n): ").lower().strip()
-            if proceed in ['y', 'yes']:
-                print("\n--- ACTUAL FILE MOVEMENT ---")
-                reorganize_files(weather_info_dir, organized_dir, dry_run=False)
-            else:
-                print("Operation cancelled.")
-            break
-        elif choice in ['n', 'no']:
-            print("\n--- ACTUAL FILE MOVEMENT ---")
-            reorganize_files(weather_info_dir, organized_dir, dry_run=False)
-            break
-        else:
-            print("Please enter 'y' or 'n'")
+    parser = argparse.ArgumentParser(description="Reorganize HKO weather XML files into yyyy/mm/dd "
+                                                 "and index the Sha Tin / Happy Valley temperatures")
+    parser.add_argument('source', nargs='?', default='weather_info',
+                        help="folder of XML files or the downloaded ZIP (default: weather_info)")
+    parser.add_argument('--target', default='hourly_temperature',
+                        help="organized output directory (default: hourly_temperature)")
+    parser.add_argument('--index', default='weather_index.csv',
+                        help="weather index to add the temperatures to (default: weather_index.csv)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: number of cores)")
+    parser.add_argument('--batch-size', type=int, default=500, help="files per worker task (default: 500)")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be done")
+    parser.add_argument('--copy', action='store_true', help="copy instead of move files from a folder")
+    parser.add_argument('--no-index', action='store_true', help="only reorganize, don't update the index")
+    parser.add_argument('--progress-every', type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        print(f"Error: source not found at {args.source}")
+        return 1
+
+    reorganize_files(args.source, args.target, index_path=args.index, workers=args.workers,
+                     batch_size=args.batch_size, dry_run=args.dry_run, copy=args.copy,
+                     update_index=not args.no_index, progress_every=args.progress_every)
+    return 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,300 @@
+import csv
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from . import tracing
+from .cleaning import convert_dates
+from .fixtures import meetings_between
+from .http_client import HostRateLimiter, fetch, make_session
+from .updater import (no_race_page, parse_horse_record, parse_result_links, record_page_url, result_page_url,
+                      results_url)
+
+manifest_columns = ['date', 'venue', 'race_no', 'status', 'rows']
+
+
+def race_file_name(date, venue, race_no):
+    return f'{pd.Timestamp(date):%Y-%m-%d}_{venue}_{int(race_no):02d}.csv'
+
+
+class Manifest:
+    """
+    append-only checkpoint of the races a backfill has finished, one line per (date, venue, race_no)
+    status 'done' when the race file is written, 'no_race' for the first race number a meeting doesn't have
+    a line is only added once its race file is on disk, so a crash never leaves a race marked but missing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            with open(path, newline='') as f:
+                for row in csv.DictReader(f):
+                    # a line cut short by a crash has no status, that race is simply redone
+                    if row.get('status') in ('done', 'no_race'):
+                        key = (pd.Timestamp(row['date']), row['venue'], int(row['race_no']))
+                        self.entries[key] = row['status']
+            # start the next line on its own after a partly written one
+            with open(path, 'ab+') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+        else:
+            with open(path, 'w', newline='') as f:
+                csv.writer(f).writerow(manifest_columns)
+
+    def status(self, date, venue, race_no):
+        return self.entries.get((pd.Timestamp(date), venue, int(race_no)))
+
+    def add(self, date, venue, race_no, status, rows=0):
+        with self.lock:
+            with open(self.path, 'a', newline='') as f:
+                csv.writer(f).writerow([f'{pd.Timestamp(date):%Y-%m-%d}', venue, race_no, status, rows])
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[(pd.Timestamp(date), venue, int(race_no))] = status
+
+    def next_race(self, date, venue, max_race_no):
+        """
+        first race number of the meeting still to do, None when the meeting is complete
+        """
+        for race_no in range(1, max_race_no + 1):
+            status = self.status(date, venue, race_no)
+            if status == 'no_race':
+                return None
+            if status is None:
+                return race_no
+        return None
+
+
+class Backfill:
+    """
+    resumable bulk scrape of past meetings into one csv per race
+
+    'out_dir': folder with 'manifest.csv' and the race files in 'races/', reused to resume
+    'max_workers': meetings scraped at the same time
+    'rate_limit': requests per second to the racing site across all workers
+    'max_records': parsed record pages kept in memory, least recently used dropped first
+
+    horse record pages list every run of a horse, so each horse is fetched once per backfill run
+    and its parsed runs are reused by all its later races, as long as it stays among the 'max_records'
+    horses used last
+    """
+
+    def __init__(self, out_dir='../data/backfill', max_race_no=14, max_workers=4, rate_limit=2, session=None,
+                 results_base_url=results_url, max_records=5000):
+        self.out_dir = out_dir
+        self.race_dir = os.path.join(out_dir, 'races')
+        os.makedirs(self.race_dir, exist_ok=True)
+
+        self.manifest = Manifest(os.path.join(out_dir, 'manifest.csv'))
+        self.max_race_no = max_race_no
+        self.max_workers = max_workers
+        self.rate_limiter = HostRateLimiter(rate_limit, burst=max_workers) if rate_limit else None
+        self.session = session
+        self.results_base_url = results_base_url
+
+        self.records = OrderedDict()
+        self.max_records = max_records
+        # horse id -> [event, runs] of a record page being fetched, the event is set once the worker
+        # that claimed it is done, runs stays None when the fetch failed
+        self.fetching = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = []
+
+    def _get(self, url):
+        with self.lock:
+            self.requests += 1
+        try:
+            response = fetch(url, session=self.session, rate_limiter=self.rate_limiter)
+        except Exception as e:
+            self.errors.append((url, str(e)))
+            print(f'Request exception for {url}: {str(e)}')
+            return None
+        if response.status_code != 200:
+            self.errors.append((url, f'status {response.status_code}'))
+            print(f'{url} returned {response.status_code}')
+            return None
+        return response
+
+    def _horse_runs(self, horse_id, link):
+        # the first worker to ask for a horse claims it, the others wait for its fetch instead of repeating it
+        with self.lock:
+            runs = self.records.get(horse_id)
+            claimed = None
+            if runs is not None:
+                self.records.move_to_end(horse_id)
+            else:
+                claimed = self.fetching.get(horse_id)
+                if claimed is None:
+                    claim = self.fetching[horse_id] = [threading.Event(), None]
+        if runs is not None:
+            tracing.count('cache.hits')
+            return runs
+        if claimed is not None:
+            claimed[0].wait()
+            tracing.count('cache.hits')
+            # handed over directly, the records may have dropped it already
+            # None when the other worker's fetch failed, the race is retried on the next run
+            return claimed[1]
+
+        tracing.count('cache.misses')
+        try:
+            response = self._get(record_page_url(link))
+            if response is None:
+                return None
+            runs = parse_horse_record(response.content, horse_id)
+            if len(runs):
+                runs = runs.assign(_date=convert_dates(runs['Date']))
+            claim[1] = runs
+            with self.lock:
+                self.records[horse_id] = runs
+                while len(self.records) > self.max_records:
+                    self.records.popitem(last=False)
+            return runs
+        finally:
+            with self.lock:
+                self.fetching.pop(horse_id)[0].set()
+
+    @tracing.traced('backfill.scrape_race')
+    def scrape_race(self, date, venue, race_no):
+        """
+        rows of one race from its result page and the record pages of its runners,
+        'no_race' when the result page says the meeting has no such race, None when a page could not
+        be fetched or has no results without saying so
+        """
+        url = result_page_url(date, venue, race_no, self.results_base_url)
+        response = self._get(url)
+        if response is None:
+            return None
+
+        links = parse_result_links(response.text, base_url=url)
+        if not links:
+            if no_race_page(response.text):
+                return 'no_race'
+            # 'no_race' is final, a page that doesn't say so is retried on the next run instead
+            self.errors.append((url, 'no results'))
+            print(f'{url} has no results, retried on the next run')
+            return None
+
+        frames = []
+        for link in links:
+            match = re.search(r'([A-Z]\d{3})$', link)
+            if not match:
+                continue
+            horse_id = match.group(1)
+            runs = self._horse_runs(horse_id, link)
+            if runs is None:
+                return None
+            if len(runs):
+                frames.append(runs[runs['_date'] == pd.Timestamp(date)])
+
+        frames = [df for df in frames if len(df)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).drop(columns='_date')
+
+    def _write_race(self, df, date, venue, race_no):
+        path = os.path.join(self.race_dir, race_file_name(date, venue, race_no))
+        tmp_path = path + '.tmp'
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def run_meeting(self, date, venue):
+        """
+        scrape the races of one meeting still missing from the manifest, in race order
+        returns the number of races written
+        """
+        start = self.manifest.next_race(date, venue, self.max_race_no)
+        if start is None:
+            return 0
+
+        written = 0
+        for race_no in range(start, self.max_race_no + 1):
+            df = self.scrape_race(date, venue, race_no)
+            if df is None:
+                # left out of the manifest, the next run starts again from this race
+                print(f'{date:%d/%m/%Y} @ {venue} race {race_no} failed, stopping the meeting there')
+                break
+            if isinstance(df, str):
+                self.manifest.add(date, venue, race_no, 'no_race')
+                break
+
+            self._write_race(df, date, venue, race_no)
+            self.manifest.add(date, venue, race_no, 'done', len(df))
+            written += 1
+        return written
+
+    def run(self, meetings):
+        """
+        scrape all 'meetings' ((date, venue) pairs, e.g. from meetings_between), skipping finished races
+        returns a summary with the races written, the requests made and the failed requests
+        """
+        meetings = [(pd.Timestamp(date), venue) for date, venue in meetings]
+        todo = [(date, venue) for date, venue in meetings
+                if self.manifest.next_race(date, venue, self.max_race_no) is not None]
+        print(f'{len(meetings) - len(todo)} of {len(meetings)} meeting(s) already done, {len(todo)} to go')
+
+        own_session = self.session is None
+        if own_session:
+            self.session = make_session(pool_size=self.max_workers)
+
+        races = 0
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+                futures = [executor.submit(self.run_meeting, date, venue) for date, venue in todo]
+                for i, ((date, venue), future) in enumerate(zip(todo, futures), 1):
+                    written = future.result()
+                    races += written
+                    print(f'[{i}/{len(todo)}] {date:%d/%m/%Y} @ {venue}: {written} race(s)')
+        finally:
+            if own_session:
+                self.session.close()
+                self.session = None
+
+        return {'meetings': len(todo), 'races': races, 'requests': self.requests, 'errors': len(self.errors)}
+
+
+def run_backfill(fixtures, start=None, end=None, out_dir='../data/backfill', max_race_no=14, max_workers=4,
+                 rate_limit=2, session=None, results_base_url=results_url):
+    """
+    backfill every fixture meeting after 'start' and up to 'end', safe to interrupt and rerun
+    'fixtures': fixture dataframe or csv path, only dates with a meeting are requested
+    'rate_limit': requests per second to the racing site across all workers
+    """
+    meetings = meetings_between(fixtures, start=start, end=end)
+    backfill = Backfill(out_dir, max_race_no=max_race_no, max_workers=max_workers, rate_limit=rate_limit,
+                        session=session, results_base_url=results_base_url)
+    return backfill.run(meetings)
+
+
+def load_backfill(out_dir='../data/backfill'):
+    """
+    all race files of a backfill as one dataframe with the race_data csv columns,
+    e.g. for HistoryStore.append_meeting
+    the column types are inferred over all races together, the way read_csv reads one race_data csv
+    (HistoryStore.import_csv), so a race whose column happens to look numeric does not decide its type
+    """
+    race_dir = os.path.join(out_dir, 'races')
+    paths = sorted(os.path.join(race_dir, name) for name in os.listdir(race_dir) if name.endswith('.csv'))
+    frames = [pd.read_csv(path, dtype=str) for path in paths if os.path.getsize(path)]
+    frames = [df for df in frames if len(df)]
+    if not frames:
+        return pd.DataFrame()
+
+    buffer = io.StringIO()
+    pd.concat(frames, ignore_index=True).to_csv(buffer, index=False)
+    buffer.seek(0)
+    df = pd.read_csv(buffer)
+    return df.drop_duplicates(['Horse_id', 'RaceIndex', 'Date']).reset_index(drop=True)
@@ -0,0 +1,287 @@
+import numpy as np
+import pandas as pd
+
+from . import tracing
+from .cleaning import combine_index_date, convert_dates, excluded_places, text_series
+from .history_store import season_of
+
+# settings of a strategy, the ones strategy_grid isn't given stay at these
+strategy_defaults = {
+    'top_n': 1,              # bet on the n best scored runners of a race
+    'min_edge': -np.inf,     # ... with an expected return (model probability * odds - 1) of at least this
+    'min_odds': 1.0,
+    'max_odds': np.inf,
+    'min_gap': 0.0,          # score of the best runner over the second one, races below it are passed
+    'temperature': 1.0,      # softmax temperature turning the scores of a race into win probabilities
+    'staking': 'flat',       # 'flat', 'fixed' or 'kelly', see Backtest
+    'fraction': 0.01,        # stake per bet: of the starting bank for 'flat', of the current bank for 'fixed'
+    'kelly': 0.25,           # multiplier of the kelly stake
+    'max_exposure': 0.25,    # most of the current bank staked on one race by 'fixed' and 'kelly'
+}
+
+stakings = ['flat', 'fixed', 'kelly']
+
+
+def strategy_grid(**settings):
+    """
+    every combination of the given settings, the others at strategy_defaults, one row per strategy
+    e.g. strategy_grid(top_n=[1, 2, 3], min_edge=np.linspace(0, 0.5, 11), staking=['flat', 'kelly'])
+    """
+    unknown = [name for name in settings if name not in strategy_defaults]
+    if unknown:
+        raise ValueError(f'unknown strategy settings {unknown}, use {list(strategy_defaults)}')
+
+    values = [list(np.atleast_1d(value)) for value in settings.values()]
+    grid = pd.MultiIndex.from_product(values, names=list(settings)).to_frame(index=False) if settings \
+        else pd.DataFrame(index=[0])
+    for name, default in strategy_defaults.items():
+        if name not in grid:
+            grid[name] = default
+    return grid[list(strategy_defaults)]
+
+
+def place_number(places):
+    """
+    finishing position from 'Pla.' text, dead heats ('1 DH') keep their position, non-finishers are NaN
+    """
+    number = text_series(pd.Series(places)).str.extract(r'^\s*(\d+)')[0]
+    return pd.to_numeric(number, errors='coerce').to_numpy(dtype=float)
+
+
+def race_outcomes(raw):
+    """
+    finishing position and final win odds of every runner of the raw race data (e.g. HistoryStore.read()),
+    keyed by race_index and Horse_id like the cleaned data, to merge with the model scores
+    """
+    df = raw.loc[~raw['Pla.'].isin(excluded_places), ['RaceIndex', 'Date', 'Horse_id', 'Pla.', 'Win Odds']].copy()
+    df['Date'] = convert_dates(df['Date'])
+    df = combine_index_date(df, 'RaceIndex', 'Date', 'race_index')
+    df['race_index'] = pd.to_numeric(df['race_index'], errors='coerce')
+    df['position'] = place_number(df['Pla.'])
+    df['win_odds'] = pd.to_numeric(df['Win Odds'], errors='coerce')
+    return df[['Date', 'race_index', 'Horse_id', 'position', 'win_odds']].reset_index(drop=True)
+
+
+class Backtest:
+    """
+    bets of many strategies over the same races, evaluated together instead of race by race
+
+    runners are laid out once, races in date order and the best score first within a race, so every
+    per-race number is a reduceat over the race offsets; strategies are evaluated in chunks as
+    (strategies x runners) arrays, sized to stay under 'max_memory_mb'
+
+    'scores': model score per runner (CatBoostRanker.predict)
+    'positions': finishing position per runner, numbers or 'Pla.' text, dead heats split the win
+    'odds': final win odds per runner, runners without odds are never bet on
+    'groups': race of every runner (e.g. race_index)
+    'dates': race date per runner, orders the races for the bank and gives the seasons; None keeps
+             the races in 'groups' order
+
+    staking:
+      'flat'  'fraction' of the starting bank on every bet, the bank is not compounded
+      'fixed' 'fraction' of the current bank on every bet
+      'kelly' 'kelly' times the kelly stake of the model probability and the odds, of the current bank
+    """
+
+    def __init__(self, scores, positions, odds, groups, dates=None, max_memory_mb=256):
+        scores = np.asarray(scores, dtype=float)
+        if not len(scores):
+            raise ValueError('no runners to backtest')
+        positions = np.asarray(positions, dtype=float) if np.asarray(positions).dtype.kind in 'iuf' \
+            else place_number(positions)
+        odds = np.asarray(odds, dtype=float)
+
+        codes, races = pd.factorize(np.asarray(groups), sort=dates is None)
+        if dates is not None:
+            # races numbered in date order, then by their group value
+            race_date = np.empty(len(races), dtype='datetime64[ns]')
+            race_date[codes] = pd.to_datetime(np.asarray(dates)).to_numpy(dtype='datetime64[ns]')
+            race_order = np.lexsort((np.asarray(races), race_date))
+            renumber = np.empty(len(races), dtype=np.int64)
+            renumber[race_order] = np.arange(len(races))
+            codes = renumber[codes]
+            races = np.asarray(races)[race_order]
+            race_date = race_date[race_order]
+
+        order = np.lexsort((-scores, codes))
+        codes = codes[order]
+        self.order = order
+        self.codes = codes
+        self.races = np.asarray(races)
+        self.starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        sizes = np.diff(np.r_[self.starts, len(codes)])
+        self.rank = np.arange(len(codes)) - np.repeat(self.starts, sizes)
+
+        self.score = scores[order]
+        self.odds = odds[order]
+        self.won = positions[order] == 1
+        # return of a unit bet, a dead heat for first shares the win
+        winners = np.add.reduceat(self.won.astype(float), self.starts)
+        self.returns = np.where(self.won, self.odds / np.maximum(winners[codes], 1), 0.0) - 1.0
+        self.bettable = np.isfinite(self.odds) & (self.odds > 1)
+
+        # score of the best runner over the second one, races of one runner always pass
+        second = np.where(sizes > 1, self.score[np.minimum(self.starts + 1, len(codes) - 1)], -np.inf)
+        self.gap = self.score[self.starts] - second
+        self.race_max = self.score[self.starts]
+
+        self.seasons = None
+        if dates is not None:
+            dates = pd.DatetimeIndex(race_date)
+            start_year, season = np.unique(dates.year - (dates.month < 9), return_inverse=True)
+            self.seasons = np.array([season_of(pd.Timestamp(year, 9, 1)) for year in start_year])[season]
+
+        self.max_memory_mb = max_memory_mb
+
+    @property
+    def n_races(self):
+        return len(self.starts)
+
+    def probabilities(self, temperature=1.0):
+        """
+        softmax of the scores within every race, the model's win probability of each runner (sorted layout)
+        """
+        z = np.exp((self.score - self.race_max[self.codes]) / temperature)
+        return z / np.add.reduceat(z, self.starts)[self.codes]
+
+    def _bets(self, col, rows, p):
+        # expected return and the bets placed on 'rows' (runner positions) for the settings in 'col'
+        odds = self.odds[rows]
+        edge = p * odds - 1
+        bet = (
+            (self.rank[rows] < col['top_n']) & self.bettable[rows]
+            & (edge >= col['min_edge']) & (odds >= col['min_odds']) & (odds <= col['max_odds'])
+            & (self.gap[self.codes[rows]] >= col['min_gap'])
+        )
+        return edge, bet
+
+    def _chunk_size(self, n_rows):
+        # about ten (strategies x runners) float arrays alive at a time
+        per_strategy = max(1, n_rows) * 8 * 10
+        return max(1, int(self.max_memory_mb * 1024 ** 2 // per_strategy))
+
+    def _evaluate(self, strategies, rows, by_season):
+        col = {name: strategies[name].to_numpy(dtype=float)[:, None] for name in strategy_defaults if name != 'staking'}
+        staking = strategies['staking'].to_numpy()[:, None]
+        odds, returns, won = self.odds[rows], self.returns[rows], self.won[rows]
+
+        # races with a runner that can be bet on, the others leave every bank as it is
+        codes = self.codes[rows]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        race_codes = codes[starts]
+
+        # probabilities once per temperature, shared by the strategies using it
+        temperatures, which = np.unique(col['temperature'][:, 0], return_inverse=True)
+        p = np.stack([self.probabilities(t)[rows] for t in temperatures])[which]
+        edge, bet = self._bets(col, rows, p)
+        del p
+
+        kelly = np.clip(edge / (odds - 1), 0, None) * col['kelly']
+        stake = np.where(staking == 'kelly', kelly, col['fraction']) * bet
+        del edge, kelly
+
+        # compounding stakes scaled down on races where they add up to more than max_exposure
+        compounding = staking != 'flat'
+        exposure = np.add.reduceat(stake, starts, axis=1)
+        scale = np.where(compounding & (exposure > col['max_exposure']),
+                         col['max_exposure'] / np.where(exposure > 0, exposure, 1), 1.0)
+        stake *= np.repeat(scale, np.diff(np.r_[starts, len(rows)]), axis=1)
+
+        race_return = np.add.reduceat(stake * returns, starts, axis=1)
+        race_staked = np.add.reduceat(stake, starts, axis=1)
+        race_bets = np.add.reduceat(bet, starts, axis=1)
+        race_hits = np.add.reduceat(bet & won, starts, axis=1)
+        del stake, bet
+
+        # bank after every race: added up for flat stakes, multiplied for fractions of the current bank
+        bank = np.where(compounding, np.cumprod(np.maximum(1 + race_return, 0), axis=1),
+                        1 + np.cumsum(race_return, axis=1))
+        peak = np.maximum(np.maximum.accumulate(bank, axis=1), 1)
+        drawdown = ((peak - bank) / peak).max(axis=1)
+
+        # stakes and profits in starting banks, compounding ones were fractions of the bank before the race
+        bank_before = np.c_[np.ones(len(bank)), bank[:, :-1]]
+        in_banks = np.where(compounding, bank_before, 1.0)
+        race_staked = race_staked * in_banks
+        race_profit = race_return * in_banks
+
+        if by_season:
+            race_seasons = self.seasons[race_codes]
+            season_starts = np.flatnonzero(np.r_[True, race_seasons[1:] != race_seasons[:-1]])
+            growth = np.log(np.maximum(1 + race_profit / np.maximum(bank_before, 1e-12), 1e-12))
+            sums = {
+                'bets': np.add.reduceat(race_bets, season_starts, axis=1),
+                'hits': np.add.reduceat(race_hits, season_starts, axis=1),
+                'staked': np.add.reduceat(race_staked, season_starts, axis=1),
+                'profit': np.add.reduceat(race_profit, season_starts, axis=1),
+                'log_growth': np.add.reduceat(growth, season_starts, axis=1),
+            }
+            seasons = race_seasons[season_starts]
+            frame = pd.DataFrame({name: values.ravel() for name, values in sums.items()})
+            frame.insert(0, 'season', np.tile(seasons, len(bank)))
+            frame.insert(0, 'strategy', np.repeat(strategies.index.to_numpy(), len(seasons)))
+            return frame
+
+        return pd.DataFrame({
+            'strategy': strategies.index.to_numpy(),
+            'bets': race_bets.sum(axis=1),
+            'races_bet': (race_bets > 0).sum(axis=1),
+            'hits': race_hits.sum(axis=1),
+            'staked': race_staked.sum(axis=1),
+            'profit': race_profit.sum(axis=1),
+            'final_bank': bank[:, -1],
+            'max_drawdown': drawdown,
+        })
+
+    @tracing.traced('backtest.run')
+    def run(self, strategies=None, by_season=False):
+        """
+        results of every strategy (a strategy_grid dataframe, default the strategy_defaults)
+        'by_season': one row per strategy and season instead of one per strategy
+
+        per strategy: bets, races_bet, hits (winning bets), staked, profit, hit_rate and roi (profit / staked);
+        staked and profit are in starting banks, final_bank and max_drawdown follow the bank race by race,
+        per season log_growth is the log of the season's growth of the bank
+        """
+        strategies = strategy_grid() if strategies is None else strategies.reset_index(drop=True)
+        bad = sorted(set(strategies['staking']) - set(stakings))
+        if bad:
+            raise ValueError(f'unknown staking {bad}, use {stakings}')
+        if by_season and self.seasons is None:
+            raise ValueError('by_season needs the race dates')
+
+        # only runners some strategy can bet on take part, at most the top_n best of every race
+        rows = np.flatnonzero((self.rank < strategies['top_n'].max()) & self.bettable)
+        if not len(rows):
+            raise ValueError('none of the runners has odds to bet on')
+
+        size = self._chunk_size(len(rows))
+        frames = []
+        for start in range(0, len(strategies), size):
+            with tracing.span('backtest.chunk', strategies=min(size, len(strategies) - start)):
+                frames.append(self._evaluate(strategies.iloc[start:start + size], rows, by_season))
+        results = pd.concat(frames, ignore_index=True)
+
+        results['hit_rate'] = results['hits'] / results['bets'].where(results['bets'] > 0)
+        results['roi'] = results['profit'] / results['staked'].where(results['staked'] > 0)
+        return strategies.join(results.set_index('strategy'), how='right').reset_index(drop=True)
+
+    def race_bets(self, **strategy):
+        """
+        the bets one strategy places, runner by runner, e.g. race_bets(top_n=2, min_edge=0.1),
+        settings not given are at strategy_defaults
+        """
+        col = dict(strategy_defaults, **strategy)
+        rows = np.arange(len(self.score))
+        p = self.probabilities(col['temperature'])
+        edge, bet = self._bets(col, rows, p)
+        frame = pd.DataFrame({
+            'race': self.races[self.codes],
+            'rank': self.rank,
+            'score': self.score,
+            'probability': p,
+            'odds': self.odds,
+            'edge': edge,
+            'won': self.won,
+        })
+        return frame[bet].reset_index(drop=True)
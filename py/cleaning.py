@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from . import tracing
+
+# places of horses that did not run (withdrawn / scratched)
+excluded_places = ['WV', 'WV-A', 'WX', 'WX-A', 'WXNR']
+
+cleaned_columns = [
+    'Date', 'race_index', 'RaceClass', 'rc', 'track', 'course', 'Dist.', 'track_condition', 'Horse_id',
+    'Declar.Horse Wt.', 'Act.Wt.', 'gate_position', 'Rtg.', 'age', 'colour', 'sex', 'origin', 'Import type',
+    'Trainer', 'Jockey', 'Sire', 'Dam', 'Dam sire', 'Finish Time', 'Gear', 'target'
+]
+
+
+def text_series(series):
+    """
+    str() of every value, missing values become 'nan' / 'None' like the old per-row helpers saw them
+    """
+    return series.map(str)
+
+
+def _parts(series, n):
+    # first 'n' '/'-separated parts, stripped, missing where a value has fewer parts
+    parts = text_series(series).str.split('/', expand=True).reindex(columns=range(n))
+    return parts.apply(lambda col: col.astype(object).str.strip())
+
+
+def _none(col):
+    # None for the missing parts, the way the old per-row helpers returned them
+    return col.astype(object).where(col.notna(), None)
+
+
+def _frame(columns, index):
+    # built from plain arrays so pandas infers the column dtypes as it did for .apply(pd.Series),
+    # which gives float NaN for a column without any value (e.g. 'course' when every race is on the AWT)
+    return pd.DataFrame({
+        name: col.to_numpy() if col.notna().any() else np.full(len(col), np.nan)
+        for name, col in columns.items()
+    }, index=index)
+
+
+def convert_dates(dates):
+    """
+    race dates written as 'dd/mm/yy' or 'dd/mm/yyyy' to datetimes, dates already parsed are kept
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+
+    parts = text_series(dates).str.split('/', expand=True)
+    year = parts[2].where(parts[2].str.len() != 4, parts[2].str[2:])
+    return pd.to_datetime(parts[0] + '/' + parts[1] + '/' + year, format='%d/%m/%y')
+
+
+def combine_index_date(df, col1='RaceIndex', col2='Date', new_col='race_index'):
+    # race number followed by the ddmmyy date, e.g. 1 on 22/10/25 -> '1221025'
+    df[new_col] = df[col1].astype(str) + df[col2].dt.strftime('%d%m%y')
+    return df.drop(columns=[col1])
+
+
+def compute_target(places):
+    """
+    exponential decay for top finishers: exp(-(place - 1) / 2) for places 1 to 4, 0 otherwise
+    (dead heats like '3 DH', non-finishers and missing places are 0)
+    """
+    text = text_series(places)
+    is_place = text.str.fullmatch(r'\d+')
+    place = pd.to_numeric(text.where(is_place), errors='coerce').to_numpy(dtype=float)
+    target = np.where(place <= 4, np.exp(-(place - 1) / 2), 0.0)
+    return pd.Series(target, index=places.index)
+
+
+def split_rc_track_course(series):
+    """
+    'ST / Turf / "A"' -> rc, track, course, course None when the race has no course (NaN when no race has one)
+    """
+    parts = _parts(series, 3)
+    course = parts[2].str.replace('"', '')
+    return _frame({'rc': parts[0], 'track': _none(parts[1]), 'course': _none(course)}, series.index)
+
+
+def split_origin_age(series):
+    """
+    'AUS / 5' -> origin, age, age None when it is missing
+    """
+    parts = _parts(series, 2)
+    return _frame({'origin': parts[0], 'age': _none(parts[1])}, series.index)
+
+
+def split_colour_sex(series):
+    """
+    'Bay / Gelding' -> colour, sex, the sex is the last part ('Brown / Bay / Gelding')
+    """
+    text = text_series(series)
+    colour = text.str.split('/', n=1).str[0].str.strip()
+    sex = text.str.rsplit('/', n=1).str[-1].str.strip()
+    return _frame({'colour': colour, 'sex': sex}, series.index)
+
+
+@tracing.traced('cleaning.clean_race_data')
+def clean_race_data(df, start_date='04/09/20'):
+    """
+    the basic cleaning of cleaning_data.ipynb in one call, before the history features
+    'df': raw race data as saved by update_data.ipynb
+    'start_date': races on or before this date (dd/mm/yy) are dropped, None keeps all
+    """
+    df = df[~df['Pla.'].isin(excluded_places)].copy()
+
+    df['Date'] = convert_dates(df['Date'])
+    df = combine_index_date(df, 'RaceIndex', 'Date', 'race_index')
+    df['target'] = compute_target(df['Pla.'])
+
+    df[['rc', 'track', 'course']] = split_rc_track_course(df['RC/Track/Course'])
+    df[['origin', 'age']] = split_origin_age(df['Origin / Age'])
+    df[['colour', 'sex']] = split_colour_sex(df['Colour / Sex'])
+    df = df.drop(columns=['RC/Track/Course', 'Origin / Age', 'Colour / Sex'])
+
+    df['Rtg.'] = pd.to_numeric(df['Rtg.'], errors='coerce')
+    df = df.rename(columns={'Dr.': 'gate_position', 'G': 'track_condition'})
+    df = df[cleaned_columns]
+
+    for col in ['race_index', 'Declar.Horse Wt.', 'age']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    if start_date is not None:
+        df = df[df['Date'] > pd.to_datetime(start_date, format='%d/%m/%y')]
+    return df
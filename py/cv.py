@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .evaluation import mean_ndcg
+from .feature_matrix import FeatureMatrix
+
+try:
+    import resource
+except ImportError:
+    # windows has no getrusage, the folds report no peak memory there
+    resource = None
+
+
+def race_order(df):
+    """
+    race_index of every race in date order, races of the same day by race_index,
+    the order build_feature_matrix stores them in
+    """
+    return df.sort_values(['Date', 'race_index'], kind='stable')['race_index'].unique()
+
+
+def temporal_cv_split(df, n_splits=5):
+    """
+    walk-forward folds of training.ipynb, yields (train_races, val_races) as race_index arrays
+    every fold trains on all races before its validation block
+    """
+    unique_races = race_order(df)
+
+    for train_start, train_end, val_end in temporal_cv_folds(len(unique_races), n_splits):
+        yield unique_races[train_start:train_end], unique_races[train_end:val_end]
+
+
+def temporal_cv_folds(n_races, n_splits=5):
+    """
+    the same folds as race positions in race_order: (train_start, train_end, val_end),
+    so a FeatureMatrix slices them without copying
+    """
+    fold_size = n_races // (n_splits + 1)
+    return [(0, (i + 1) * fold_size, (i + 2) * fold_size) for i in range(n_splits)]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux and bytes on macos, None where getrusage is missing
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_fold(matrix_path, fold, bounds, params, thread_count, k):
+    # runs in its own process: opens the shared matrix memory mapped and trains one fold
+    from catboost import CatBoostRanker
+
+    train_start, train_end, val_end = bounds
+    fm = FeatureMatrix(matrix_path)
+    train = fm.groups(train_start, train_end)
+    val = fm.groups(train_end, val_end)
+
+    started = time.perf_counter()
+    num_imputer = train.fit_imputer(strategy='median')
+    train_pool = train.pool(num_imputer)
+    val_pool = val.pool(num_imputer)
+
+    model = CatBoostRanker(**{**params, 'thread_count': thread_count, 'allow_writing_files': False})
+    model.fit(train_pool, eval_set=val_pool)
+    fit_seconds = time.perf_counter() - started
+
+    y_pred = model.predict(val_pool)
+    return {
+        'fold': fold,
+        'train_races': train_end - train_start,
+        'val_races': val_end - train_end,
+        'train_rows': len(train),
+        'val_start': pd.Timestamp(val.date[0]),
+        'val_end': pd.Timestamp(val.date[-1]),
+        f'ndcg@{k}': mean_ndcg(np.asarray(val.label), y_pred, np.asarray(val.group_id), k=k),
+        'best_iteration': model.get_best_iteration(),
+        'fit_seconds': fit_seconds,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def run_cv(matrix_path, params, n_splits=5, n_jobs=None, thread_count=None, k=4, results_path=None):
+    """
+    walk-forward cross validation of a CatBoostRanker on a saved FeatureMatrix, folds trained in parallel
+    'matrix_path': folder written by build_feature_matrix, shared read-only by all folds
+    'params': CatBoostRanker arguments, e.g. the ones of training.ipynb
+    'n_jobs': folds trained at the same time, defaults to as many as the cores allow
+    'thread_count': catboost threads per fold, defaults to the cores split evenly over n_jobs
+    'results_path': optional csv for the per-fold table
+    returns one row per fold with NDCG@k, training time and the peak memory of its process
+    """
+    fm = FeatureMatrix(matrix_path)
+    folds = temporal_cv_folds(fm.n_groups, n_splits)
+
+    cores = os.cpu_count() or 1
+    n_jobs = n_jobs or max(1, min(n_splits, cores))
+    thread_count = thread_count or max(1, cores // n_jobs)
+
+    # a fresh process per fold so the peak memory of one fold doesn't carry over to the next
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, max_tasks_per_child=1) as executor:
+        futures = [
+            executor.submit(_run_fold, matrix_path, fold, bounds, params, thread_count, k)
+            for fold, bounds in enumerate(folds)
+        ]
+        results = pd.DataFrame([future.result() for future in futures])
+
+    if results_path is not None:
+        results.to_csv(results_path, index=False)
+    return results
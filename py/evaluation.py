@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+
+def _race_order(y_pred, groups):
+    # one sort for everything: by race, best prediction first, ties kept in row order
+    codes, races = pd.factorize(np.asarray(groups), sort=True)
+    order = np.lexsort((-np.asarray(y_pred, dtype=float), codes))
+    codes = codes[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(codes)])
+    # position of every row within its race
+    rank = np.arange(len(codes)) - np.repeat(starts, sizes)
+    return order, codes, starts, sizes, rank, races
+
+
+def _discount(rank, k):
+    return np.where(rank < k, 1 / np.log2(rank + 2), 0.0)
+
+
+def race_results(y_true, y_pred, groups, k=4, race_info=None):
+    """
+    NDCG@k, hit@k and top-1 of every race, with one sort instead of a mask per race
+    'y_true' / 'y_pred': target and model score per runner
+    'groups': race of every runner (e.g. race_index)
+    'k': cut-off of the ranking
+    'race_info': optional dataframe aligned with the runners, its first row per race is joined
+                 to the results (e.g. RaceClass, Dist., track) for grouping
+    NDCG averages tied predictions like sklearn's ndcg_score, hit@k is 1 when the winner is among
+    the k best predictions and top1 when it is the best one, races with fewer than 2 runners are dropped
+    """
+    y_true = np.asarray(y_true, dtype=float)
+    y_pred = np.asarray(y_pred, dtype=float)
+    order, codes, starts, sizes, rank, races = _race_order(y_pred, groups)
+    n_races = len(starts)
+
+    true = y_true[order]
+    pred = y_pred[order]
+    discount = _discount(rank, k)
+
+    # tied predictions share the mean gain of the tie
+    ties = np.cumsum(np.r_[True, (codes[1:] != codes[:-1]) | (pred[1:] != pred[:-1])]) - 1
+    tie_gain = np.bincount(ties, weights=true) / np.bincount(ties)
+    dcg = np.bincount(codes, weights=tie_gain[ties] * discount, minlength=n_races)
+
+    # best possible order: gains sorted descending within each race, same positions
+    ideal = true[np.lexsort((-true, codes))]
+    idcg = np.bincount(codes, weights=ideal * discount, minlength=n_races)
+
+    ndcg = np.divide(dcg, idcg, out=np.zeros(n_races), where=idcg > 0)
+
+    race_max = np.maximum.reduceat(true, starts) if n_races else np.zeros(0)
+    is_winner = (true == race_max[codes]) & (race_max[codes] > 0)
+    hit = np.bincount(codes, weights=is_winner & (rank < k), minlength=n_races) > 0
+    top1 = is_winner[starts]
+
+    results = pd.DataFrame({
+        'race_index': races,
+        'runners': sizes,
+        f'ndcg@{k}': ndcg,
+        f'hit@{k}': hit.astype(float),
+        'top1': top1.astype(float),
+    })
+
+    if race_info is not None:
+        info = race_info.reset_index(drop=True).iloc[order[starts]].reset_index(drop=True)
+        results = pd.concat([results, info], axis=1)
+
+    return results[results['runners'] >= 2].reset_index(drop=True)
+
+
+def mean_ndcg(y_true, y_pred, groups, k=4):
+    """
+    average NDCG@k over races, the number calculate_ndcg_per_group in training.ipynb reports
+    """
+    results = race_results(y_true, y_pred, groups, k=k)
+    return float(results[f'ndcg@{k}'].mean()) if len(results) else 0.0
+
+
+def summarize(results, by=None):
+    """
+    mean, std and count of the per-race metrics, overall or per value of 'by' (e.g. 'RaceClass')
+    """
+    metrics = [col for col in results.columns if col.startswith(('ndcg@', 'hit@')) or col == 'top1']
+    if by is None:
+        return results[metrics].agg(['mean', 'std', 'count']).T
+    return results.groupby(by)[metrics].agg(['mean', 'std', 'count'])
@@ -0,0 +1,172 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .features import categorical_cols, numerical_cols
+
+
+def build_feature_matrix(df, path, categorical_cols=categorical_cols, numerical_cols=numerical_cols,
+                         info_cols=('Horse_id',), label='target', group='race_index'):
+    """
+    write cleaned data as a feature matrix folder that FeatureMatrix opens memory mapped
+    rows are sorted by Date and race_index so every race is one contiguous block
+    'df': cleaned data with the features, 'Date', 'race_index' and 'target'
+    'info_cols': extra text columns kept for analysis (e.g. Horse_id), not passed to the model
+    """
+    df = df.sort_values(['Date', group], kind='stable')
+    os.makedirs(path, exist_ok=True)
+
+    np.save(os.path.join(path, 'numeric.npy'), df[numerical_cols].to_numpy(dtype=np.float32))
+    np.save(os.path.join(path, 'label.npy'), df[label].to_numpy(dtype=np.float32))
+    np.save(os.path.join(path, 'group_id.npy'), df[group].to_numpy(dtype=np.int64))
+    np.save(os.path.join(path, 'date.npy'), pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[ns]'))
+
+    # one shared vocabulary per column, categoricals as the strings training casts them to
+    text_cols = list(categorical_cols) + [col for col in info_cols if col not in categorical_cols]
+    codes = np.empty((len(df), len(text_cols)), dtype=np.int32)
+    vocab = {}
+    for i, col in enumerate(text_cols):
+        codes[:, i], uniques = pd.factorize(df[col].map(str), sort=True)
+        vocab[col] = list(uniques)
+    np.save(os.path.join(path, 'codes.npy'), codes)
+
+    group_id = df[group].to_numpy()
+    starts = np.flatnonzero(np.r_[True, group_id[1:] != group_id[:-1]])
+    np.save(os.path.join(path, 'group_offsets.npy'), np.r_[starts, len(df)].astype(np.int64))
+
+    meta = {
+        'n_rows': len(df),
+        'categorical_cols': list(categorical_cols),
+        'numerical_cols': list(numerical_cols),
+        'text_cols': text_cols,
+        'vocab': vocab,
+    }
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    return FeatureMatrix(path)
+
+
+def date_cutoffs(dates, share=0.8):
+    """
+    (val_cutoff, test_cutoff) of training.ipynb: the test set starts after 'share' of the days,
+    the validation set after 'share' of the days before it
+    """
+    dates = pd.to_datetime(pd.Series(np.asarray(dates)))
+    min_date, max_date = dates.min(), dates.max()
+    test_cutoff = min_date + pd.Timedelta(days=int((max_date - min_date).days * share))
+    train_max_date = dates[dates <= test_cutoff].max()
+    val_cutoff = min_date + pd.Timedelta(days=int((train_max_date - min_date).days * share))
+    return val_cutoff, test_cutoff
+
+
+class FeatureMatrix:
+    """
+    float32 numerics, int32 category codes and precomputed race offsets, opened memory mapped
+
+    'rows', 'groups' and 'split_dates' return slices that are views on the same files,
+    nothing is read into memory until a pool or frame is built from them
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        self.path = path
+        self.categorical_cols = meta['categorical_cols']
+        self.numerical_cols = meta['numerical_cols']
+        self.text_cols = meta['text_cols']
+        self.vocab = {col: np.array(values, dtype=object) for col, values in meta['vocab'].items()}
+
+        def load(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        self.numeric = load('numeric')
+        self.codes = load('codes')
+        self.label = load('label')
+        self.group_id = load('group_id')
+        self.date = load('date')
+        self.group_offsets = np.asarray(load('group_offsets'))
+
+    def __len__(self):
+        return len(self.label)
+
+    @property
+    def n_groups(self):
+        return len(self.group_offsets) - 1
+
+    def rows(self, start, stop):
+        # rows [start, stop) as views, both ends must fall on race boundaries
+        view = object.__new__(FeatureMatrix)
+        view.__dict__.update(self.__dict__)
+        for name in ['numeric', 'codes', 'label', 'group_id', 'date']:
+            setattr(view, name, getattr(self, name)[start:stop])
+
+        offsets = self.group_offsets
+        view.group_offsets = offsets[(offsets >= start) & (offsets <= stop)] - start
+        return view
+
+    def groups(self, start, stop):
+        """
+        races [start, stop) in date order, e.g. the folds of temporal_cv_split
+        """
+        return self.rows(self.group_offsets[start], self.group_offsets[stop])
+
+    def split_dates(self, *cutoffs):
+        """
+        consecutive slices split after each cutoff date: Date <= cutoff_1, cutoff_1 < Date <= cutoff_2, ...
+        """
+        bounds = [0] + [int(np.searchsorted(self.date, np.datetime64(pd.Timestamp(cutoff)), side='right'))
+                        for cutoff in cutoffs] + [len(self)]
+        return [self.rows(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def categorical(self, cols=None):
+        """
+        text values of 'cols' (default the categorical features) as an object array, one row per runner
+        the strings are shared with the vocabulary, only the pointers are new
+        """
+        cols = self.categorical_cols if cols is None else cols
+        values = np.empty((len(self), len(cols)), dtype=object)
+        for i, col in enumerate(cols):
+            values[:, i] = self.vocab[col][self.codes[:, self.text_cols.index(col)]]
+        return values
+
+    def numeric_frame(self):
+        return pd.DataFrame(np.asarray(self.numeric), columns=self.numerical_cols)
+
+    def fit_imputer(self, strategy='median'):
+        from sklearn.impute import SimpleImputer
+
+        return SimpleImputer(strategy=strategy).fit(self.numeric_frame())
+
+    def pool(self, imputer=None):
+        """
+        catboost Pool of the slice, numeric features imputed with 'imputer' when given
+        """
+        from catboost import FeaturesData, Pool
+
+        numeric = self.numeric_frame()
+        if imputer is not None:
+            numeric = imputer.transform(numeric)
+        numeric = np.ascontiguousarray(numeric, dtype=np.float32)
+
+        data = FeaturesData(
+            num_feature_data=numeric,
+            cat_feature_data=self.categorical(),
+            num_feature_names=self.numerical_cols,
+            cat_feature_names=self.categorical_cols,
+        )
+        return Pool(data=data, label=np.asarray(self.label), group_id=np.asarray(self.group_id))
+
+    def frame(self):
+        """
+        the slice as a dataframe (a copy), for analysis of the predictions
+        """
+        df = pd.DataFrame(self.categorical(self.text_cols), columns=self.text_cols)
+        df[self.numerical_cols] = np.asarray(self.numeric)
+        df['Date'] = np.asarray(self.date)
+        df['race_index'] = np.asarray(self.group_id)
+        df['target'] = np.asarray(self.label)
+        return df
@@ -0,0 +1,191 @@
+import bisect
+import pickle
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+from . import tracing
+from .features import fill_history_features, race_sizes
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _jockey_key(jockey):
+    # order of sort_values(['Jockey', 'Date']): jockeys by name, missing jockeys last
+    return (1, '') if _missing(jockey) else (0, jockey)
+
+
+class FeatureStore:
+    """
+    running state of the form features per horse, jockey and jockey-trainer pair, so the features
+    of upcoming runners cost O(runners) instead of a pass over the whole history
+
+    gives the same values as runner_history_features / add_history_features in py/features.py
+    fold in the results of every meeting with 'update' after it has run
+    """
+
+    def __init__(self):
+        self.horse_last_3 = defaultdict(lambda: deque(maxlen=3))
+        self.jockey_last_3 = defaultdict(lambda: deque(maxlen=3))
+        self.combo = defaultdict(lambda: [0.0, 0])
+        # every run of a horse as (jockey key, date, track, distance, target), in jockey then date order,
+        # the order the notebook computes recent_5 / consistency / track-distance features in
+        self.horse_runs = defaultdict(list)
+        self.n_rows = 0
+        self.n_target_4 = 0
+        self.last_date = None
+
+    @classmethod
+    def from_history(cls, history):
+        store = cls()
+        store.update(history)
+        return store
+
+    @tracing.traced('feature_store.update')
+    def update(self, results):
+        """
+        fold in cleaned results with a 'target', all newer than the races already in the store
+        """
+        if results.empty:
+            return
+
+        dates = pd.to_datetime(results['Date'])
+        if self.last_date is not None and dates.min() <= self.last_date:
+            raise ValueError(f'results must be newer than {self.last_date.date()}, rebuild the store to add older races')
+
+        results = results.assign(Date=dates).sort_values(['Horse_id', 'Date'])
+        for horse_id, target in zip(results['Horse_id'], results['target']):
+            if not _missing(horse_id):
+                self.horse_last_3[horse_id].append(target)
+
+        results = results.sort_values(['Jockey', 'Date'])
+        columns = ['Horse_id', 'Jockey', 'Trainer', 'track', 'Dist.', 'Date', 'target']
+        for horse_id, jockey, trainer, track, distance, date, target in results[columns].itertuples(index=False):
+            if not _missing(jockey):
+                self.jockey_last_3[jockey].append(target)
+                # the expanding mean skips missing targets, so they are left out of the running sums
+                if not _missing(trainer) and not _missing(target):
+                    combo = self.combo[(jockey, trainer)]
+                    combo[0] += target
+                    combo[1] += 1
+
+            if not _missing(horse_id):
+                runs = self.horse_runs[horse_id]
+                run = (_jockey_key(jockey), date, track, distance, target)
+                if not runs or runs[-1][:2] <= run[:2]:
+                    runs.append(run)
+                else:
+                    runs.insert(bisect.bisect_right(runs, run[:2], key=lambda r: r[:2]), run)
+
+        self.n_rows += len(results)
+        self.n_target_4 += int((results['target'] == 4).sum())
+        self.last_date = results['Date'].max()
+
+    def _runner_features(self, horse_id, jockey, trainer, track, distance):
+        features = dict.fromkeys([
+            'recent_3_win_rate_horse', 'recent_3_win_rate_jockey', 'recent_5_avg_finish_pos',
+            'recent_3_consistency', 'jockey_trainer_combo_rate', 'horse_track_distance_rate'
+        ], np.nan)
+
+        if not _missing(jockey):
+            last_3 = self.jockey_last_3.get(jockey)
+            if last_3 is not None and len(last_3) == 3:
+                features['recent_3_win_rate_jockey'] = np.mean(last_3)
+
+            combo = self.combo.get((jockey, trainer)) if not _missing(trainer) else None
+            if combo is not None and combo[1] >= 5:
+                features['jockey_trainer_combo_rate'] = combo[0] / combo[1]
+
+        if _missing(horse_id):
+            return features
+
+        last_3 = self.horse_last_3.get(horse_id)
+        if last_3 is not None and len(last_3) == 3:
+            features['recent_3_win_rate_horse'] = np.mean(last_3)
+
+        runs = self.horse_runs.get(horse_id, [])
+        # runs the new row comes after: same or earlier sorting jockey, all dates are in the past
+        before = runs[:bisect.bisect_right(runs, _jockey_key(jockey), key=lambda r: r[0])]
+        targets = [run[4] for run in before]
+
+        # rolling windows count the runs with a target, min_periods applies to those
+        last_5 = [target for target in targets[-5:] if not _missing(target)]
+        if len(last_5) >= 2:
+            features['recent_5_avg_finish_pos'] = np.mean(last_5)
+
+        last_3 = [target for target in targets[-3:] if not _missing(target)]
+        if len(last_3) >= 2:
+            features['recent_3_consistency'] = np.std(last_3, ddof=1)
+
+        same_course = [run[4] for run in before if run[2] == track and run[3] == distance and not _missing(run[4])]
+        if len(same_course) >= 2:
+            features['horse_track_distance_rate'] = np.mean(same_course)
+
+        return features
+
+    @tracing.traced('feature_store.features_for')
+    def features_for(self, runners):
+        """
+        form features of upcoming runners with 'Horse_id', 'Jockey', 'Trainer', 'track' and 'Dist.',
+        one or more races told apart as in race_sizes
+        """
+        runners = runners.copy()
+        columns = ['Horse_id', 'Jockey', 'Trainer', 'track', 'Dist.']
+        rows = [self._runner_features(*row) for row in runners[columns].itertuples(index=False)]
+
+        features = pd.DataFrame(rows, index=runners.index)
+        for col in features.columns:
+            runners[col] = features[col]
+
+        fill_value = self.n_target_4 / (self.n_rows + race_sizes(runners))
+        return fill_history_features(runners, fill_value)
+
+    def copy(self):
+        """
+        a store that can be updated without changing this one, which stays readable meanwhile
+        """
+        store = FeatureStore()
+        for key, value in self.horse_last_3.items():
+            store.horse_last_3[key].extend(value)
+        for key, value in self.jockey_last_3.items():
+            store.jockey_last_3[key].extend(value)
+        store.combo.update((key, list(value)) for key, value in self.combo.items())
+        # the runs are tuples, only the lists holding them change
+        store.horse_runs.update((key, list(value)) for key, value in self.horse_runs.items())
+        store.n_rows = self.n_rows
+        store.n_target_4 = self.n_target_4
+        store.last_date = self.last_date
+        return store
+
+    def save(self, path):
+        state = {
+            'horse_last_3': {key: list(value) for key, value in self.horse_last_3.items()},
+            'jockey_last_3': {key: list(value) for key, value in self.jockey_last_3.items()},
+            'combo': dict(self.combo),
+            'horse_runs': dict(self.horse_runs),
+            'n_rows': self.n_rows,
+            'n_target_4': self.n_target_4,
+            'last_date': self.last_date,
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+
+        store = cls()
+        for key, value in state['horse_last_3'].items():
+            store.horse_last_3[key].extend(value)
+        for key, value in state['jockey_last_3'].items():
+            store.jockey_last_3[key].extend(value)
+        store.combo.update(state['combo'])
+        store.horse_runs.update(state['horse_runs'])
+        store.n_rows = state['n_rows']
+        store.n_target_4 = state['n_target_4']
+        store.last_date = state['last_date']
+        return store
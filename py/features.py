@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+from . import tracing
+
+# features of the version_2 model
+categorical_cols = [
+    'Dist.', 'track_condition', 'RaceClass', 'Trainer', 'Jockey', 'Dam sire', 'rc', 'track', 'course',
+    'Import type', 'Sire', 'Dam', 'origin', 'age', 'colour', 'sex'
+]
+
+numerical_cols = [
+    'Rtg.', 'Act.Wt.', 'Declar.Horse Wt.', 'recent_3_win_rate_horse',
+    'recent_3_win_rate_jockey', 'recent_5_avg_finish_pos',
+    'recent_3_consistency', 'jockey_trainer_combo_rate',
+    'horse_track_distance_rate'
+]
+
+history_feature_cols = [
+    'recent_3_win_rate_horse', 'recent_3_win_rate_jockey', 'recent_5_avg_finish_pos',
+    'recent_3_consistency', 'jockey_trainer_combo_rate', 'horse_track_distance_rate'
+]
+
+
+def _group_codes(df, keys):
+    # one integer per group of 'keys', -1 for rows with a missing key (groupby drops those)
+    codes = np.zeros(len(df), dtype=np.int64)
+    for key in keys:
+        key_codes, uniques = pd.factorize(df[key])
+        codes = np.where((codes < 0) | (key_codes < 0), -1, codes * (len(uniques) + 1) + key_codes)
+    return codes
+
+
+def _grouped_order(codes):
+    # rows of each group together, keeping the current row order inside the group
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    codes = codes[order]
+    starts = np.r_[True, codes[1:] != codes[:-1]]
+    start_index = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+    return order, np.arange(len(order)) - start_index
+
+
+def _shifted_window(values, position, window):
+    # previous 'window' values of every row within its group, most recent last, NaN past the group start
+    lags = np.full((len(values), window), np.nan)
+    for lag in range(1, window + 1):
+        has_lag = position >= lag
+        lags[has_lag, window - lag] = values[np.flatnonzero(has_lag) - lag]
+    return lags
+
+
+def _shift_rolling(target, codes, window, min_periods, stat='mean'):
+    """
+    x.shift().rolling(window, min_periods).mean() / .std() within every group, in the current row order
+    """
+    result = np.full(len(target), np.nan)
+    order, position = _grouped_order(codes)
+    lags = _shifted_window(target[order], position, window)
+
+    count = np.sum(~np.isnan(lags), axis=1)
+    valid = count >= min_periods
+    lags = lags[valid]
+    count = count[valid]
+
+    total = np.nansum(lags, axis=1)
+    if stat == 'mean':
+        values = total / count
+    else:
+        deviation = np.where(np.isnan(lags), 0.0, lags - (total / count)[:, None])
+        values = np.sqrt(np.sum(deviation ** 2, axis=1) / (count - 1))
+
+    result[order[valid]] = values
+    return result
+
+
+def _shift_expanding_mean(target, codes, min_periods):
+    """
+    x.shift().expanding(min_periods).mean() within every group, in the current row order
+    """
+    result = np.full(len(target), np.nan)
+    order, position = _grouped_order(codes)
+    values = target[order]
+
+    known = ~np.isnan(values)
+    # sums / counts of the earlier rows of the group: exclusive cumsum minus the one at the group start
+    total = np.cumsum(np.where(known, values, 0.0)) - np.where(known, values, 0.0)
+    count = np.cumsum(known) - known
+    total = total - total[np.arange(len(order)) - position]
+    count = count - count[np.arange(len(order)) - position]
+
+    valid = count >= min_periods
+    result[order[valid]] = total[valid] / count[valid]
+    return result
+
+
+@tracing.traced('features.add_history_features')
+def add_history_features(df):
+    """
+    rolling form features of cleaning_data.ipynb, every value only uses earlier races (shift before window)
+    each feature is one stable sort by group and numpy window / cumulative sums instead of a python call per group
+    'df': cleaned data with 'Date', 'Horse_id', 'Jockey', 'Trainer', 'track', 'Dist.' and 'target'
+    returns the frame sorted by Jockey and Date, missing values filled as in the notebook
+    """
+    df = df.sort_values(['Horse_id', 'Date'])
+    target = df['target'].to_numpy(dtype=float)
+
+    df['recent_3_win_rate_horse'] = _shift_rolling(target, _group_codes(df, ['Horse_id']), 3, 3)
+
+    # the notebook builds the remaining features after this sort, the per-horse ones included,
+    # so a horse's "previous" rows follow jockey order there rather than date order
+    df = df.sort_values(['Jockey', 'Date'])
+    target = df['target'].to_numpy(dtype=float)
+    horse = _group_codes(df, ['Horse_id'])
+
+    df['recent_3_win_rate_jockey'] = _shift_rolling(target, _group_codes(df, ['Jockey']), 3, 3)
+    df['recent_5_avg_finish_pos'] = _shift_rolling(target, horse, 5, 2)
+    df['recent_3_consistency'] = _shift_rolling(target, horse, 3, 2, stat='std')
+    df['jockey_trainer_combo_rate'] = _shift_expanding_mean(target, _group_codes(df, ['Jockey', 'Trainer']), 5)
+    df['horse_track_distance_rate'] = _shift_expanding_mean(target, _group_codes(df, ['Horse_id', 'track', 'Dist.']), 2)
+
+    return fill_history_features(df, np.mean(df['target'] == 4))
+
+
+def fill_history_features(df, fill_value):
+    # 'fill_value' is one number, or one per row of 'df'
+    if np.ndim(fill_value):
+        fill_value = pd.Series(fill_value, index=df.index)
+    for col in history_feature_cols:
+        df[col] = df[col].fillna(fill_value)
+    return df
+
+
+def race_sizes(runners):
+    """
+    number of runners in the race of every row, races told apart by 'race_index' or 'race_no',
+    all rows are one race when neither column is there
+    """
+    for key in ('race_index', 'race_no'):
+        if key in runners:
+            return runners.groupby(key, dropna=False, sort=False)[key].transform('size').to_numpy()
+    return np.full(len(runners), len(runners))
+
+
+def _lookup(runners, keys, stats):
+    # join per-entity stats onto the runners, runners with a missing key get NaN like groupby would
+    keys = keys if isinstance(keys, list) else [keys]
+    joined = runners[keys].merge(stats, how='left', left_on=keys, right_index=True)
+    joined.loc[runners[keys].isna().any(axis=1).to_numpy(), stats.columns] = np.nan
+    return joined[stats.columns].to_numpy()
+
+
+def _jockey_order_rows(history, runners):
+    # the notebook computes the per-horse recent_5 / consistency / track-distance features after
+    # re-sorting by Jockey and Date, so a horse's "previous" rows are the ones with a jockey
+    # sorting before the runner's (missing jockeys last), not the chronologically earlier ones
+    rows = runners[['Horse_id', 'Jockey', 'track', 'Dist.']].reset_index(drop=True)
+    rows['runner'] = np.arange(len(rows))
+    rows = rows.rename(columns={'Jockey': 'runner_jockey', 'track': 'runner_track', 'Dist.': 'runner_dist'})
+
+    past = history[['Horse_id', 'Jockey', 'track', 'Dist.', 'target']].copy()
+    past['order'] = np.arange(len(past))
+    past = rows.merge(past, on='Horse_id', how='inner')
+
+    runner_jockey = past['runner_jockey']
+    keep = runner_jockey.isna() | (past['Jockey'].notna() & (past['Jockey'] <= runner_jockey.fillna('')))
+    return past[keep.to_numpy()].sort_values(['runner', 'order'])
+
+
+@tracing.traced('features.runner_history_features')
+def runner_history_features(history, runners):
+    """
+    history features of upcoming runners, computed from the past races only
+    gives the same values as appending a single race to 'history' and running add_history_features,
+    a whole meeting can be passed at once since runners never see each other (races told apart as in race_sizes)
+    'history': cleaned data with a 'target' for every row, all earlier than the runners' race
+    'runners': rows to score with 'Horse_id', 'Jockey', 'Trainer', 'track' and 'Dist.'
+    """
+    runners = runners.copy()
+    n = len(runners)
+
+    history = history.sort_values(['Horse_id', 'Date'])
+
+    horse_3 = history.groupby('Horse_id', sort=False)['target'].tail(3)
+    horse_3 = horse_3.groupby(history.loc[horse_3.index, 'Horse_id']).agg(['mean', 'count'])
+
+    history = history.sort_values(['Jockey', 'Date'])
+
+    jockey_3 = history.groupby('Jockey', sort=False)['target'].tail(3)
+    jockey_3 = jockey_3.groupby(history.loc[jockey_3.index, 'Jockey']).agg(['mean', 'count'])
+
+    combo = history.groupby(['Jockey', 'Trainer'])['target'].agg(['mean', 'count'])
+
+    mean, count = _lookup(runners, 'Horse_id', horse_3).T
+    runners['recent_3_win_rate_horse'] = np.where(count >= 3, mean, np.nan)
+
+    mean, count = _lookup(runners, 'Jockey', jockey_3).T
+    runners['recent_3_win_rate_jockey'] = np.where(count >= 3, mean, np.nan)
+
+    mean, count = _lookup(runners, ['Jockey', 'Trainer'], combo).T
+    runners['jockey_trainer_combo_rate'] = np.where(count >= 5, mean, np.nan)
+
+    past = _jockey_order_rows(history, runners)
+    by_runner = past.groupby('runner')['target']
+
+    last_5 = by_runner.tail(5).groupby(past['runner']).agg(['mean', 'count']).reindex(range(n))
+    runners['recent_5_avg_finish_pos'] = np.where(last_5['count'] >= 2, last_5['mean'], np.nan)
+
+    last_3 = by_runner.tail(3).groupby(past['runner']).agg(['std', 'count']).reindex(range(n))
+    runners['recent_3_consistency'] = np.where(last_3['count'] >= 2, last_3['std'], np.nan)
+
+    same_course = past[(past['track'] == past['runner_track']).to_numpy() & (past['Dist.'] == past['runner_dist']).to_numpy()]
+    track_distance = same_course.groupby('runner')['target'].agg(['mean', 'count']).reindex(range(n))
+    runners['horse_track_distance_rate'] = np.where(track_distance['count'] >= 2, track_distance['mean'], np.nan)
+
+    # the notebook fills with the share of targets equal to 4 over the history and the one race appended to it
+    fill_value = (history['target'] == 4).sum() / (len(history) + race_sizes(runners))
+    return fill_history_features(runners, fill_value)
@@ -0,0 +1,38 @@
+import pandas as pd
+
+# written by 'script/1. scraping_fixture.ipynb' from the season fixture pdfs
+fixtures_path = 'data/fixtures/fixtures.csv'
+
+venues = ['ST', 'HV']
+
+
+def load_fixtures(path=fixtures_path):
+    """
+    race meetings of the fixture list as a dataframe with 'Date' (datetime) and 'Venue' ('ST' / 'HV'),
+    one row per meeting in date order, rows that are not local meetings are dropped
+    """
+    fixtures = pd.read_csv(path)
+    fixtures = fixtures.loc[:, ~fixtures.columns.str.startswith('Unnamed')]
+
+    fixtures['Date'] = pd.to_datetime(fixtures['Date'], format='%d/%m/%Y', errors='coerce')
+    fixtures['Venue'] = fixtures['Venue'].astype(str).str.strip()
+
+    fixtures = fixtures[fixtures['Date'].notna() & fixtures['Venue'].isin(venues)]
+    return fixtures.drop_duplicates('Date').sort_values('Date').reset_index(drop=True)
+
+
+def meetings_between(fixtures, start=None, end=None):
+    """
+    (date, venue) of the meetings after 'start' and up to 'end' (both dates, None for no bound)
+    'fixtures': dataframe from load_fixtures or the path of the fixture csv
+    """
+    if isinstance(fixtures, str):
+        fixtures = load_fixtures(fixtures)
+
+    keep = pd.Series(True, index=fixtures.index)
+    if start is not None:
+        keep &= fixtures['Date'] > pd.Timestamp(start)
+    if end is not None:
+        keep &= fixtures['Date'] <= pd.Timestamp(end)
+
+    return list(fixtures.loc[keep, ['Date', 'Venue']].itertuples(index=False, name=None))
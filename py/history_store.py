@@ -0,0 +1,307 @@
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .cleaning import convert_dates
+
+# repeated text columns, stored dictionary encoded
+category_cols = [
+    'RC/Track/Course', 'G', 'RaceClass', 'Trainer', 'Jockey', 'Gear', 'Horse_id', 'Origin / Age',
+    'Colour / Sex', 'Import type', 'Sire', 'Dam', 'Dam sire',
+    'rc', 'track', 'course', 'track_condition', 'origin', 'colour', 'sex'
+]
+
+# columns of the hkjc pages that mix numbers and text ('WV', '3 DH', '---', '1-1/4', '--'), stored as text
+# whatever the first meeting held, so a later meeting with text in them still fits the store
+text_cols = ['Pla.', 'Dr.', 'Rtg.', 'LBW', 'Win Odds', 'RunningPosition', 'Finish Time']
+
+dictionary_type = pa.dictionary(pa.int32(), pa.string())
+
+
+def season_of(date):
+    # hkjc seasons run from september to july, e.g. 2025-10-19 is in season '2025-26'
+    start = date.year if date.month >= 9 else date.year - 1
+    return f'{start}-{str(start + 1)[2:]}'
+
+
+def _infer_field(name, series):
+    if name in category_cols:
+        return pa.field(name, dictionary_type)
+    if name in text_cols:
+        return pa.field(name, pa.string())
+    if name == 'Date' or pd.api.types.is_datetime64_any_dtype(series):
+        return pa.field(name, pa.timestamp('ns'))
+    if pd.api.types.is_bool_dtype(series):
+        return pa.field(name, pa.bool_())
+    if pd.api.types.is_integer_dtype(series):
+        return pa.field(name, pa.int64())
+    if pd.api.types.is_float_dtype(series):
+        return pa.field(name, pa.float64())
+    return pa.field(name, pa.string())
+
+
+def _check_lost(name, col, converted, field, coerce):
+    # values the store type cannot hold would silently become missing, name them instead
+    lost = col.notna() & converted.isna()
+    if lost.any():
+        message = (f"{lost.sum()} value(s) of '{name}' do not fit the store type {field.type}: "
+                   f"{col[lost].drop_duplicates().head(5).tolist()}")
+        if not coerce:
+            raise ValueError(message + ", pass coerce=True to store them as missing")
+        print(message + ', stored as missing')
+    return converted
+
+
+def _conform(df, schema, coerce=False):
+    # cast a meeting to the store schema so every partition reads back with the same types
+    df = df.copy()
+    for field in schema:
+        if field.name not in df:
+            df[field.name] = None
+        col = df[field.name]
+        if field.type == dictionary_type or pa.types.is_string(field.type):
+            df[field.name] = col.astype(object).where(col.isna(), col.map(str))
+        elif pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(col)
+        elif pa.types.is_integer(field.type):
+            converted = _check_lost(field.name, col, pd.to_numeric(col, errors='coerce'), field, coerce)
+            df[field.name] = converted.astype('Int64')
+        elif pa.types.is_floating(field.type):
+            converted = _check_lost(field.name, col, pd.to_numeric(col, errors='coerce'), field, coerce)
+            df[field.name] = converted.astype(float)
+
+    extra = [col for col in df.columns if col not in schema.names]
+    if extra:
+        raise ValueError(f'columns not in the store schema: {extra}')
+    return df[schema.names]
+
+
+def _to_frame(table, categorical):
+    df = table.to_pandas()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if categorical:
+                # sorted categories so sort_values orders them as text, like the csv did
+                df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+            else:
+                df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+
+def _season_bounds(season):
+    start = int(season[:4])
+    return pd.Timestamp(start, 9, 1), pd.Timestamp(start + 1, 8, 31)
+
+
+class HistoryStore:
+    """
+    race history as parquet, one partition per meeting: <root>/season=2025-26/date=2025-10-19/part-0.parquet
+
+    appending a meeting writes only its own partition, readers pick columns and a date range
+    and only open the partitions inside it. 'compact' folds finished seasons into a single
+    <root>/season=2024-25/season.parquet so old seasons don't cost a file open per meeting
+    'root': folder of the store
+    """
+
+    def __init__(self, root='../data/history'):
+        self.root = root
+
+    def _partition_path(self, date):
+        return os.path.join(self.root, f'season={season_of(date)}', f'date={date:%Y-%m-%d}', 'part-0.parquet')
+
+    def _season_path(self, season):
+        return os.path.join(self.root, f'season={season}', 'season.parquet')
+
+    def _partitions(self, start=None, end=None):
+        # (first date, last date, path) of the stored files, pruned by the dates in the folder names
+        partitions = []
+        for path in glob.glob(os.path.join(self.root, 'season=*', 'date=*', 'part-0.parquet')):
+            date = pd.Timestamp(os.path.basename(os.path.dirname(path))[len('date='):])
+            partitions.append((date, date, path))
+        for path in glob.glob(os.path.join(self.root, 'season=*', 'season.parquet')):
+            first, last = _season_bounds(os.path.basename(os.path.dirname(path))[len('season='):])
+            partitions.append((first, last, path))
+
+        return sorted(
+            partition for partition in partitions
+            if (start is None or partition[1] >= start) and (end is None or partition[0] <= end)
+        )
+
+    def _write(self, df, path, schema, coerce=False):
+        table = pa.Table.from_pandas(_conform(df, schema, coerce), schema=schema, preserve_index=False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to the target first, so a reader never sees half a file
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    def dates(self):
+        dates = set()
+        for first, last, path in self._partitions():
+            if first == last:
+                dates.add(first)
+            else:
+                dates.update(pd.to_datetime(pq.read_table(path, columns=['Date'])['Date'].unique().to_pandas()))
+        return sorted(dates)
+
+    def last_date(self):
+        dates = self.dates()
+        return dates[-1] if dates else None
+
+    def _schema_path(self):
+        return os.path.join(self.root, '_common_metadata')
+
+    def schema(self):
+        """
+        column types of the store, the ones every partition is read back with
+        """
+        if os.path.exists(self._schema_path()):
+            return pq.read_schema(self._schema_path())
+        # stores written before the schema was kept in _common_metadata
+        partitions = self._partitions()
+        return pq.read_schema(partitions[-1][2]) if partitions else None
+
+    def _save_schema(self, schema):
+        os.makedirs(self.root, exist_ok=True)
+        pq.write_metadata(schema, self._schema_path() + '.tmp')
+        os.replace(self._schema_path() + '.tmp', self._schema_path())
+
+    def append_meeting(self, df, overwrite=False, coerce=False):
+        """
+        store the rows of one or more meetings, one partition per race date
+        'df': race rows with a 'Date' column (dates as datetimes or 'dd/mm/yyyy' text)
+        'overwrite': replace meetings already in the store, otherwise they are skipped
+        'coerce': store values that do not fit the type of their column (e.g. text in a number column)
+                  as missing with a warning, by default they raise a ValueError
+        the first meeting fixes the column types, except the text_cols which are always text, a column
+        first seen later is added to the store schema with the type of its values and reads back as
+        missing for the earlier meetings
+        returns the paths written
+        """
+        df = df.copy()
+        df['Date'] = convert_dates(df['Date'])
+
+        stored_schema = self.schema()
+        if stored_schema is None:
+            schema = pa.schema([_infer_field(name, df[name]) for name in df.columns]).remove_metadata()
+        else:
+            schema = stored_schema
+            new = [name for name in df.columns if name not in schema.names]
+            for name in new:
+                schema = schema.append(_infer_field(name, df[name]))
+
+        # every meeting is checked before the first one is written
+        df = _conform(df, schema, coerce)
+        if stored_schema is None or not schema.equals(stored_schema):
+            if stored_schema is not None:
+                print(f'columns added to the store schema: {schema.names[len(stored_schema.names):]}')
+            self._save_schema(schema)
+
+        stored = set(self.dates())
+        written = []
+        for date, meeting in df.groupby('Date', sort=True):
+            if date in stored:
+                if not overwrite:
+                    print(f'meeting {date:%d/%m/%Y} already stored, skipped')
+                    continue
+                self._drop_from_season(date, schema)
+
+            path = self._partition_path(date)
+            self._write(meeting, path, schema)
+            written.append(path)
+
+        return written
+
+    def _drop_from_season(self, date, schema):
+        # an overwritten meeting of a compacted season is taken out of the season file
+        path = self._season_path(season_of(date))
+        if not os.path.exists(path):
+            return
+        season = pq.read_table(path).to_pandas()
+        self._write(season[season['Date'] != date], path, schema)
+
+    def compact(self, keep_open=1):
+        """
+        merge the meeting partitions of finished seasons into one file per season
+        'keep_open': latest seasons left as meeting partitions, 1 keeps the current season
+        returns the season files written
+        """
+        by_season = {}
+        for first, last, path in self._partitions():
+            if first == last:
+                by_season.setdefault(season_of(first), []).append(path)
+
+        seasons = sorted({season_of(date) for date in self.dates()})
+        closed = seasons[:-keep_open] if keep_open else seasons
+        schema = self.schema()
+
+        written = []
+        for season in closed:
+            paths = by_season.get(season)
+            if not paths:
+                continue
+
+            season_path = self._season_path(season)
+            if os.path.exists(season_path):
+                paths = [season_path] + paths
+            tables = [pq.read_table(path, schema=schema) for path in paths]
+            table = pa.concat_tables(tables).to_pandas().sort_values('Date', kind='stable')
+
+            self._write(table, season_path, schema)
+            for path in paths:
+                if path != season_path:
+                    os.remove(path)
+                    os.rmdir(os.path.dirname(path))
+            written.append(season_path)
+
+        return written
+
+    def read(self, columns=None, start=None, end=None, categorical=False):
+        """
+        history as a dataframe, in meeting order
+        'columns': columns to load, None for all
+        'start' / 'end': first and last race date to include (inclusive), None for no bound
+        'categorical': keep the dictionary columns as pandas categoricals (less memory) instead of text
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        partitions = self._partitions(start, end)
+        if not partitions:
+            return pd.DataFrame(columns=columns)
+
+        row_filter = None
+        if start is not None:
+            row_filter = ds.field('Date') >= start
+        if end is not None:
+            row_filter = ds.field('Date') <= end if row_filter is None else row_filter & (ds.field('Date') <= end)
+
+        dataset = ds.dataset([path for _, _, path in partitions], schema=self.schema(), format='parquet')
+        table = dataset.to_table(columns=columns, filter=row_filter)
+
+        return _to_frame(table, categorical)
+
+    def partitions(self):
+        """
+        paths of the stored files in meeting order, meeting partitions and compacted seasons alike
+        """
+        return [path for _, _, path in self._partitions()]
+
+    def read_file(self, path, columns=None, categorical=False):
+        """
+        rows of one stored file (see partitions), with the same types as read
+        """
+        return _to_frame(pq.read_table(path, columns=columns, schema=self.schema()), categorical)
+
+    def import_csv(self, path, overwrite=False, compact=True):
+        """
+        move a race_data_YYYYMMDD.csv into the store, one partition per meeting,
+        finished seasons are compacted afterwards
+        """
+        written = self.append_meeting(pd.read_csv(path), overwrite=overwrite)
+        if compact:
+            self.compact()
+        return written
@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class HorseProfileCache:
+    """
+    persistent cache of parsed horse profiles keyed by Horse_id (e.g. 'J256')
+
+    'cache_dir': folder holding the index database and the raw html blobs
+    'ttl': seconds before an entry is treated as stale, None to keep entries forever
+    'max_entries' / 'max_bytes': size bounds, least recently used entries are evicted first
+    'store_html': also keep the raw page, stored once per distinct content (sha256 of the page)
+    """
+
+    def __init__(self, cache_dir='data/horse_cache', ttl=30 * 24 * 3600, max_entries=20000,
+                 max_bytes=512 * 1024 * 1024, store_html=False):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store_html = store_html
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS profiles ('
+            'horse_id TEXT PRIMARY KEY, record TEXT NOT NULL, html_sha256 TEXT, '
+            'size INTEGER NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS profiles_accessed ON profiles (accessed_at)')
+        self.conn.commit()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest + '.html.gz')
+
+    def _expired(self, fetched_at, now):
+        return self.ttl is not None and now - fetched_at > self.ttl
+
+    def get(self, horse_id):
+        """
+        return the cached record of the horse, or None on a miss or stale entry
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT record, fetched_at FROM profiles WHERE horse_id = ?', (horse_id,)
+            ).fetchone()
+
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    self._delete([horse_id])
+                self.misses += 1
+                return None
+
+            self.conn.execute('UPDATE profiles SET accessed_at = ? WHERE horse_id = ?', (now, horse_id))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def get_html(self, horse_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT html_sha256 FROM profiles WHERE horse_id = ?', (horse_id,)
+            ).fetchone()
+
+        if row is None or row[0] is None:
+            return None
+
+        path = self._blob_path(row[0])
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, horse_id, record, html=None):
+        # a page without a horse name (maintenance or error page) parses to all 'na', it is not kept
+        if horse_id is None or record.get('Horse_name', 'na') in ('na', None, ''):
+            return
+
+        record_json = json.dumps(record)
+        size = len(record_json)
+        digest = None
+
+        if self.store_html and html is not None:
+            if isinstance(html, str):
+                html = html.encode('utf-8')
+            digest = hashlib.sha256(html).hexdigest()
+            path = self._blob_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                with gzip.open(tmp_path, 'wb') as f:
+                    f.write(html)
+                os.replace(tmp_path, path)
+            size += os.path.getsize(path)
+
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute(
+                'SELECT html_sha256 FROM profiles WHERE horse_id = ?', (horse_id,)
+            ).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?)',
+                (horse_id, record_json, digest, size, now, now)
+            )
+            if old is not None and old[0] != digest:
+                self._drop_blob_if_unused(old[0])
+            self._evict()
+            self.conn.commit()
+
+    def _drop_blob_if_unused(self, digest):
+        if digest is None:
+            return
+        used = self.conn.execute(
+            'SELECT 1 FROM profiles WHERE html_sha256 = ? LIMIT 1', (digest,)
+        ).fetchone()
+        if used is None:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _delete(self, horse_ids):
+        digests = []
+        for horse_id in horse_ids:
+            row = self.conn.execute(
+                'SELECT html_sha256 FROM profiles WHERE horse_id = ?', (horse_id,)
+            ).fetchone()
+            self.conn.execute('DELETE FROM profiles WHERE horse_id = ?', (horse_id,))
+            if row is not None:
+                digests.append(row[0])
+        for digest in digests:
+            self._drop_blob_if_unused(digest)
+        self.conn.commit()
+
+    def _evict(self):
+        count, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM profiles').fetchone()
+
+        victims = []
+        if (self.max_entries is not None and count > self.max_entries) or \
+                (self.max_bytes is not None and total > self.max_bytes):
+            for horse_id, size in self.conn.execute('SELECT horse_id, size FROM profiles ORDER BY accessed_at'):
+                if (self.max_entries is None or count <= self.max_entries) and \
+                        (self.max_bytes is None or total <= self.max_bytes):
+                    break
+                victims.append(horse_id)
+                count -= 1
+                total -= size
+
+        if victims:
+            self.evictions += len(victims)
+            self._delete(victims)
+
+    def stats(self):
+        with self.lock:
+            count, total = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM profiles'
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': count,
+            'bytes': total,
+        }
+
+    def clear(self):
+        with self.lock:
+            digests = [row[0] for row in self.conn.execute('SELECT DISTINCT html_sha256 FROM profiles')]
+            self.conn.execute('DELETE FROM profiles')
+            self.conn.commit()
+            for digest in digests:
+                if digest is not None:
+                    try:
+                        os.remove(self._blob_path(digest))
+                    except FileNotFoundError:
+                        pass
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,126 @@
+import re
+
+from bs4 import BeautifulSoup
+
+# output column -> label text looked up in the horse profile table
+profile_labels = {
+    'Origin / Age': 'Country of Origin',
+    'Colour / Sex': 'Colour / Sex',
+    'Import type': 'Import Type',
+    'Sire': 'Sire',
+    'Dam': 'Dam',
+    'Dam sire': "Dam's Sire",
+}
+
+
+def available_backends():
+    backends = []
+    try:
+        import selectolax.lexbor  # noqa: F401
+        backends.append('selectolax')
+    except ImportError:
+        pass
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        pass
+    backends.append('html.parser')
+    return backends
+
+
+def default_backend():
+    return available_backends()[0]
+
+
+def _clean_name(text):
+    match = re.match(r'^([^\(]+)', text)
+    return match.group(1).strip() if match else text
+
+
+def _match_labels(labels, text, found, node):
+    # every label keeps the first cell containing it, so 'Sire' still falls back to
+    # "Dam's Sire" when a page has no Sire row, the same as soup.find(string=...) did
+    for column, label in labels.items():
+        if column not in found and label in text:
+            found[column] = node
+
+
+def _parse_bs4(html, features):
+    soup = BeautifulSoup(html, features)
+
+    name_tag = soup.find('span', class_='title_text')
+    horse_name = _clean_name(name_tag.get_text()) if name_tag else 'na'
+
+    found = {}
+    for td in soup.find_all('td'):
+        text = td.string
+        if text:
+            _match_labels(profile_labels, text, found, td)
+            if len(found) == len(profile_labels):
+                break
+
+    record = {'Horse_name': horse_name}
+    for column in profile_labels:
+        label = found.get(column)
+        record[column] = label.find_next().find_next().get_text(strip=True) if label else 'na'
+
+    return record
+
+
+def _single_string(node):
+    # text of a node with exactly one child all the way down, like bs4's Tag.string
+    while True:
+        children = list(node.iter(include_text=True))
+        if len(children) != 1:
+            return None
+        node = children[0]
+        if node.tag == '-text':
+            return node.text_content
+
+
+def _parse_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+
+    name_tag = tree.css_first('span.title_text')
+    horse_name = _clean_name(name_tag.text(deep=True)) if name_tag else 'na'
+
+    # elements in document order, so find_next() is simply the following element
+    elements = []
+    found = {}
+    for node in tree.root.traverse():
+        elements.append(node)
+        if node.tag == 'td' and len(found) < len(profile_labels):
+            text = _single_string(node)
+            if text:
+                _match_labels(profile_labels, text, found, len(elements) - 1)
+
+    record = {'Horse_name': horse_name}
+    for column in profile_labels:
+        position = found.get(column)
+        if position is None or position + 2 >= len(elements):
+            record[column] = 'na'
+        else:
+            record[column] = elements[position + 2].text(deep=True, strip=True)
+
+    return record
+
+
+def parse_horse_profile(html, backend=None):
+    """
+    parse the name and pedigree fields of a horse profile page in one pass over its cells
+    'html': page content as str or bytes
+    'backend': 'selectolax', 'lxml' or 'html.parser', defaults to the fastest one installed
+    returns a dict with 'Horse_name' and the columns in profile_labels, 'na' when not found
+    """
+    if backend is None:
+        backend = default_backend()
+
+    if backend == 'selectolax':
+        if isinstance(html, bytes):
+            html = html.decode('utf-8', errors='replace')
+        return _parse_selectolax(html)
+
+    return _parse_bs4(html, backend)
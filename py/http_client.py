@@ -0,0 +1,126 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import tracing
+
+default_headers = {"User-Agent": "Mozilla/5.0 (compatible; HKJCScraper/1.0)"}
+
+
+class TokenBucket:
+    """
+    thread safe token bucket, 'rate' tokens per second with bursts up to 'burst'
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    one token bucket per host, so a slow site does not throttle requests to another
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+
+def make_session(pool_size=10, headers=None):
+    # keep-alive connections are reused across all requests made with the session
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(default_headers if headers is None else headers)
+    return session
+
+
+def fetch(url, session=None, rate_limiter=None, timeout=10):
+    if rate_limiter is not None:
+        waited = time.perf_counter()
+        rate_limiter.acquire(url)
+        tracing.count('http.rate_limit_wait_s', time.perf_counter() - waited)
+
+    if session is None:
+        response = requests.get(url, headers=default_headers, timeout=timeout)
+    else:
+        response = session.get(url, timeout=timeout)
+
+    tracing.count('http.requests')
+    tracing.count('http.bytes', len(response.content))
+    return response
+
+
+def fetch_all(urls, session=None, max_workers=8, rate_limit=None, timeout=10, rate_limiter=None):
+    """
+    fetch the urls concurrently and return the responses in the same order as 'urls'
+    'max_workers': maximum number of requests in flight
+    'rate_limit': maximum requests per second to a single host, None for no limit
+    'rate_limiter': a HostRateLimiter shared with other calls, replaces 'rate_limit' so
+                    concurrent fetch_all calls stay under one limit together
+    failed requests are returned as None
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max_workers)
+
+    if rate_limiter is None and rate_limit:
+        rate_limiter = HostRateLimiter(rate_limit, burst=max_workers)
+
+    def get(url):
+        # requests made by the worker threads are counted in the caller's span
+        with tracing.attach(parent):
+            try:
+                return fetch(url, session=session, rate_limiter=rate_limiter, timeout=timeout)
+            except Exception as e:
+                tracing.count('http.errors')
+                print(f'Request exception for {url}: {str(e)}')
+                return None
+
+    try:
+        with tracing.span('http.fetch_all', urls=len(urls)):
+            parent = tracing.current()
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+                return list(executor.map(get, urls))
+    finally:
+        if own_session:
+            session.close()
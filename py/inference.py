@@ -0,0 +1,165 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import pandas as pd
+from catboost import CatBoostRanker
+
+from . import tracing
+from .feature_store import FeatureStore
+from .features import categorical_cols, numerical_cols, runner_history_features
+from .http_client import HostRateLimiter, make_session
+from .race_function import scrape_current_race_no_odds
+
+race_card_url = 'https://racing.hkjc.com/racing/information/English/racing/RaceCard.aspx?RaceDate={date}&Racecourse={venue}&RaceNo={race_no}'
+
+
+class InferenceEngine:
+    """
+    version_2 model, imputer and history loaded once and reused for every race of a meeting
+
+    'model_path' / 'imputer_path': the saved CatBoostRanker and numerical SimpleImputer
+    'history': cleaned data (path to the csv or a dataframe) the form features are built from,
+               or a FeatureStore (or the path of a saved one, '.pkl') to skip the pass over the history
+    'max_workers': race cards scraped at the same time
+    'cache': optional HorseProfileCache shared by all scrapes
+    'rate_limit': requests per second to the racing site, shared by all races scraped at the same time
+    """
+
+    def __init__(self, model_path='model/v2/catboost_ranker_v2.cbm', imputer_path='model/v2/num_imputer_v2.pkl',
+                 history='data/cleaned_data_20251022.csv', max_workers=4, cache=None, card_url=race_card_url,
+                 rate_limit=5):
+        self.model = CatBoostRanker()
+        self.model.load_model(model_path)
+        self.num_imputer = joblib.load(imputer_path)
+
+        if isinstance(history, str) and history.endswith('.pkl'):
+            history = FeatureStore.load(history)
+        if isinstance(history, FeatureStore):
+            self.history = history
+        else:
+            self.history = pd.read_csv(history) if isinstance(history, str) else history.copy()
+            self.history['Date'] = pd.to_datetime(self.history['Date'])
+
+        self.max_workers = max_workers
+        self.cache = cache
+        self.card_url = card_url
+        self.session = make_session(pool_size=max_workers * 8)
+        self.rate_limiter = HostRateLimiter(rate_limit, burst=8) if rate_limit else None
+        self.results_lock = threading.Lock()
+
+    def race_url(self, date, venue, race_no):
+        date = pd.to_datetime(date).strftime('%Y/%m/%d')
+        return self.card_url.format(date=date, venue=venue, race_no=race_no)
+
+    def scrape_race(self, date, venue, race_no, parent=None):
+        with tracing.attach(parent), tracing.span('inference.scrape_race', race_no=race_no):
+            return self._scrape_race(date, venue, race_no)
+
+    def _scrape_race(self, date, venue, race_no):
+        try:
+            df = scrape_current_race_no_odds(self.race_url(date, venue, race_no), session=self.session,
+                                             cache=self.cache, rate_limiter=self.rate_limiter)
+        except Exception as e:
+            print(f'race {race_no} could not be scraped: {e}')
+            return pd.DataFrame()
+
+        if len(df):
+            df['race_no'] = race_no
+        return df
+
+    def scrape_meeting(self, date, venue, race_nos=range(1, 12)):
+        """
+        runners of all races of the meeting, race cards are scraped concurrently
+        """
+        race_nos = list(race_nos)
+        with tracing.span('inference.scrape_meeting', races=len(race_nos)):
+            parent = tracing.current()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                frames = list(executor.map(lambda race_no: self.scrape_race(date, venue, race_no, parent), race_nos))
+
+        frames = [df for df in frames if len(df)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    @tracing.traced('inference.build_features')
+    def build_features(self, runners, date):
+        runners = runners.copy()
+        runners['Date'] = pd.to_datetime(date)
+
+        # the history read from csv holds distances as numbers, match them for the track/distance feature
+        distance = runners['Dist.'].to_numpy()
+        runners['Dist.'] = pd.to_numeric(runners['Dist.'], errors='coerce')
+        # read once, add_results may swap in a newer history meanwhile
+        history = self.history
+        if isinstance(history, FeatureStore):
+            runners = history.features_for(runners)
+        else:
+            runners = runner_history_features(history, runners)
+        runners['Dist.'] = distance
+
+        runners[numerical_cols] = self.num_imputer.transform(runners[numerical_cols])
+        return runners
+
+    def add_results(self, results):
+        """
+        append the cleaned results of a finished meeting so the next meeting's features include it
+        the history is extended on a copy and swapped in, races scored meanwhile use the old one throughout
+        """
+        with self.results_lock:
+            if isinstance(self.history, FeatureStore):
+                history = self.history.copy()
+                history.update(results)
+            else:
+                results = results.assign(Date=pd.to_datetime(results['Date']))
+                history = pd.concat([self.history, results], ignore_index=True)
+            self.history = history
+
+    def model_input(self, runners, date):
+        """
+        the runners with their features and the model input X, rows aligned
+        """
+        runners = self.build_features(runners, date)
+        X = runners[categorical_cols + numerical_cols].copy()
+        # categoricals as strings, missing values included, the way training.ipynb casts them
+        for col in categorical_cols:
+            X[col] = X[col].map(str)
+        # in the model's column order, models trained from a FeatureMatrix put the numerics first
+        return runners, X[self.model.feature_names_]
+
+    @staticmethod
+    def ranked(runners):
+        # best score first within each race
+        columns = ['race_no', 'Horse_name', 'Predicted_Score'] if 'race_no' in runners else ['Horse_name', 'Predicted_Score']
+        sort_by = columns[:-2] + ['Predicted_Score']
+        ascending = [True] * (len(sort_by) - 1) + [False]
+        return runners[columns].sort_values(sort_by, ascending=ascending).reset_index(drop=True)
+
+    @tracing.traced('inference.score')
+    def score(self, runners, date):
+        """
+        score already scraped runners of one or more races with a single predict call
+        """
+        runners, X = self.model_input(runners, date)
+        with tracing.span('model.predict', rows=len(X)):
+            runners['Predicted_Score'] = self.model.predict(X)
+        return self.ranked(runners)
+
+    def score_meeting(self, date, venue, race_nos=range(1, 12)):
+        """
+        scrape and score every race of the meeting
+        'date': race date, e.g. '2025/10/22'
+        'venue': 'ST' or 'HV'
+        'race_nos': races to score, races without a card are skipped
+        returns race_no, Horse_name and Predicted_Score, best score first within each race
+        """
+        with tracing.span('inference.score_meeting', date=str(date), venue=venue):
+            runners = self.scrape_meeting(date, venue, race_nos)
+            if runners.empty:
+                print(f'no races found for {date} @ {venue}')
+                return pd.DataFrame(columns=['race_no', 'Horse_name', 'Predicted_Score'])
+            return self.score(runners, date)
+
+    def score_race(self, date, venue, race_no):
+        return self.score_meeting(date, venue, [race_no])
@@ -0,0 +1,100 @@
+import time
+
+import pandas as pd
+
+from .race_function import combine_with_odds, fetch_race_card, obtain_odds, scrape_horses
+
+
+class OddsPoller:
+    """
+    re-scores a race as its win odds move, the card and horse profiles are scraped only once
+
+    'model': fitted model with the odds features (e.g. the CatBoostRanker used by 'prediction')
+    'interval': seconds between odds requests
+    'odds_source': OddsSource used for every poll, see py/odds.py
+    """
+
+    def __init__(self, race_url, odds_url, model, interval=30, odds_source=None, session=None, cache=None):
+        self.odds_url = odds_url
+        self.model = model
+        self.interval = interval
+        self.odds_source = odds_source
+
+        card = fetch_race_card(race_url, session=session)
+        if card is None:
+            raise ValueError(f'race card not found: {race_url}')
+
+        # static runner features, only the odds column changes between polls
+        self.runners = card.runner_frame(scrape_horses(card.horse_links, session=session, cache=cache))
+
+        self.last_odds = None
+        self.last_snapshot = None
+
+    def score(self, odds_df):
+        df = combine_with_odds(self.runners, odds_df)
+        X = df.iloc[:, :-1]
+        predictions = self.model.predict(X)
+
+        predicted = pd.DataFrame({
+            'Horse_name': df['Horse_name'].reset_index(drop=True),
+            'Win Odds': df['Win Odds'].reset_index(drop=True),
+            'Predicted_Score': predictions,
+        })
+        return predicted.sort_values('Predicted_Score', ascending=False)
+
+    def snapshot(self):
+        """
+        fetch the odds once, returns a new snapshot when they changed and None otherwise
+        a snapshot is a dict with 'time', 'odds' (list, by horse number) and 'predictions'
+        """
+        try:
+            odds_df = obtain_odds(self.odds_url, source=self.odds_source)
+        except Exception as e:
+            print(f'odds request failed for {self.odds_url}: {e}')
+            return None
+
+        odds = odds_df['Win Odds'].tolist()
+        if not odds or odds == self.last_odds:
+            return None
+
+        self.last_odds = odds
+        self.last_snapshot = {
+            'time': pd.Timestamp.now(),
+            'odds': odds,
+            'predictions': self.score(odds_df),
+        }
+        return self.last_snapshot
+
+    def poll(self, until=None, max_polls=None):
+        """
+        yield a snapshot every time the odds change
+        'until': stop polling after this time (e.g. the race start), as a timestamp or string
+        'max_polls': stop after this many odds requests
+        """
+        until = pd.Timestamp(until) if until is not None else None
+        polls = 0
+
+        while True:
+            started = time.monotonic()
+
+            snapshot = self.snapshot()
+            polls += 1
+            if snapshot is not None:
+                yield snapshot
+
+            if max_polls is not None and polls >= max_polls:
+                return
+            if until is not None and pd.Timestamp.now() >= until:
+                return
+
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+def odds_curve(snapshots):
+    """
+    one row per snapshot and one column per horse number, for plotting the odds movement
+    """
+    rows = {snapshot['time']: snapshot['odds'] for snapshot in snapshots}
+    curve = pd.DataFrame.from_dict(rows, orient='index')
+    curve.columns = range(1, len(curve.columns) + 1)
+    return curve.apply(pd.to_numeric, errors='coerce')
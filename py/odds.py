@@ -0,0 +1,329 @@
+import atexit
+import queue
+import re
+import threading
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+
+from . import tracing
+from .http_client import default_headers
+
+# graphql endpoint the betting site itself reads the odds from
+hkjc_odds_endpoint = 'https://info.cld.hkjc.com/graphql/base/'
+
+win_odds_query = '''
+query racing($date: String, $venueCode: String, $oddsTypes: [OddsType], $raceNo: Int) {
+  raceMeetings(date: $date, venueCode: $venueCode) {
+    pmPools(oddsTypes: $oddsTypes, raceNo: $raceNo) {
+      oddsType
+      oddsNodes {
+        combString
+        oddsValue
+      }
+    }
+  }
+}
+'''
+
+
+def parse_odds_url(odds_url):
+    """
+    split a betting page url like 'https://bet.hkjc.com/en/racing/wp/2025-09-07/ST/2'
+    into ('2025-09-07', 'ST', 2)
+    """
+    match = re.search(r'/(\d{4}-\d{2}-\d{2})/([A-Z]{2})/(\d+)', odds_url)
+    if not match:
+        raise ValueError(f'can\'t read date, venue and race number from {odds_url}')
+    return match.group(1), match.group(2), int(match.group(3))
+
+
+def parse_odds_table(html):
+    """
+    win odds from the rendered odds table of the betting page, one row per horse number
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    odd_table = soup.select_one('table.rc-odds-table.pr')
+    if odd_table is None:
+        print('odds table not found')
+        return pd.DataFrame(columns=['Win Odds'])
+
+    header_row = odd_table.select_one('tr.rc-odds-table-header')
+    headers = [cell.get_text().strip() for cell in header_row.find_all('td')] if header_row else []
+
+    if 'Win' not in headers:
+        print('can\'t find win odds in odds url')
+        return pd.DataFrame(columns=['Win Odds'])
+
+    odds_index = headers.index('Win')
+    odds = []
+
+    for row in odd_table.select('tr.rc-odds-row'):
+        cells = row.find_all('td')
+        a_tag = cells[odds_index].find('a') if len(cells) > odds_index else None
+        odds.append(a_tag.get_text().strip() if a_tag else 'Unknown')
+
+    return pd.DataFrame(odds, columns=['Win Odds'])
+
+
+def parse_win_odds_json(payload):
+    """
+    win odds from the graphql response, one row per horse number, 'Unknown' for horses without odds
+    """
+    meetings = (payload.get('data') or {}).get('raceMeetings') or []
+    nodes = []
+    for meeting in meetings:
+        for pool in meeting.get('pmPools') or []:
+            if pool.get('oddsType') == 'WIN':
+                nodes.extend(pool.get('oddsNodes') or [])
+
+    odds_by_no = {}
+    for node in nodes:
+        try:
+            horse_no = int(node['combString'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        value = str(node.get('oddsValue') or '').strip()
+        odds_by_no[horse_no] = value if re.match(r'^\d+(\.\d+)?$', value) else 'Unknown'
+
+    if not odds_by_no:
+        print('no win odds in odds response')
+        return pd.DataFrame(columns=['Win Odds'])
+
+    odds = [odds_by_no.get(horse_no, 'Unknown') for horse_no in range(1, max(odds_by_no) + 1)]
+    return pd.DataFrame(odds, columns=['Win Odds'])
+
+
+class OddsSource:
+    """
+    where obtain_odds gets the win odds of a race from, 'fetch' returns a 'Win Odds' dataframe
+    """
+
+    def fetch(self, odds_url):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HttpOddsSource(OddsSource):
+    """
+    odds read straight from the json endpoint behind the betting page, no browser needed
+    'endpoint': graphql url, point it at a local stand-in server to run offline
+    """
+
+    def __init__(self, endpoint=hkjc_odds_endpoint, session=None, timeout=10):
+        self.endpoint = endpoint
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def fetch(self, odds_url):
+        date, venue, race_no = parse_odds_url(odds_url)
+        body = {
+            'operationName': 'racing',
+            'query': win_odds_query,
+            'variables': {'date': date, 'venueCode': venue, 'raceNo': race_no, 'oddsTypes': ['WIN']},
+        }
+        with tracing.span('odds.http'):
+            response = self.session.post(self.endpoint, json=body, headers=default_headers, timeout=self.timeout)
+            tracing.count('http.requests')
+            tracing.count('http.bytes', len(response.content))
+            response.raise_for_status()
+            return parse_win_odds_json(response.json())
+
+    def close(self):
+        self.session.close()
+
+
+class BrowserPool:
+    """
+    long lived headless chrome instances reused across races instead of one per call
+    'poll': seconds a waiting acquire sleeps between checks that the pool is still open
+    """
+
+    def __init__(self, size=1, headless=True, poll=0.5):
+        self.size = size
+        self.headless = headless
+        self.poll = poll
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        # every live driver, idle or checked out, so close() can quit them all
+        self.drivers = set()
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def _new_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        if self.headless:
+            options.add_argument('--headless')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-dev-shm-usage')
+        return webdriver.Chrome(options=options)
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError('browser pool is closed')
+
+    def acquire(self):
+        """
+        an idle driver, a new one while fewer than 'size' are alive, else waits for a release
+        raises RuntimeError once the pool is closed, waiting callers included
+        """
+        while True:
+            self._check_open()
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                # close() may have quit it in the meantime
+                self._check_open()
+                return driver
+
+            with self.lock:
+                self._check_open()
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+
+            if can_create:
+                try:
+                    driver = self._new_driver()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+                with self.lock:
+                    closed = self.closed
+                    if not closed:
+                        self.drivers.add(driver)
+                if closed:
+                    self._quit(driver)
+                    self._check_open()
+                return driver
+
+            # woken up now and then so a close, or a broken driver freeing a slot, is noticed
+            try:
+                driver = self.idle.get(timeout=self.poll)
+            except queue.Empty:
+                continue
+            self._check_open()
+            return driver
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def release(self, driver, broken=False):
+        with self.lock:
+            # a driver the pool no longer tracks was already quit by close()
+            owned = driver in self.drivers
+            if owned and broken:
+                self.drivers.discard(driver)
+                self.created -= 1
+            if owned and not broken:
+                self.idle.put(driver)
+        if broken or not owned:
+            # a crashed browser is dropped, the next acquire starts a fresh one
+            self._quit(driver)
+
+    def close(self):
+        """
+        quit every browser of the pool, the ones still checked out included, later acquires raise
+        """
+        with self.lock:
+            self.closed = True
+            drivers = list(self.drivers)
+            self.drivers.clear()
+            self.created = 0
+        while True:
+            try:
+                self.idle.get_nowait()
+            except queue.Empty:
+                break
+        for driver in drivers:
+            self._quit(driver)
+
+
+class SeleniumOddsSource(OddsSource):
+    """
+    renders the betting page in a pooled browser, the working tab is reused for every race
+    """
+
+    def __init__(self, pool=None, wait=20):
+        self.pool = pool or BrowserPool()
+        self.wait = wait
+
+    def fetch(self, odds_url):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with tracing.span('odds.browser_acquire'):
+            driver = self.pool.acquire()
+        broken = False
+        try:
+            with tracing.span('odds.browser_render'):
+                driver.get(odds_url)
+                WebDriverWait(driver, self.wait).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, 'table.rc-odds-table.pr'))
+                )
+                html = driver.page_source
+        except Exception as e:
+            # a timeout leaves the browser usable, anything else may have killed it
+            broken = type(e).__name__ != 'TimeoutException'
+            raise
+        finally:
+            self.pool.release(driver, broken=broken)
+
+        with tracing.span('odds.parse'):
+            return parse_odds_table(html)
+
+    def close(self):
+        self.pool.close()
+
+
+class FallbackOddsSource(OddsSource):
+    """
+    tries each source in turn until one returns odds
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+
+    def fetch(self, odds_url):
+        for source in self.sources:
+            try:
+                odds = source.fetch(odds_url)
+            except Exception as e:
+                tracing.count('odds.fallbacks')
+                print(f'{type(source).__name__} failed for {odds_url}: {e}')
+                continue
+            if len(odds):
+                return odds
+        return pd.DataFrame(columns=['Win Odds'])
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+
+_default_source = None
+_default_lock = threading.Lock()
+
+
+def default_odds_source():
+    # json endpoint first, the shared browser pool only when that fails
+    global _default_source
+    with _default_lock:
+        if _default_source is None:
+            _default_source = FallbackOddsSource([HttpOddsSource(), SeleniumOddsSource()])
+            atexit.register(_default_source.close)
+        return _default_source
@@ -0,0 +1,550 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import joblib
+import pandas as pd
+from catboost import CatBoostRanker
+
+from . import cleaning, feature_matrix, feature_store, features, history_store, tracing, updater
+from .cleaning import clean_race_data
+from .evaluation import mean_ndcg
+from .feature_matrix import FeatureMatrix, build_feature_matrix, date_cutoffs
+from .feature_store import FeatureStore
+from .features import add_history_features
+from .history_store import HistoryStore
+from .updater import update_history
+
+# files and folders the stages hand to each other, relative to the pipeline root
+# ('history' is the HistoryStore folder, which lives outside of it)
+artifacts = {
+    'cleaned': 'cleaned',
+    'cleaned_data': 'cleaned_data.csv',
+    'feature_store': 'feature_store.pkl',
+    'feature_matrix': 'feature_matrix',
+    'model': 'model',
+}
+
+# the parameters of training.ipynb
+train_params = dict(
+    iterations=1500,
+    learning_rate=0.01,
+    depth=6,
+    loss_function='YetiRank',
+    eval_metric='NDCG:top=4',
+    l2_leaf_reg=10,
+    random_strength=5,
+    bagging_temperature=2,
+    has_time=True,
+    verbose=0,
+    early_stopping_rounds=300,
+)
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Fingerprints:
+    """
+    content hashes of files and folders, a file is only read again when its size, mtime or inode changed
+    'known': {path: [size, mtime_ns, inode, sha1]} from an earlier run
+    """
+
+    def __init__(self, known=None):
+        self.known = known or {}
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        with self.lock:
+            known = self.known.get(path)
+        if known is not None and known[:3] == key:
+            return known[3]
+
+        digest = _file_digest(path)
+        with self.lock:
+            self.known[path] = key + [digest]
+        return digest
+
+    def path(self, path):
+        """
+        sha1 of a file, or of the names and contents of every file in a folder, None when missing
+        """
+        if not os.path.exists(path):
+            return None
+        if os.path.isfile(path):
+            return self.file(path)
+
+        digest = hashlib.sha1()
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith('.tmp'):
+                    continue
+                full = os.path.join(dirpath, name)
+                digest.update(f'{os.path.relpath(full, path)}:{self.file(full)}\n'.encode())
+        return digest.hexdigest()
+
+
+def source_digest(modules):
+    # the source of the modules a stage runs, editing them reruns the stage
+    return _digest([_file_digest(module.__file__) for module in modules])
+
+
+class Stage:
+    """
+    one step of the pipeline
+
+    'name': stage name, also its key in the state file
+    'run': function(pipeline) writing the outputs, may return a dict kept in the state (see Pipeline.record);
+           function(pipeline, key, path) for a partitioned stage
+    'inputs' / 'outputs': artifact names, a stage runs after the stages writing its inputs
+    'code': modules whose source is part of the fingerprint
+    'params': function(pipeline) returning the settings that are part of the fingerprint
+    'partitions': function(pipeline) -> {key: input file} for a stage run per partition, only new and
+                  changed partitions are run and 'drop(pipeline, key)' is called for the ones gone
+    'always': run every time, for stages reading from outside the pipeline (the racing site)
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), code=(), params=None, partitions=None, drop=None,
+                 always=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = list(code)
+        self.params = params
+        self.partitions = partitions
+        self.drop = drop
+        self.always = always
+
+
+def _write_atomic(path, write):
+    write(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+# update: new meetings from the racing site into the history store
+
+def update_stage(pipeline):
+    added = update_history(HistoryStore(pipeline.path('history')), pipeline.fixtures)
+    return {'rows_added': len(added)}
+
+
+# clean: clean_race_data per stored file, each meeting (or compacted season) cleaned on its own
+
+def raw_partitions(pipeline):
+    store = HistoryStore(pipeline.path('history'))
+    partitions = {}
+    for path in store.partitions():
+        # season=2025-26/date=2025-10-19/part-0.parquet -> season=2025-26_date=2025-10-19
+        folder = os.path.relpath(os.path.dirname(path), store.root)
+        partitions[folder.replace(os.sep, '_')] = path
+    return partitions
+
+
+def _cleaned_path(pipeline, key):
+    return os.path.join(pipeline.path('cleaned'), f'{key}.parquet')
+
+
+def clean_partition(pipeline, key, path):
+    df = clean_race_data(HistoryStore(pipeline.path('history')).read_file(path), start_date=None)
+    os.makedirs(pipeline.path('cleaned'), exist_ok=True)
+    _write_atomic(_cleaned_path(pipeline, key), lambda tmp: df.to_parquet(tmp, index=False))
+
+
+def drop_partition(pipeline, key):
+    path = _cleaned_path(pipeline, key)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def cleaned_rows(pipeline, keys=None):
+    """
+    cleaned rows of the given partitions (default all) in meeting order, from 'start_date' on
+    """
+    keys = list(raw_partitions(pipeline)) if keys is None else keys
+    frames = [pd.read_parquet(_cleaned_path(pipeline, key)) for key in keys]
+    frames = [df for df in frames if len(df)]
+    if not frames:
+        return pd.DataFrame(columns=cleaning.cleaned_columns)
+
+    df = pd.concat(frames, ignore_index=True)
+    if pipeline.start_date is not None:
+        df = df[df['Date'] > pd.to_datetime(pipeline.start_date, format='%d/%m/%y')]
+    return df
+
+
+# features: the form features over the whole history, the cleaned_data csv of cleaning_data.ipynb
+
+def features_stage(pipeline):
+    # a horse's rolling features follow jockey then date order (see add_history_features), so a new
+    # meeting can change earlier rows and the features are rebuilt from all cleaned partitions
+    df = add_history_features(cleaned_rows(pipeline))
+    _write_atomic(pipeline.path('cleaned_data'), lambda tmp: df.to_csv(tmp, index=False))
+    return {'rows': len(df)}
+
+
+def read_cleaned_data(path):
+    df = pd.read_csv(path)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+# feature_store: the running feature state of inference, new meetings are folded in
+
+def _store_rows(df):
+    # distances as numbers, the way the cleaned_data csv reads back and the inference runners are matched
+    return df.assign(**{'Dist.': pd.to_numeric(df['Dist.'], errors='coerce')})
+
+
+def feature_store_stage(pipeline):
+    path = pipeline.path('feature_store')
+    partitions = pipeline.record('clean')['partitions']
+    previous = pipeline.record('feature_store') or {}
+    folded = previous.get('folded', {})
+
+    # only meetings added since the last build and all newer than it: update the saved store
+    unchanged = previous.get('settings') == pipeline.settings('feature_store') and \
+        all(partitions.get(key) == digest for key, digest in folded.items())
+    new = [key for key in raw_partitions(pipeline) if key not in folded]
+    if folded and unchanged and os.path.exists(path):
+        store = FeatureStore.load(path)
+        rows = cleaned_rows(pipeline, new)
+        if rows.empty or store.last_date is None or rows['Date'].min() > store.last_date:
+            store.update(_store_rows(rows))
+            _write_atomic(path, store.save)
+            return {'folded': partitions, 'incremental': len(new)}
+
+    store = FeatureStore.from_history(_store_rows(cleaned_rows(pipeline)))
+    _write_atomic(path, store.save)
+    return {'folded': partitions, 'incremental': 0}
+
+
+# feature_matrix and model: training.ipynb
+
+def feature_matrix_stage(pipeline):
+    path = pipeline.path('feature_matrix')
+    df = read_cleaned_data(pipeline.path('cleaned_data'))
+
+    # built next to the old matrix and swapped in, a failed build leaves the old one usable
+    build_feature_matrix(df, path + '.tmp')
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(path + '.tmp', path)
+    return {'rows': len(df)}
+
+
+def train_stage(pipeline):
+    fm = FeatureMatrix(pipeline.path('feature_matrix'))
+
+    # 80% of the days for training and validation, 80% of those for training, as in training.ipynb
+    train, val, test = fm.split_dates(*date_cutoffs(fm.date))
+
+    num_imputer = train.fit_imputer(strategy='median')
+    model = CatBoostRanker(**pipeline.train_params, allow_writing_files=False)
+    model.fit(train.pool(num_imputer), eval_set=val.pool(num_imputer))
+
+    model_dir = pipeline.path('model')
+    os.makedirs(model_dir, exist_ok=True)
+    _write_atomic(os.path.join(model_dir, 'catboost_ranker.cbm'), lambda tmp: model.save_model(tmp, format='cbm'))
+    _write_atomic(os.path.join(model_dir, 'num_imputer.pkl'), lambda tmp: joblib.dump(num_imputer, tmp))
+
+    if not len(test):
+        return {'test_ndcg@4': None}
+    ndcg = mean_ndcg(test.label, model.predict(test.pool(num_imputer)), test.group_id, k=4)
+    return {'test_ndcg@4': round(float(ndcg), 4)}
+
+
+def default_stages():
+    return [
+        Stage('update', update_stage, outputs=['history'], code=[updater], always=True),
+        Stage('clean', clean_partition, inputs=['history'], outputs=['cleaned'], code=[cleaning, history_store],
+              partitions=raw_partitions, drop=drop_partition),
+        Stage('features', features_stage, inputs=['cleaned'], outputs=['cleaned_data'], code=[features],
+              params=lambda pipeline: pipeline.start_date),
+        Stage('feature_store', feature_store_stage, inputs=['cleaned'], outputs=['feature_store'],
+              code=[feature_store], params=lambda pipeline: pipeline.start_date),
+        Stage('feature_matrix', feature_matrix_stage, inputs=['cleaned_data'], outputs=['feature_matrix'],
+              code=[feature_matrix]),
+        Stage('train', train_stage, inputs=['feature_matrix'], outputs=['model'],
+              params=lambda pipeline: pipeline.train_params),
+    ]
+
+
+class Pipeline:
+    """
+    update -> clean -> features / feature_store -> feature_matrix -> train, rerunning only what changed
+
+    every stage declares the artifacts it reads and writes; a stage is skipped when the content
+    fingerprints of its inputs, its code and its settings match the last run and its outputs are
+    untouched. 'clean' runs per stored meeting, so a new meeting cleans one partition, and stages
+    that don't depend on each other (features and feature_store) run at the same time
+
+    'root': folder of the outputs and of 'pipeline_state.json'
+    'history': HistoryStore folder, 'fixtures': fixtures csv for the update stage
+    'start_date': races on or before this date (dd/mm/yy) are left out of the features, as in cleaning_data.ipynb
+    'max_workers': stages, or partitions of a stage, run at the same time
+    """
+
+    def __init__(self, root='../data/pipeline', history='../data/history', fixtures='../data/fixtures/fixtures.csv',
+                 start_date='04/09/20', max_workers=4, train_params=train_params, stages=None):
+        self.root = root
+        self.history = history
+        self.fixtures = fixtures
+        self.start_date = start_date
+        self.max_workers = max_workers
+        self.train_params = dict(train_params)
+        self.stages = {stage.name: stage for stage in (stages or default_stages())}
+
+        self.producers = {artifact: stage.name for stage in self.stages.values() for artifact in stage.outputs}
+        for name in self.stages:
+            if name in self.upstream(name):
+                raise ValueError(f"stage '{name}' reads its own outputs through {sorted(self.upstream(name) - {name})}, "
+                                 f"the stages must not form a cycle")
+        self.state_path = os.path.join(root, 'pipeline_state.json')
+        self.lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        self.state = {'stages': {}, 'files': {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        self.fingerprints = Fingerprints(self.state['files'])
+
+    def path(self, artifact):
+        if artifact == 'history':
+            return self.history
+        return os.path.join(self.root, artifacts[artifact])
+
+    def record(self, name):
+        """
+        what the last successful run of a stage left in the state, None before its first run
+        """
+        with self.lock:
+            return self.state['stages'].get(name)
+
+    def _save_state(self, name=None, record=None):
+        with self.lock:
+            if name is not None:
+                self.state['stages'][name] = record
+            _write_atomic(self.state_path, lambda tmp: _dump_json(self.state, tmp))
+
+    def upstream(self, name):
+        # every stage 'name' reads from, directly or not
+        found = set()
+        todo = [name]
+        while todo:
+            for artifact in self.stages[todo.pop()].inputs:
+                producer = self.producers.get(artifact)
+                if producer is not None and producer not in found:
+                    found.add(producer)
+                    todo.append(producer)
+        return found
+
+    def plan(self, targets=None, skip=()):
+        """
+        the stages needed for 'targets' (default all) in dependency order, without the 'skip' ones
+        """
+        targets = list(self.stages) if targets is None else targets
+        selected = set(targets)
+        for name in targets:
+            selected |= self.upstream(name)
+        return [name for name in self.stages if name in selected and name not in skip]
+
+    def settings(self, name):
+        """
+        fingerprint of the code and settings of a stage, without its inputs
+        """
+        stage = self.stages[name]
+        return _digest([source_digest(stage.code), stage.params(self) if stage.params else None])
+
+    def _fingerprint(self, stage):
+        inputs = {artifact: self.fingerprints.path(self.path(artifact)) for artifact in stage.inputs}
+        missing = [artifact for artifact, digest in inputs.items() if digest is None]
+        if missing:
+            raise FileNotFoundError(f'{stage.name} is missing its input(s) {missing}')
+        return inputs, self.settings(stage.name)
+
+    def _outputs_intact(self, stage, previous):
+        # no outputs recorded while a partitioned stage is part way, its partitions are checked instead
+        if previous['outputs'] is None:
+            return True
+        return all(self.fingerprints.path(self.path(artifact)) == previous['outputs'].get(artifact)
+                   for artifact in stage.outputs)
+
+    def run_stage(self, name, force=False):
+        """
+        run one stage if its inputs, code or settings changed, returns its status and what it reported
+        """
+        stage = self.stages[name]
+        if stage.partitions is not None:
+            return self._run_partitioned(stage, force)
+
+        inputs, settings = self._fingerprint(stage)
+        key = _digest([inputs, settings])
+        previous = self.record(name)
+        if (not force and not stage.always and previous is not None and previous['key'] == key
+                and self._outputs_intact(stage, previous)):
+            return {'status': 'up to date'}
+
+        started = time.perf_counter()
+        with tracing.span(f'pipeline.{name}'):
+            report = stage.run(self) or {}
+        seconds = time.perf_counter() - started
+
+        record = dict(report, key=key, settings=settings,
+                      outputs={a: self.fingerprints.path(self.path(a)) for a in stage.outputs},
+                      seconds=round(seconds, 3), finished=pd.Timestamp.now().isoformat(timespec='seconds'))
+        self._save_state(name, record)
+        summary = {k: v for k, v in report.items() if not isinstance(v, dict)}
+        return dict(summary, status='ran', seconds=round(seconds, 3))
+
+    def _run_partitioned(self, stage, force):
+        _, settings = self._fingerprint(stage)
+        previous = self.record(stage.name)
+
+        done = {}
+        if not force and previous is not None and previous['settings'] == settings \
+                and self._outputs_intact(stage, previous):
+            done = dict(previous['partitions'])
+
+        partitions = stage.partitions(self)
+        digests = {key: self.fingerprints.file(path) for key, path in partitions.items()}
+        todo = [key for key in partitions if done.get(key) != digests[key]]
+        gone = [key for key in done if key not in partitions]
+        if not todo and not gone and previous is not None and done:
+            return {'status': 'up to date', 'partitions': len(partitions)}
+
+        started = time.perf_counter()
+        with tracing.span(f'pipeline.{stage.name}', partitions=len(todo)):
+            for key in gone:
+                stage.drop(self, key)
+                del done[key]
+
+            parent = tracing.current()
+
+            def run_partition(key):
+                with tracing.attach(parent):
+                    stage.run(self, key, partitions[key])
+                return key
+
+            # every finished partition is saved, an interrupted first run carries on where it stopped
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for key in executor.map(run_partition, todo):
+                    done[key] = digests[key]
+                    self._save_state(stage.name, {'settings': settings, 'partitions': dict(done), 'outputs': None})
+        seconds = time.perf_counter() - started
+
+        record = {
+            'settings': settings,
+            'partitions': done,
+            'outputs': {a: self.fingerprints.path(self.path(a)) for a in stage.outputs},
+            'seconds': round(seconds, 3),
+            'finished': pd.Timestamp.now().isoformat(timespec='seconds'),
+        }
+        self._save_state(stage.name, record)
+        return {'status': 'ran', 'partitions': len(partitions), 'rerun': len(todo), 'dropped': len(gone),
+                'seconds': round(seconds, 3)}
+
+    def run(self, targets=None, skip=(), force=()):
+        """
+        bring 'targets' (default every stage) up to date, independent stages in parallel
+        'skip': stages left as they are, e.g. ['update'] to work offline
+        'force': stages rerun whatever their fingerprints say
+        returns {stage: report}, a failed stage is reported with its error and its dependents are not run
+        """
+        order = self.plan(targets, skip)
+        pending = list(order)
+        reports = {}
+        failed = set()
+
+        with tracing.span('pipeline.run', stages=len(order)):
+            parent = tracing.current()
+
+            def run_stage(name):
+                with tracing.attach(parent):
+                    return self.run_stage(name, force=name in force)
+
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+                running = {}
+                while pending or running:
+                    for name in list(pending):
+                        waiting_for = self.upstream(name) & (set(pending) | set(running.values()))
+                        if not waiting_for:
+                            pending.remove(name)
+                            running[executor.submit(run_stage, name)] = name
+
+                    if not running:
+                        # nothing can start and nothing will finish, the stages wait on each other
+                        stuck = {name: sorted(self.upstream(name) & set(pending)) for name in pending}
+                        raise ValueError(f'stages waiting on each other, none can run: {stuck}')
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        try:
+                            reports[name] = future.result()
+                        except Exception as e:
+                            print(f'{name} failed: {e}')
+                            reports[name] = {'status': 'failed', 'error': str(e)}
+                            failed.add(name)
+                        else:
+                            print(f'{name}: ' + ', '.join(f'{k} {v}' for k, v in reports[name].items()))
+
+                    for name in [name for name in pending if self.upstream(name) & failed]:
+                        pending.remove(name)
+                        reports[name] = {'status': 'not run', 'error': 'an earlier stage failed'}
+                        failed.add(name)
+
+        self._save_state()
+        return reports
+
+
+def _dump_json(value, path):
+    with open(path, 'w') as f:
+        json.dump(value, f, indent=1, default=str)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='update -> clean -> features -> train, rerunning only what changed')
+    parser.add_argument('stages', nargs='*', help='stages to bring up to date (with the ones they read from), '
+                                                  'default all: ' + ', '.join(stage.name for stage in default_stages()))
+    parser.add_argument('--root', default='data/pipeline')
+    parser.add_argument('--history', default='data/history')
+    parser.add_argument('--fixtures', default='data/fixtures/fixtures.csv')
+    parser.add_argument('--start-date', default='04/09/20', help="first races left out (dd/mm/yy), 'none' keeps all")
+    parser.add_argument('--skip', nargs='+', default=[], help="stages left as they are, e.g. '--skip update' offline")
+    parser.add_argument('--force', nargs='+', default=[], help='stages rerun even when up to date')
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--dry-run', action='store_true', help='only print the stages that would be considered')
+    args = parser.parse_args()
+
+    pipeline = Pipeline(root=args.root, history=args.history, fixtures=args.fixtures,
+                        start_date=None if args.start_date.lower() == 'none' else args.start_date,
+                        max_workers=args.max_workers)
+    if args.dry_run:
+        print(' -> '.join(pipeline.plan(args.stages or None, args.skip)))
+        return
+    reports = pipeline.run(args.stages or None, skip=args.skip, force=args.force)
+    if any(report['status'] in ('failed', 'not run') for report in reports.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,15 @@ import pandas as pd
 from bs4 import BeautifulSoup
 import re
 import numpy as np
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from urllib.parse import urljoin
+
+from . import tracing
+from .cleaning import split_colour_sex, split_origin_age
+from .horse_profile import parse_horse_profile
+from .http_client import fetch, fetch_all
+from .odds import default_odds_source
+
+hkjc_base_url = 'https://racing.hkjc.com'
 
 # Dictionaries for track conditions
 turf_going_dict = {
@@ -69,182 +73,202 @@ def get_race_info(soup):
 
     return venue, track, course, distance, condition, race_class
 
-def get_horse_info(soup):
+def _parse_starter_table(soup, base_url):
+    # one pass over the starter table for both the runner fields and the horse links
     header = ['Act.Wt.', 'Jockey', 'gate_position', 'Trainer', 'Rtg.', 'Declar.Horse Wt.']
     rows = []
+    all_links = []
 
     table = soup.find('table', class_='starter f_tac f_fs13 draggable hiddenable')
     if not table:
         print('no table found')
-        return pd.DataFrame(columns=header)
-
-    header_row = table.find('tr')
-    headers = [td.get_text(strip=True) for td in header_row.find_all('td')]
-
-    wt_index = headers.index('Wt.')
-    jockey_index = headers.index('Jockey')
-    draw_index = headers.index('Draw')
-    trainer_index = headers.index('Trainer')
-    rtg_index = headers.index('Rtg.')
-    horse_weight_index = headers.index('Horse Wt. (Declaration)')
-
-    for row in table.find_all('tr')[1:]:
-        cells = row.find_all('td')
-        if len(cells) > max(wt_index, jockey_index, draw_index, trainer_index, rtg_index, horse_weight_index):
-            data = [
-                cells[wt_index].get_text(strip=True),
-                cells[jockey_index].get_text(strip=True),
-                cells[draw_index].get_text(strip=True),
-                cells[trainer_index].get_text(strip=True),
-                cells[rtg_index].get_text(strip=True),
-                cells[horse_weight_index].get_text(strip=True)
-            ]
-            rows.append(data)
-
-    return pd.DataFrame(rows, columns=header)
+        return pd.DataFrame(columns=header), all_links
+
+    trs = table.find_all('tr')
+    headers = [td.get_text(strip=True) for td in trs[0].find_all('td')]
+
+    # the runner fields and the horse links are read independently, a card missing one of the
+    # runner columns still gives the links
+    runner_headers = ['Wt.', 'Jockey', 'Draw', 'Trainer', 'Rtg.', 'Horse Wt. (Declaration)']
+    missing = [name for name in runner_headers if name not in headers]
+    if missing:
+        print(f'runner columns not found: {missing}')
+        runner_indices = None
+    else:
+        runner_indices = [headers.index(name) for name in runner_headers]
+        max_index = max(runner_indices)
 
-def get_race_horse(soup):
-    all_links = []
-    parti_horses = soup.find('table', class_='starter f_tac f_fs13 draggable hiddenable')
-    if not parti_horses:
-        print('horses table not found')
-        return all_links
-
-    header_row = parti_horses.find('tr')
-    headers = [td.get_text(strip=True) for td in header_row.find_all('td')]
-    if 'Horse' not in headers:
+    horse_col_index = headers.index('Horse') if 'Horse' in headers else None
+    if horse_col_index is None:
         print('no horse column found')
-        return all_links
 
-    horse_col_index = headers.index('Horse')
-    for row in parti_horses.find_all('tr')[1:]:
+    for row in trs[1:]:
         cells = row.find_all('td')
-        if len(cells) > horse_col_index:
-            td = cells[horse_col_index]
-            a_tag = td.find('a', href=True)
+        if runner_indices is not None and len(cells) > max_index:
+            rows.append([cells[index].get_text(strip=True) for index in runner_indices])
+
+        if horse_col_index is not None and len(cells) > horse_col_index:
+            a_tag = cells[horse_col_index].find('a', href=True)
             if a_tag:
                 href = a_tag['href']
                 if href.startswith('/'):
-                    href = 'https://racing.hkjc.com' + href
+                    href = urljoin(base_url, href)
                 all_links.append(href)
 
-    return all_links
-
-def scrape_horses(all_links):
-    header = ['Horse_name', 'Horse_id', 'Origin / Age', 'Colour / Sex', 'Import type', 'Sire', 'Dam', "Dam sire"]
-    rows = []
+    return pd.DataFrame(rows, columns=header), all_links
 
-    for ref in all_links:
-        try:
-            response = requests.get(ref, timeout=10)
-        except Exception as e:
-            print(f'Request exception for {ref}: {str(e)}')
-            continue
-
-        match = re.search(r'([A-Z]\d{3})$', ref)
-        horse_id = match.group(1) if match else None
+def get_horse_info(soup):
+    return _parse_starter_table(soup, hkjc_base_url)[0]
 
-        soup = BeautifulSoup(response.content, 'html.parser')
+def get_race_horse(soup):
+    return _parse_starter_table(soup, hkjc_base_url)[1]
+
+class RaceCard:
+    """
+    race card parsed once, shared by the scraping entry points
+    'race_info': (venue, track, course, distance, condition, race_class) as from get_race_info
+    'runners': per runner fields as from get_horse_info
+    'horse_links': profile links of the runners as from get_race_horse
+    """
+
+    def __init__(self, race_info, runners, horse_links):
+        self.venue, self.track, self.course, self.distance, self.condition, self.race_class = race_info
+        self.runners = runners
+        self.horse_links = horse_links
+
+    @property
+    def race_info(self):
+        return self.venue, self.track, self.course, self.distance, self.condition, self.race_class
+
+    @classmethod
+    def from_soup(cls, soup, base_url=None):
+        # relative horse links resolve against 'base_url', the card url or the hkjc site
+        runners, horse_links = _parse_starter_table(soup, base_url or hkjc_base_url)
+        return cls(get_race_info(soup), runners, horse_links)
+
+    @classmethod
+    def from_html(cls, html, base_url=None):
+        with tracing.span('race_card.parse'):
+            return cls.from_soup(BeautifulSoup(html, 'html.parser'), base_url)
+
+    @tracing.traced('race_card.runner_frame')
+    def runner_frame(self, df_basic_info):
+        """
+        combine the runner fields with the scraped horse profiles and the race metadata
+        """
+        df = pd.concat([self.runners, df_basic_info], axis=1)
+        df['rc'] = self.venue
+        df['track'] = self.track
+        df['course'] = self.course
+        df['Dist.'] = self.distance
+        df['track_condition'] = self.condition
+        df['RaceClass'] = self.race_class
+
+        df[['origin', 'age']] = split_origin_age(df['Origin / Age'])
+        df = df.drop(columns=['Origin / Age'])
+
+        df[['colour', 'sex']] = split_colour_sex(df['Colour / Sex'])
+        df = df.drop(columns=['Colour / Sex'])
 
-        name_tag = soup.find('span', class_='title_text')
-        horse_name = 'na'
-        if name_tag:
-            match = re.match(r'^([^\(]+)', name_tag.get_text())
-            horse_name = match.group(1).strip() if match else name_tag.get_text()
+        return df
 
-        def get_info(label_text):
-            label = soup.find('td', string=lambda text: text and label_text in text)
-            return label.find_next().find_next().get_text(strip=True) if label else 'na'
+@tracing.traced('race_card.fetch')
+def fetch_race_card(race_url, session=None, rate_limiter=None, timeout=10):
+    """
+    RaceCard of the race at 'race_url', None when the card cannot be fetched
+    'rate_limiter': optional HostRateLimiter shared with the horse profile requests
+    'timeout': seconds before a stalled request is given up
+    """
+    try:
+        response = fetch(race_url, session=session, rate_limiter=rate_limiter, timeout=timeout)
+    except Exception as e:
+        tracing.count('http.errors')
+        print(f'Request exception for {race_url}: {str(e)}')
+        return None
 
-        origin_info = get_info('Country of Origin')
-        colour_info = get_info('Colour / Sex')
-        import_info = get_info('Import Type')
-        sire_info = get_info('Sire')
-        dam_info = get_info('Dam')
-        dam_sire_info = get_info("Dam's Sire")
+    if response.status_code != 200:
+        print('races not found')
+        return None
+
+    return RaceCard.from_html(response.text, base_url=race_url)
+
+@tracing.traced()
+def scrape_horses(all_links, max_workers=8, rate_limit=5, session=None, cache=None, parser=None, rate_limiter=None):
+    """
+    scrape the profile page of every horse in 'all_links', one row per link in the order of 'all_links',
+    a failed request gives a row of 'na' with the horse id of its link
+    'max_workers': number of pages fetched concurrently, 1 fetches one after another
+    'rate_limit': maximum requests per second to the same host, None for no limit
+    'rate_limiter': optional HostRateLimiter shared across calls, used instead of 'rate_limit'
+    'session': optional requests session to reuse keep-alive connections across calls
+    'cache': optional HorseProfileCache, horses found in it are not downloaded again
+    'parser': html backend for parse_horse_profile, defaults to the fastest one installed
+    """
+    header = ['Horse_name', 'Horse_id', 'Origin / Age', 'Colour / Sex', 'Import type', 'Sire', 'Dam', "Dam sire"]
+    rows = [None] * len(all_links)
 
-        rows.append([horse_name, horse_id, origin_info, colour_info, import_info, sire_info, dam_info, dam_sire_info])
+    horse_ids = []
+    for ref in all_links:
+        match = re.search(r'([A-Z]\d{3})$', ref)
+        horse_ids.append(match.group(1) if match else None)
 
-    return pd.DataFrame(rows, columns=header)
+    to_fetch = []
+    for i, horse_id in enumerate(horse_ids):
+        record = cache.get(horse_id) if cache is not None and horse_id is not None else None
+        if record is not None:
+            rows[i] = [record[col] for col in header]
+        else:
+            to_fetch.append(i)
 
-def clean_origin_age(text):
-    parts = str(text).split('/')
-    origin = parts[0].strip()
-    age = parts[1].strip() if len(parts) > 1 else None
-    return origin, age
+    if cache is not None:
+        tracing.count('cache.hits', len(all_links) - len(to_fetch))
+        tracing.count('cache.misses', len(to_fetch))
 
-def clean_colour_sex(text):
-    parts = str(text).split('/')
-    colour = parts[0].strip()
-    sex = parts[-1].strip()
-    return colour, sex
+    responses = fetch_all([all_links[i] for i in to_fetch], session=session,
+                          max_workers=max_workers, rate_limit=rate_limit, rate_limiter=rate_limiter)
 
-def obtain_odds(odds_url):
-    options = Options()
-    options.add_argument('--headless')
-    driver = webdriver.Chrome(options=options)
+    with tracing.span('horse_profile.parse', pages=len(to_fetch)):
+        for i, response in zip(to_fetch, responses):
+            if response is None:
+                # keep a row for the failed request so the frame still lines up with the runners of the card
+                rows[i] = ['na' if col != 'Horse_id' else horse_ids[i] for col in header]
+                continue
 
-    try:
-        driver.get(odds_url)
-        wait = WebDriverWait(driver, 20)
-        odd_table = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'table.rc-odds-table.pr')))
-
-        header_cells = odd_table.find_element(By.CSS_SELECTOR, 'tr.rc-odds-table-header').find_elements(By.TAG_NAME, 'td')
-        headers = [cell.text.strip() for cell in header_cells]
-
-        if 'Win' not in headers:
-            print('can\'t find win odds in odds url')
-            return pd.DataFrame(columns=['Win Odds'])
-
-        odds_index = headers.index('Win')
-        odds = []
-
-        rows = odd_table.find_elements(By.CSS_SELECTOR, 'tr.rc-odds-row')
-        for row in rows:
-            cells = row.find_elements(By.TAG_NAME, 'td')
-            win_cell = cells[odds_index]
-            try:
-                a_tag = win_cell.find_element(By.TAG_NAME, 'a')
-                odds.append(a_tag.text.strip())
-            except:
-                odds.append('Unknown')
-
-        df = pd.DataFrame(odds, columns=['Win Odds'])
-        return df
+            record = parse_horse_profile(response.content, backend=parser)
+            record['Horse_id'] = horse_ids[i]
+            rows[i] = [record[col] for col in header]
 
-    finally:
-        driver.quit()
+            if cache is not None and response.status_code == 200 and record['Horse_name'] != 'na':
+                cache.put(horse_ids[i], dict(zip(header, rows[i])), html=response.content)
 
-def scrape_current_race(race_url, odds_url):
-    http_headers = {"User-Agent": "Mozilla/5.0 (compatible; HKJCScraper/1.0)"}
-    response = requests.get(race_url, headers=http_headers)
+    return pd.DataFrame(rows, columns=header)
 
-    if response.status_code != 200:
-        print('races not found')
+def obtain_odds(odds_url, source=None):
+    """
+    win odds of the race at 'odds_url'
+    'source': an OddsSource, defaults to the json endpoint with the pooled browser as fallback
+    """
+    if source is None:
+        source = default_odds_source()
+    with tracing.span('obtain_odds', source=type(source).__name__):
+        return source.fetch(odds_url)
+
+@tracing.traced()
+def scrape_current_race(race_url, odds_url, session=None, cache=None, odds_source=None, rate_limiter=None):
+    card = fetch_race_card(race_url, session=session, rate_limiter=rate_limiter)
+    if card is None:
         return pd.DataFrame()
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    venue, track, course, distance, condition, race_class = get_race_info(soup)
-    df_horse_in_race = get_horse_info(soup)
-    participating_horse_links = get_race_horse(soup)
-    df_basic_info = scrape_horses(participating_horse_links)
-
-    df = pd.concat([df_horse_in_race, df_basic_info], axis=1)
-    df['rc'] = venue
-    df['track'] = track
-    df['course'] = course
-    df['Dist.'] = distance
-    df['track_condition'] = condition
-    df['RaceClass'] = race_class
+    df = card.runner_frame(scrape_horses(card.horse_links, session=session, cache=cache, rate_limiter=rate_limiter))
 
-    df[['origin', 'age']] = df['Origin / Age'].apply(clean_origin_age).apply(pd.Series)
-    df = df.drop(columns=['Origin / Age'])
+    odds_df = obtain_odds(odds_url, source=odds_source)
+    return combine_with_odds(df, odds_df)
 
-    df[['colour', 'sex']] = df['Colour / Sex'].apply(clean_colour_sex).apply(pd.Series)
-    df = df.drop(columns=['Colour / Sex'])
-
-    odds_df = obtain_odds(odds_url)
+def combine_with_odds(df, odds_df):
+    """
+    join the runner frame from RaceCard.runner_frame with the win odds into the feature layout
+    of the model with odds, horse name last
+    """
     final_df = pd.concat([df, odds_df], axis=1)
 
     final_df.replace(['', 0, '0'], np.nan, inplace=True)
@@ -262,34 +286,13 @@ def scrape_current_race(race_url, odds_url):
 
     return final_df
 
-def scrape_current_race_no_odds(race_url):
-    http_headers = {"User-Agent": "Mozilla/5.0 (compatible; HKJCScraper/1.0)"}
-    response = requests.get(race_url, headers=http_headers)
-
-    if response.status_code != 200:
-        print('races not found')
+@tracing.traced()
+def scrape_current_race_no_odds(race_url, session=None, cache=None, rate_limiter=None):
+    card = fetch_race_card(race_url, session=session, rate_limiter=rate_limiter)
+    if card is None:
         return pd.DataFrame()
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    venue, track, course, distance, condition, race_class = get_race_info(soup)
-    df_horse_in_race = get_horse_info(soup)
-    participating_horse_links = get_race_horse(soup)
-    df_basic_info = scrape_horses(participating_horse_links)
-
-    df = pd.concat([df_horse_in_race, df_basic_info], axis=1)
-    df['rc'] = venue
-    df['track'] = track
-    df['course'] = course
-    df['Dist.'] = distance
-    df['track_condition'] = condition
-    df['RaceClass'] = race_class
-
-    df[['origin', 'age']] = df['Origin / Age'].apply(clean_origin_age).apply(pd.Series)
-    df = df.drop(columns=['Origin / Age'])
-
-    df[['colour', 'sex']] = df['Colour / Sex'].apply(clean_colour_sex).apply(pd.Series)
-    df = df.drop(columns=['Colour / Sex'])
+    df = card.runner_frame(scrape_horses(card.horse_links, session=session, cache=cache, rate_limiter=rate_limiter))
 
     # Define feature columns order same as training
     feature_cols = [
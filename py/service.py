@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from . import tracing
+from .inference import InferenceEngine
+
+
+def _race_key(date, venue, race_no):
+    return pd.Timestamp(date).strftime('%Y-%m-%d'), venue.upper(), int(race_no)
+
+
+def feature_key(race, runners, X):
+    """
+    hash of the model input of a race: every feature row with the horse names it is shown with,
+    a change in the declarations (jockey, weight, draw, scratchings) gives a new key
+    """
+    digest = hashlib.sha1(repr(race).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update('\x1f'.join(runners['Horse_name'].map(str)).encode())
+    return digest.hexdigest()
+
+
+class PredictionService:
+    """
+    InferenceEngine kept warm behind two caches, so repeated requests for a race skip the scrape and the model
+
+    'engine': InferenceEngine with the model, imputer and feature history already loaded
+    'card_ttl': seconds a scraped race card is trusted, after that the card is fetched again and the
+                race rescored only when its feature rows changed
+    'max_entries': scored races kept, least recently used dropped first
+
+    responses are cached by feature_key, i.e. by the feature rows the model saw, and kept as encoded json;
+    the card and the lock of a race are dropped once the card expired, invalidated or not, and no
+    request is using the lock
+    """
+
+    def __init__(self, engine, card_ttl=60, max_entries=2048):
+        self.engine = engine
+        self.card_ttl = card_ttl
+        self.max_entries = max_entries
+
+        self.lock = threading.Lock()
+        self.responses = OrderedDict()
+        # (date, venue, race_no) -> (expires, feature key) of the last card scraped
+        self.cards = {}
+        # (date, venue, race_no) -> [lock, requests holding or waiting for it]
+        self.race_locks = {}
+        self.purged_at = time.monotonic()
+        # bumped by add_results, a race scored with the features from before is not cached
+        self.generation = 0
+
+        self.hits = 0
+        self.rescored = 0
+        self.unchanged = 0
+
+    @contextmanager
+    def _race_lock(self, race):
+        # one scrape per race at a time, concurrent requests for it wait for the first one;
+        # counted under self.lock before waiting, so _forget never drops a lock a request is about to take
+        with self.lock:
+            self._purge(time.monotonic())
+            entry = self.race_locks.setdefault(race, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+
+    def _forget(self, races):
+        # called with self.lock held: drop the cards of 'races' and their locks, a lock still
+        # held or waited for is left to its requests (it is dropped with its card later)
+        for race in races:
+            self.cards.pop(race, None)
+            entry = self.race_locks.get(race)
+            if entry is not None and entry[1] == 0:
+                del self.race_locks[race]
+
+    def _purge(self, now):
+        # called with self.lock held: at most once per card_ttl, forget the cards that expired,
+        # so a long running service keeps state only for the races asked for recently
+        if now - self.purged_at < self.card_ttl:
+            return
+        self.purged_at = now
+        self._forget([race for race, card in self.cards.items() if card[0] < now])
+        self._forget([race for race in self.race_locks if race not in self.cards])
+
+    def _cached(self, race, now):
+        with self.lock:
+            card = self.cards.get(race)
+            if card is None or card[0] < now:
+                return None
+            body = self.responses.get(card[1])
+            if body is not None:
+                self.responses.move_to_end(card[1])
+                self.hits += 1
+            return body
+
+    def _store(self, key, body, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.responses[key] = body
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.max_entries:
+                self.responses.popitem(last=False)
+
+    def score_race(self, date, venue, race_no):
+        """
+        encoded json of the scored race: date, venue, race_no, the feature key and the runners
+        best score first, None when the race has no card
+        """
+        race = _race_key(date, venue, race_no)
+        body = self._cached(race, time.monotonic())
+        if body is not None:
+            return body
+
+        with self._race_lock(race):
+            # another request may have scored it while this one waited
+            body = self._cached(race, time.monotonic())
+            if body is not None:
+                return body
+
+            with tracing.span('service.score_race', race=list(race)):
+                generation = self.generation
+                runners = self.engine.scrape_race(race[0], race[1], race[2])
+                if runners.empty:
+                    return None
+
+                runners, X = self.engine.model_input(runners, race[0])
+                key = feature_key(race, runners, X)
+                with self.lock:
+                    body = self.responses.get(key)
+
+                if body is None:
+                    with tracing.span('model.predict', rows=len(X)):
+                        runners['Predicted_Score'] = self.engine.model.predict(X)
+                    scores = self.engine.ranked(runners)
+                    body = json.dumps({
+                        'date': race[0],
+                        'venue': race[1],
+                        'race_no': race[2],
+                        'key': key,
+                        'scored_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+                        'runners': scores[['Horse_name', 'Predicted_Score']].to_dict('records'),
+                    }).encode()
+                    self._store(key, body, generation)
+                    self.rescored += 1
+                else:
+                    tracing.count('service.unchanged')
+                    self.unchanged += 1
+
+            with self.lock:
+                if generation == self.generation:
+                    self.cards[race] = (time.monotonic() + self.card_ttl, key)
+            return body
+
+    def score_meeting(self, date, venue, race_nos=range(1, 12)):
+        """
+        encoded json list of the scored races of the meeting, races without a card are left out
+        """
+        race_nos = list(race_nos)
+        with ThreadPoolExecutor(max_workers=self.engine.max_workers) as executor:
+            bodies = list(executor.map(lambda race_no: self.score_race(date, venue, race_no), race_nos))
+        return b'[' + b','.join(body for body in bodies if body is not None) + b']'
+
+    def invalidate(self, date=None, venue=None, race_no=None):
+        """
+        forget the scraped cards matching the given fields (all of them by default), e.g. after
+        a late scratching, so the next request fetches the card again; returns the number dropped
+        """
+        with self.lock:
+            dropped = [
+                race for race in self.cards
+                if (date is None or race[0] == pd.Timestamp(date).strftime('%Y-%m-%d'))
+                and (venue is None or race[1] == venue.upper())
+                and (race_no is None or race[2] == int(race_no))
+            ]
+            self._forget(dropped)
+        return len(dropped)
+
+    def add_results(self, results):
+        """
+        fold the results of a finished meeting into the features, every cached score is dropped
+        the engine swaps in the new features, races being scored meanwhile finish with the old ones
+        and are not cached
+        """
+        self.engine.add_results(results)
+        with self.lock:
+            self.generation += 1
+            self._forget(list(self.cards))
+            self.responses.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'rescored': self.rescored,
+                'unchanged': self.unchanged,
+                'cached_races': len(self.cards),
+                'race_locks': len(self.race_locks),
+                'cached_responses': len(self.responses),
+                'card_ttl': self.card_ttl,
+            }
+
+
+def _race_nos(text):
+    # '1-11' or '1,3,5'
+    if '-' in text:
+        first, last = text.split('-')
+        return range(int(first), int(last) + 1)
+    return [int(part) for part in text.split(',')]
+
+
+def make_handler(service):
+    """
+    request handler of the service:
+      GET  /score/race?date=2025-10-22&venue=HV&race_no=4
+      GET  /score/meeting?date=2025-10-22&venue=HV[&races=1-9]
+      GET  /stats, /health
+      POST /invalidate[?date=...&venue=...&race_no=...]
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, body):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _query(self):
+            url = urlsplit(self.path)
+            return url.path.rstrip('/'), {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        def do_GET(self):
+            path, query = self._query()
+            try:
+                if path == '/score/race':
+                    body = service.score_race(query['date'], query['venue'], query['race_no'])
+                    if body is None:
+                        self._send(404, {'error': 'no race card found'})
+                    else:
+                        self._send(200, body)
+                elif path == '/score/meeting':
+                    self._send(200, service.score_meeting(query['date'], query['venue'],
+                                                          _race_nos(query.get('races', '1-11'))))
+                elif path == '/stats':
+                    self._send(200, service.stats())
+                elif path == '/health':
+                    self._send(200, {'status': 'ok'})
+                else:
+                    self._send(404, {'error': f'unknown path {path}'})
+            except KeyError as e:
+                self._send(400, {'error': f'missing parameter {e}'})
+            except Exception as e:
+                print(f'{self.path} failed: {e}')
+                self._send(500, {'error': str(e)})
+
+        def do_POST(self):
+            path, query = self._query()
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if path == '/invalidate':
+                dropped = service.invalidate(query.get('date'), query.get('venue'), query.get('race_no'))
+                self._send(200, {'invalidated': dropped})
+            else:
+                self._send(404, {'error': f'unknown path {path}'})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(service, host='127.0.0.1', port=8765):
+    """
+    run the service until interrupted
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f'prediction service on http://{host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local prediction service with the v2 model loaded once')
+    parser.add_argument('--model', default='model/v2/catboost_ranker_v2.cbm')
+    parser.add_argument('--imputer', default='model/v2/num_imputer_v2.pkl')
+    parser.add_argument('--history', default='data/cleaned_data_20251022.csv',
+                        help="cleaned data csv, or a saved FeatureStore ('.pkl')")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--card-ttl', type=float, default=60, help='seconds before a race card is fetched again')
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--rate-limit', type=float, default=5)
+    args = parser.parse_args()
+
+    engine = InferenceEngine(model_path=args.model, imputer_path=args.imputer, history=args.history,
+                             max_workers=args.max_workers, rate_limit=args.rate_limit)
+    serve(PredictionService(engine, card_ttl=args.card_ttl), args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
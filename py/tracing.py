@@ -0,0 +1,293 @@
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# HKJC_TRACE: '1' writes one json line per finished span to stderr, any other value is the log file
+# HKJC_TRACE_PROFILE: folder for a cProfile capture of every top level span ('1' for 'profiles')
+trace_env = 'HKJC_TRACE'
+profile_env = 'HKJC_TRACE_PROFILE'
+
+
+class _State:
+    def __init__(self):
+        self.enabled = False
+        self.out = None
+        self.profile_dir = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.ids = itertools.count(1)
+        self.records = None
+
+
+_state = _State()
+
+
+def _rss_mb():
+    # current resident memory from /proc, the peak where /proc is not available (macos),
+    # NaN where neither is (windows)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        if resource is None:
+            return float('nan')
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _stack():
+    stack = getattr(_state.local, 'stack', None)
+    if stack is None:
+        stack = _state.local.stack = []
+    return stack
+
+
+class _NullSpan:
+    """
+    what span() returns while tracing is off: entering, counting and tagging do nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, name, value=1):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Span:
+    """
+    one timed stage: wall time, memory before / after and the counters of everything run inside it,
+    the counters of a span are added to its parent when it ends
+    """
+
+    def __init__(self, name, attrs, parent=None):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.id = next(_state.ids)
+        self.path = f'{parent.path}/{name}' if parent is not None else name
+        self.counters = {}
+        self.profiler = None
+
+    def count(self, name, value=1):
+        with _state.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        _stack().append(self)
+        self.rss_start = _rss_mb()
+        if _state.profile_dir is not None and self.parent is None:
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # another profiler is already running in this process
+                self.profiler = None
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        rss = _rss_mb()
+        record = {
+            'span': self.name,
+            'path': self.path,
+            'id': self.id,
+            'parent': self.parent.id if self.parent is not None else None,
+            'thread': threading.current_thread().name,
+            'start': round(self.start, 6),
+            'seconds': round(seconds, 6),
+            'rss_mb': round(rss, 1),
+            'rss_delta_mb': round(rss - self.rss_start, 1),
+        }
+        if self.attrs:
+            record['attrs'] = self.attrs
+        with _state.lock:
+            if self.counters:
+                record['counters'] = dict(self.counters)
+            if self.parent is not None:
+                for name, value in self.counters.items():
+                    self.parent.counters[name] = self.parent.counters.get(name, 0) + value
+        if exc_type is not None:
+            record['error'] = f'{exc_type.__name__}: {exc}'
+        if self.profiler is not None:
+            record['profile'] = _save_profile(self.profiler, self)
+
+        _emit(record)
+        return False
+
+
+class _Attach:
+    # runs code of a worker thread as part of a span opened on another thread
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        _stack().append(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        stack = _stack()
+        if stack and stack[-1] is self.span:
+            stack.pop()
+        return False
+
+
+def _save_profile(profiler, span):
+    os.makedirs(_state.profile_dir, exist_ok=True)
+    path = os.path.join(_state.profile_dir, f'{span.name}-{span.id}.prof')
+    profiler.dump_stats(path)
+
+    # the slowest functions inline, the .prof file for snakeviz / pstats
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(15)
+    return {'path': path, 'top': text.getvalue().strip().splitlines()[-16:]}
+
+
+def _emit(record):
+    line = json.dumps(record, default=str)
+    with _state.lock:
+        if _state.records is not None:
+            _state.records.append(record)
+        if _state.out is not None:
+            _state.out.write(line + '\n')
+            _state.out.flush()
+
+
+def configure(enabled=True, path=None, profile_dir=None, keep=False):
+    """
+    switch tracing on or off from code instead of the environment
+    'path': file the json lines are appended to, None for stderr
+    'profile_dir': folder for a cProfile capture of every top level span, None for no profiling
+    'keep': also keep the records in memory, see records()
+    """
+    with _state.lock:
+        if _state.out is not None and _state.out is not sys.stderr:
+            _state.out.close()
+        _state.out = None
+        _state.records = [] if keep else None
+
+        if enabled and path is not None:
+            _state.out = open(path, 'a')
+        elif enabled and not keep:
+            _state.out = sys.stderr
+
+        _state.profile_dir = profile_dir if enabled else None
+        _state.enabled = enabled
+
+
+def configure_from_env():
+    trace = os.environ.get(trace_env, '')
+    profile = os.environ.get(profile_env, '')
+    if trace in ('', '0'):
+        configure(enabled=False)
+        return
+    configure(
+        path=None if trace == '1' else trace,
+        profile_dir=None if profile in ('', '0') else 'profiles' if profile == '1' else profile,
+    )
+
+
+def enabled():
+    return _state.enabled
+
+
+def records():
+    """
+    the span records kept in memory since configure(keep=True)
+    """
+    with _state.lock:
+        return list(_state.records or [])
+
+
+def current():
+    """
+    the innermost open span of this thread, None when there is none or tracing is off
+    """
+    if not _state.enabled:
+        return None
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def span(name, **attrs):
+    """
+    time a stage: 'with span('scrape_horses', horses=14):', nested spans are timed inside their parent
+    """
+    if not _state.enabled:
+        return _null_span
+    return Span(name, attrs, current())
+
+
+def attach(parent):
+    """
+    make 'parent' (from current() on the submitting thread) the parent of spans and counts in a worker thread
+    """
+    if not _state.enabled or parent is None:
+        return _null_span
+    return _Attach(parent)
+
+
+def count(name, value=1):
+    """
+    add to a counter of the innermost open span (e.g. 'http.requests', 'cache.hits')
+    """
+    if not _state.enabled:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].count(name, value)
+
+
+def traced(name=None):
+    """
+    decorator running the whole function in a span, named after the function by default
+    """
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}, current()):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+configure_from_env()
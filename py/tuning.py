@@ -0,0 +1,270 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRanker
+
+from . import tracing
+from .feature_matrix import FeatureMatrix, date_cutoffs
+
+# fixed settings of every trial, training.ipynb's
+base_params = dict(
+    iterations=1500,
+    loss_function='YetiRank',
+    eval_metric='NDCG:top=4',
+    has_time=True,
+    early_stopping_rounds=300,
+    verbose=0,
+)
+
+# the hand tuned settings of training.ipynb, run as trial 0 so every other trial is compared with them
+baseline_params = dict(depth=6, learning_rate=0.01, l2_leaf_reg=10, random_strength=5, bagging_temperature=2)
+
+# ('int', low, high), ('float', low, high), ('log', low, high) for a log-uniform float, or a list of choices
+search_space = {
+    'depth': ('int', 4, 8),
+    'learning_rate': ('log', 0.01, 0.1),
+    'l2_leaf_reg': ('log', 1, 30),
+    'random_strength': ('log', 0.5, 10),
+    'bagging_temperature': ('float', 0, 5),
+}
+
+
+def sample_params(space, seed, number):
+    """
+    settings of trial 'number', the same every time for a seed so a resumed search carries on with new ones
+    """
+    rng = np.random.default_rng([seed, number])
+    params = {}
+    for name, spec in space.items():
+        if isinstance(spec, list):
+            params[name] = spec[rng.integers(len(spec))]
+        elif spec[0] == 'int':
+            params[name] = int(rng.integers(spec[1], spec[2] + 1))
+        elif spec[0] == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(spec[1]), np.log(spec[2]))))
+        elif spec[0] == 'float':
+            params[name] = float(rng.uniform(spec[1], spec[2]))
+        else:
+            raise ValueError(f'unknown search space entry {name}: {spec}')
+    return params
+
+
+class MedianPruner:
+    """
+    stops a trial whose best validation score so far is below the median of the other trials at the same
+    iteration, checked every 'interval' iterations once 'warmup_steps' are done and 'warmup_trials'
+    trials have reached that iteration
+    """
+
+    def __init__(self, warmup_trials=5, warmup_steps=100, interval=50):
+        self.warmup_trials = warmup_trials
+        self.warmup_steps = warmup_steps
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def is_checkpoint(self, step):
+        return step >= self.warmup_steps and step % self.interval == 0
+
+    def report(self, step, value):
+        with self.lock:
+            self.values.setdefault(step, []).append(value)
+
+    def should_prune(self, step, value):
+        with self.lock:
+            others = self.values.get(step, [])
+            if len(others) < self.warmup_trials:
+                return False
+            return value < np.median(others)
+
+
+class _PruningCallback:
+    # catboost calls after_iteration after every tree, returning False stops the fit
+    def __init__(self, pruner, metric, stop):
+        self.pruner = pruner
+        self.metric = metric
+        self.stop = stop
+        self.best = -np.inf
+        self.intermediate = {}
+        self.pruned_at = None
+
+    def after_iteration(self, info):
+        if self.stop.is_set():
+            return False
+
+        values = info.metrics.get('validation', {})
+        name = next((key for key in values if key.split(';')[0] == self.metric), None)
+        if name is None or not values[name]:
+            return True
+        self.best = max(self.best, values[name][-1])
+
+        step = info.iteration
+        if not self.pruner.is_checkpoint(step):
+            return True
+        pruned = self.pruner.should_prune(step, self.best)
+        self.pruner.report(step, self.best)
+        self.intermediate[step] = self.best
+        if pruned:
+            self.pruned_at = step
+            return False
+        return True
+
+
+def read_trials(path):
+    """
+    the trials saved in a results file, a line cut short by an interrupted run is left out
+    """
+    trials = []
+    if not os.path.exists(path):
+        return trials
+    with open(path) as f:
+        for line in f:
+            try:
+                trials.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return trials
+
+
+def _append(path, record, lock):
+    with lock:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def trials_frame(trials):
+    """
+    one row per trial, best validation score first, the trial settings as columns
+    """
+    if not trials:
+        return pd.DataFrame()
+    df = pd.DataFrame([{k: v for k, v in trial.items() if k not in ('params', 'intermediate')} for trial in trials])
+    params = pd.DataFrame([trial['params'] for trial in trials])
+    df = pd.concat([df, params], axis=1)
+    return df.sort_values('value', ascending=False, na_position='last').reset_index(drop=True)
+
+
+def best_params(path):
+    """
+    base_params with the settings of the best finished trial of a results file, ready for CatBoostRanker
+    """
+    finished = [trial for trial in read_trials(path) if trial['status'] == 'complete']
+    if not finished:
+        raise ValueError(f'no finished trials in {path}')
+    best = max(finished, key=lambda trial: trial['value'])
+    return dict(base_params, **best['params'])
+
+
+def tune(matrix_path, n_trials=60, results_path='../data/tuning.jsonl', space=search_space, params=base_params,
+         baseline=baseline_params, cpu_budget=None, n_jobs=None, time_budget=None, pruner=None, seed=0,
+         border_count=254):
+    """
+    random search over 'space' for the CatBoostRanker, trials trained in threads on one quantized Pool
+
+    the training and validation races are those of training.ipynb (the test races are left alone), the train
+    Pool is quantized once and shared read only by every trial; trials run 'n_jobs' at a time with the
+    cores of 'cpu_budget' (default all) split over them, and the MedianPruner stops trials falling behind
+
+    'matrix_path': folder written by build_feature_matrix
+    'n_trials': trials of the search in total, those already in 'results_path' included
+    'results_path': json lines, one per finished or pruned trial; rerunning resumes after them
+    'params': fixed CatBoostRanker settings, 'baseline': settings of trial 0 (None to only sample)
+    'time_budget': seconds after which no new trial is started, the running ones are stopped
+    'border_count': quantization borders, fixed by the shared Pool
+    returns the trials as a dataframe, best NDCG@4 first
+    """
+    done = read_trials(results_path)
+    finished = {trial['trial'] for trial in done}
+    todo = [number for number in range(n_trials) if number not in finished]
+
+    pruner = pruner or MedianPruner()
+    # scores of the trials of an earlier run, so pruning carries on from where it was
+    for trial in done:
+        for step, value in trial.get('intermediate', {}).items():
+            pruner.report(int(step), value)
+
+    print(f'{len(finished)} trial(s) done, {len(todo)} to go')
+    if not todo:
+        return trials_frame(done)
+
+    cores = cpu_budget or os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs or cores, cores, len(todo)))
+    thread_count = max(1, cores // n_jobs)
+
+    with tracing.span('tuning.pools'):
+        fm = FeatureMatrix(matrix_path)
+        val_cutoff, test_cutoff = date_cutoffs(fm.date)
+        train, val, _ = fm.split_dates(val_cutoff, test_cutoff)
+        num_imputer = train.fit_imputer(strategy='median')
+        train_pool = train.pool(num_imputer)
+        train_pool.quantize(border_count=border_count)
+        val_pool = val.pool(num_imputer)
+
+    metric = params['eval_metric']
+    stop = threading.Event()
+    lock = threading.Lock()
+    started = time.perf_counter()
+    parent = tracing.current()
+
+    def run_trial(number):
+        trial_params = dict(baseline) if number == 0 and baseline is not None else sample_params(space, seed, number)
+        callback = _PruningCallback(pruner, metric, stop)
+        model = CatBoostRanker(**{**params, **trial_params, 'thread_count': thread_count, 'allow_writing_files': False})
+
+        trial_started = time.perf_counter()
+        with tracing.attach(parent), tracing.span('tuning.trial', trial=number):
+            model.fit(train_pool, eval_set=val_pool, callbacks=[callback])
+
+        if stop.is_set() and callback.pruned_at is None:
+            # cut short by the time budget: not saved, a resumed search runs it again
+            return None
+        record = {
+            'trial': number,
+            'status': 'pruned' if callback.pruned_at is not None else 'complete',
+            'value': callback.best if np.isfinite(callback.best) else None,
+            'best_iteration': model.get_best_iteration(),
+            'iterations': model.tree_count_ if callback.pruned_at is None else callback.pruned_at + 1,
+            'seconds': round(time.perf_counter() - trial_started, 2),
+            'thread_count': thread_count,
+            'params': trial_params,
+            'intermediate': callback.intermediate,
+        }
+        _append(results_path, record, lock)
+        return record
+
+    trials = list(done)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        queue = list(todo)
+        running = {}
+        while queue or running:
+            while queue and len(running) < n_jobs and not stop.is_set():
+                number = queue.pop(0)
+                running[executor.submit(run_trial, number)] = number
+
+            finished, _ = wait(running, timeout=5, return_when=FIRST_COMPLETED)
+            for future in finished:
+                number = running.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    print(f'trial {number} failed: {e}')
+                    continue
+                if record is not None:
+                    trials.append(record)
+                    value = f"{record['value']:.4f}" if record['value'] is not None else '-'
+                    print(f"trial {number} {record['status']} at {record['iterations']} iterations, "
+                          f"NDCG@4 {value} ({record['seconds']}s)")
+
+            if time_budget is not None and time.perf_counter() - started > time_budget and not stop.is_set():
+                print(f'time budget of {time_budget}s used up, stopping the running trials')
+                stop.set()
+                queue.clear()
+
+    return trials_frame(trials)
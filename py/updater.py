@@ -0,0 +1,229 @@
+import re
+from urllib.parse import urljoin
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from . import tracing
+from .cleaning import convert_dates
+from .fixtures import meetings_between
+from .horse_profile import parse_horse_profile, profile_labels
+from .http_client import HostRateLimiter, fetch_all, make_session
+from .race_function import hkjc_base_url
+
+results_url = 'https://racing.hkjc.com/racing/information/English/Racing/LocalResults.aspx'
+
+
+def result_page_url(date, venue, race_no, base_url=results_url):
+    return f'{base_url}?RaceDate={pd.Timestamp(date):%Y/%m/%d}&Racecourse={venue}&RaceNo={race_no}'
+
+
+def record_page_url(horse_link):
+    # the profile page with every past run of the horse
+    return horse_link + '&Option=1'
+
+
+def parse_result_links(html, base_url=hkjc_base_url):
+    """
+    links to the horses of a results page, None when the page has no results table (no such race)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find('table', class_='table_bd')
+    if not table:
+        return None
+
+    header_row = table.find('tr')
+    headers = [td.get_text(strip=True) for td in header_row.find_all('td')]
+    if 'Horse' not in headers:
+        print("no 'horse' column found")
+        return None
+
+    horse_col_index = headers.index('Horse')
+    links = []
+    for row in table.find_all('tr')[1:]:
+        cells = row.find_all('td')
+        if len(cells) > horse_col_index:
+            a_tag = cells[horse_col_index].find('a', href=True)
+            if a_tag:
+                links.append(urljoin(base_url, a_tag['href']))
+    return links
+
+
+def no_race_page(html):
+    """
+    True when a results page says there is no such race, a page that only lacks the results table
+    (cut short, an error page) may still have the race
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    if soup.find('table', class_='table_bd'):
+        return False
+    return 'no information' in soup.get_text().lower()
+
+
+def parse_horse_record(html, horse_id):
+    """
+    every run listed on a horse's record page with the profile fields of the horse,
+    columns as in the race_data csv (RaceIndex, Pla., Date, ..., Horse_id, Origin / Age, ...)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    horse_table = soup.find('table', class_='bigborder')
+    if not horse_table:
+        return pd.DataFrame()
+
+    profile = parse_horse_profile(html)
+
+    header_row = horse_table.find('tr')
+    # the last column is the video replay link
+    header = [td.get_text(strip=True) for td in header_row.find_all('td')][:-1]
+
+    rows = []
+    for tr in horse_table.find_all('tr')[1:]:
+        cols = [td.get_text(strip=True) for td in tr.find_all('td')]
+
+        if all(not col.strip() for col in cols):
+            continue
+        first_col = cols[0].strip()
+        if 'Season' in first_col or first_col == 'Overseas':
+            continue
+
+        rows.append(cols[:len(header)])
+
+    df = pd.DataFrame(rows, columns=header)
+    df['Horse_id'] = horse_id
+    for col in profile_labels:
+        df[col] = profile[col]
+    return df
+
+
+def pending_meetings(store, fixtures, today=None):
+    """
+    fixture meetings after the last meeting in the store, up to 'today'
+    """
+    today = pd.Timestamp.today().normalize() if today is None else pd.Timestamp(today)
+    return meetings_between(fixtures, start=store.last_date(), end=today)
+
+
+@tracing.traced('updater.fetch_meetings')
+def fetch_meetings(meetings, session=None, max_race_no=14, max_workers=8, rate_limiter=None,
+                   results_base_url=results_url):
+    """
+    race_data rows of the given meetings: all result pages, then one record page per runner, fetched
+    concurrently under one rate limiter
+    returns (rows, meetings found, meetings incomplete), a meeting without result pages yet is not
+    found, one with a result page or a runner's record page that failed to load is incomplete and
+    its rows are missing runners
+    """
+    urls = [
+        (date, venue, race_no, result_page_url(date, venue, race_no, results_base_url))
+        for date, venue in meetings for race_no in range(1, max_race_no + 1)
+    ]
+    responses = fetch_all([url for *_, url in urls], session=session, max_workers=max_workers,
+                          rate_limiter=rate_limiter)
+
+    horse_links = {}
+    # dates every horse ran on, a failed record page leaves its runs of all of them out
+    horse_dates = {}
+    found = set()
+    failed = set()
+    for (date, venue, race_no, url), response in zip(urls, responses):
+        if response is None or response.status_code != 200:
+            # an error is not a missing race, the race may still be there
+            print(f'result page of race {race_no} on {date:%d/%m/%Y} @ {venue} could not be fetched')
+            failed.add(date)
+            continue
+        links = parse_result_links(response.text, base_url=url)
+        if not links:
+            continue
+        found.add(date)
+        for link in links:
+            match = re.search(r'([A-Z]\d{3})$', link)
+            if match:
+                horse_links.setdefault(match.group(1), link)
+                horse_dates.setdefault(match.group(1), set()).add(date)
+            else:
+                print(f'no horse id in {link}')
+                failed.add(date)
+
+    # one record page per horse covers all of its new runs, whatever the number of meetings
+    horse_ids = list(horse_links)
+    responses = fetch_all([record_page_url(horse_links[horse_id]) for horse_id in horse_ids], session=session,
+                          max_workers=max_workers, rate_limiter=rate_limiter)
+
+    frames = []
+    for horse_id, response in zip(horse_ids, responses):
+        if response is None or response.status_code != 200:
+            print(f'record page of {horse_id} could not be fetched')
+            failed.update(horse_dates[horse_id])
+            continue
+        record = parse_horse_record(response.content, horse_id)
+        if not len(record):
+            print(f'no runs on the record page of {horse_id}')
+            failed.update(horse_dates[horse_id])
+            continue
+        frames.append(record)
+
+    incomplete = [(date, venue) for date, venue in meetings if date in found and date in failed]
+    found = [(date, venue) for date, venue in meetings if date in found]
+
+    if not frames:
+        return pd.DataFrame(), found, incomplete
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df[convert_dates(df['Date']).isin([date for date, _ in found])]
+    # a run appears once per (Horse_id, race_index), race_index being RaceIndex and Date
+    df = df.drop_duplicates(['Horse_id', 'RaceIndex', 'Date']).reset_index(drop=True)
+
+    return df, found, incomplete
+
+
+@tracing.traced('updater.update_history')
+def update_history(store, fixtures, today=None, max_race_no=14, max_workers=8, rate_limit=5, session=None,
+                   results_base_url=results_url):
+    """
+    add every meeting run since the last one in the store, safe to run repeatedly (e.g. from cron)
+    'store': HistoryStore the meetings are appended to
+    'fixtures': fixture dataframe or csv path, the meetings to look for
+    'today': last date to look at, defaults to today
+    'rate_limit': requests per second to the racing site across all concurrent requests
+    meetings are stored in date order and the update stops at the first meeting without results or
+    with a page that failed to load, so the next run picks it up again
+    returns the rows added
+    """
+    meetings = pending_meetings(store, fixtures, today)
+    if not meetings:
+        print('history is up to date')
+        return pd.DataFrame()
+
+    print(f'{len(meetings)} new meeting(s): ' + ', '.join(f'{date:%d/%m/%Y} @ {venue}' for date, venue in meetings))
+
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max_workers)
+    rate_limiter = HostRateLimiter(rate_limit, burst=max_workers) if rate_limit else None
+
+    try:
+        df, found, incomplete = fetch_meetings(meetings, session=session, max_race_no=max_race_no,
+                                               max_workers=max_workers, rate_limiter=rate_limiter,
+                                               results_base_url=results_base_url)
+    finally:
+        if own_session:
+            session.close()
+
+    # only the meetings before the first one without results or with missing runners,
+    # keeps 'last stored date' meaningful
+    stored = []
+    for date, venue in meetings:
+        if (date, venue) not in found:
+            print(f'no results for {date:%d/%m/%Y} @ {venue} yet, stopping there')
+            break
+        if (date, venue) in incomplete:
+            print(f'pages of {date:%d/%m/%Y} @ {venue} failed to load, stopping there')
+            break
+        stored.append(date)
+
+    if not stored:
+        return pd.DataFrame()
+
+    df = df[convert_dates(df['Date']).isin(stored)]
+    store.append_meeting(df)
+    return df
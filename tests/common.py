@@ -0,0 +1,173 @@
+"""
+shared data of the tests: a small synthetic history and the notebook computations the py/ modules replace
+
+run the tests from the repository root with 'python -m unittest discover tests'
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmark'))
+
+from synthetic import synthetic_history, synthetic_race_data  # noqa: E402
+
+from py.features import history_feature_cols  # noqa: E402
+
+
+def small_history(seed=0, **kwargs):
+    """
+    about 800 cleaned rows over 24 meetings, horses running 6 times on average
+    """
+    settings = dict(n_seasons=1, meetings_per_season=24, races_per_meeting=4, field=8, n_horses=120,
+                    n_jockeys=10, n_trainers=8, seed=seed)
+    settings.update(kwargs)
+    return synthetic_history(**settings)
+
+
+def small_race_data(seed=0, **kwargs):
+    """
+    the raw rows small_history is cleaned from
+    """
+    settings = dict(n_seasons=1, meetings_per_season=24, races_per_meeting=4, field=8, n_horses=120,
+                    n_jockeys=10, n_trainers=8, seed=seed)
+    settings.update(kwargs)
+    return synthetic_race_data(**settings)
+
+
+def notebook_history_features(df):
+    """
+    the rolling features as cleaning_data.ipynb computed them, one groupby / transform per feature
+    """
+    df = df.sort_values(['Horse_id', 'Date'])
+
+    n = 3
+
+    df['recent_3_win_rate_horse'] = (
+        df.groupby('Horse_id')['target']
+        .transform(lambda x: x.shift().rolling(window=n, min_periods=3).mean())
+    )
+
+    df = df.sort_values(['Jockey', 'Date'])
+
+    df['recent_3_win_rate_jockey'] = (
+        df.groupby('Jockey')['target']
+        .transform(lambda x: x.shift().rolling(window=n, min_periods=3).mean())
+    )
+
+    df['recent_5_avg_finish_pos'] = (
+        df.groupby('Horse_id')['target']
+        .transform(lambda x: x.shift().rolling(window=5, min_periods=2).mean())
+    )
+
+    df['recent_3_consistency'] = (
+        df.groupby('Horse_id')['target']
+        .transform(lambda x: x.shift().rolling(window=3, min_periods=2).std())
+    )
+
+    df['jockey_trainer_combo_rate'] = (
+        df.groupby(['Jockey', 'Trainer'])['target']
+        .transform(lambda x: x.shift().expanding(min_periods=5).mean())
+    )
+
+    df['horse_track_distance_rate'] = (
+        df.groupby(['Horse_id', 'track', 'Dist.'])['target']
+        .transform(lambda x: x.shift().expanding(min_periods=2).mean())
+    )
+
+    overall_mean_win_rate = np.mean(df['target'] == 4)
+    for col in history_feature_cols:
+        df[col] = df[col].fillna(overall_mean_win_rate)
+    return df
+
+
+def notebook_race_features(history, race):
+    """
+    features of the runners of one upcoming race the way Final_inference.ipynb gets them: the race is
+    appended to the history without a target and the features of the whole frame are recomputed
+    """
+    race = race.assign(target=np.nan)
+    df = notebook_history_features(pd.concat([history, race], ignore_index=True))
+    return df.loc[df.index >= len(history)].sort_index().reset_index(drop=True)
+
+
+def split_last_meeting(history):
+    """
+    (earlier races, runners of every race of the last meeting without their results)
+    """
+    last = history['Date'] == history['Date'].max()
+    runners = history[last].drop(columns='target')
+    # synthetic races can give a jockey two rides, a real card has one per jockey
+    runners = runners.drop_duplicates(['race_index', 'Jockey']).reset_index(drop=True)
+    return history[~last].reset_index(drop=True), runners
+
+
+def split_last_race(history):
+    """
+    (earlier races, runners of the last race without their results)
+    """
+    last = history['race_index'][history['Date'] == history['Date'].max()].iloc[-1]
+    runners = history[history['race_index'] == last].drop(columns='target')
+    runners = runners.drop_duplicates(['race_index', 'Jockey']).reset_index(drop=True)
+    return history[history['Date'] < history['Date'].max()].reset_index(drop=True), runners
+
+
+def notebook_clean_race_data(df, start_date='04/09/20'):
+    """
+    the cleaning cells of cleaning_data.ipynb before the history features, one python call per row
+    """
+    def convert_year(date_str):
+        day, month, year = date_str.split('/')
+        if len(year) == 4:
+            year = year[2:]
+        return pd.to_datetime(f'{day}/{month}/{year}', format='%d/%m/%y')
+
+    def clean_rc_track_course(text):
+        parts = str(text).split('/')
+        if len(parts) < 3:
+            return parts[0].strip(), parts[1].strip(), None
+        return parts[0].strip(), parts[1].strip(), parts[2].strip().replace('"', '')
+
+    def clean_origin_age(text):
+        parts = str(text).split('/')
+        if len(parts) < 2:
+            return parts[0].strip(), None
+        return parts[0].strip(), parts[1].strip()
+
+    def clean_colour_sex(text):
+        parts = str(text).split('/')
+        return parts[0].strip(), parts[-1].strip()
+
+    exclude = ['WV', 'WV-A', 'WX', 'WX-A', 'WXNR']
+    df = df[~df['Pla.'].isin(exclude)].copy()
+    df['Date'] = df['Date'].apply(convert_year)
+
+    df['race_index'] = df['RaceIndex'].astype(str) + df['Date'].dt.strftime('%d%m%y')
+    df = df.drop(columns=['RaceIndex'])
+
+    df['target'] = df.groupby('race_index')['Pla.'].transform(
+        lambda x: x.apply(lambda place: np.exp(-(int(place) - 1) / 2) if str(place).isdigit() and int(place) <= 4 else 0)
+    )
+
+    df[['rc', 'track', 'course']] = df['RC/Track/Course'].apply(clean_rc_track_course).apply(pd.Series)
+    df = df.drop(columns=['RC/Track/Course'])
+    df[['origin', 'age']] = df['Origin / Age'].apply(clean_origin_age).apply(pd.Series)
+    df = df.drop(columns=['Origin / Age'])
+    df[['colour', 'sex']] = df['Colour / Sex'].apply(clean_colour_sex).apply(pd.Series)
+    df = df.drop(columns=['Colour / Sex'])
+
+    df['Rtg.'] = pd.to_numeric(df['Rtg.'], errors='coerce')
+    df = df.rename(columns={'Dr.': 'gate_position', 'G': 'track_condition'})
+    df = df[['Date', 'race_index', 'RaceClass', 'rc', 'track', 'course', 'Dist.', 'track_condition', 'Horse_id',
+             'Declar.Horse Wt.', 'Act.Wt.', 'gate_position', 'Rtg.', 'age', 'colour', 'sex', 'origin', 'Import type',
+             'Trainer', 'Jockey', 'Sire', 'Dam', 'Dam sire', 'Finish Time', 'Gear', 'target']]
+    for col in ['race_index', 'Declar.Horse Wt.', 'age']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    if start_date is not None:
+        df = df[df['Date'] > pd.to_datetime(start_date, format='%d/%m/%y')]
+    return df
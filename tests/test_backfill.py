@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from common import root  # noqa: F401
+
+from stand_in import StandInServer, no_results_page
+
+from py.backfill import Backfill, Manifest, load_backfill
+from py.updater import no_race_page
+
+meeting = (pd.Timestamp(2025, 9, 14), 'ST')
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'manifest.csv')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def lines(self):
+        with open(self.path) as f:
+            return f.read().split('\n')
+
+    def test_reopening_adds_no_blank_lines(self):
+        Manifest(self.path).add(*meeting, 1, 'done', 14)
+        Manifest(self.path).add(*meeting, 2, 'done', 14)
+        Manifest(self.path)
+        self.assertEqual(self.lines(), ['date,venue,race_no,status,rows', '2025-09-14,ST,1,done,14',
+                                        '2025-09-14,ST,2,done,14', ''])
+
+    def test_line_cut_short_is_redone(self):
+        Manifest(self.path).add(*meeting, 1, 'done', 14)
+        with open(self.path, 'a') as f:
+            f.write('2025-09-14,ST,2,do')
+
+        manifest = Manifest(self.path)
+        self.assertEqual(manifest.next_race(*meeting, 14), 2)
+        manifest.add(*meeting, 2, 'done', 14)
+        self.assertEqual(Manifest(self.path).next_race(*meeting, 14), 3)
+        self.assertEqual(self.lines()[-2:], ['2025-09-14,ST,2,done,14', ''])
+
+
+class BackfillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(races_per_meeting=2).start()
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.folder.cleanup()
+
+    def backfill(self, **kwargs):
+        return Backfill(self.folder.name, max_race_no=4, max_workers=2, rate_limit=None,
+                        results_base_url=self.server.results_url, **kwargs)
+
+    def test_no_race_needs_the_page_to_say_so(self):
+        self.assertTrue(no_race_page(no_results_page))
+        self.assertFalse(no_race_page(self.server.results))
+        self.assertFalse(no_race_page(b'<html><body>Service busy, please try again</body></html>'))
+
+    def test_run_writes_the_races_of_the_meeting(self):
+        summary = self.backfill().run([meeting])
+        self.assertEqual(summary['races'], 2)
+        self.assertEqual(Manifest(os.path.join(self.folder.name, 'manifest.csv')).status(*meeting, 3), 'no_race')
+        # the same recorded race twice, one row per runner
+        self.assertEqual(len(load_backfill(self.folder.name)), 14)
+        # one record page per horse for both races
+        self.assertEqual(self.server.counts['horse'], 14)
+
+        self.assertEqual(self.backfill().run([meeting])['meetings'], 0)
+
+    def test_failed_result_page_is_not_no_race(self):
+        self.server.failing.add('RaceNo=2')
+        self.assertEqual(self.backfill().run([meeting])['races'], 1)
+        manifest = Manifest(os.path.join(self.folder.name, 'manifest.csv'))
+        self.assertIsNone(manifest.status(*meeting, 2))
+
+        self.server.failing.clear()
+        self.assertEqual(self.backfill().run([meeting])['races'], 1)
+
+    def test_records_are_bounded(self):
+        backfill = self.backfill(max_records=3)
+        self.assertEqual(backfill.run([meeting])['races'], 2)
+        self.assertEqual(len(backfill.records), 3)
+        # dropped horses are fetched again for the second race
+        self.assertEqual(self.server.counts['horse'], 28)
+
+
+if __name__ == '__main__':
+    unittest.main()
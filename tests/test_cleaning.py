@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from common import notebook_clean_race_data, small_race_data
+
+from py.cleaning import clean_race_data, compute_target, convert_dates
+
+
+class CleanRaceDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.raw = small_race_data()
+        # every kind of row the notebook handles: turf and AWT races, withdrawn and dead heat places,
+        # four digit years and missing profile fields
+        four_digits = self.raw.index[::97]
+        self.raw.loc[four_digits, 'Date'] = self.raw.loc[four_digits, 'Date'].str.replace(r'/(\d\d)$', r'/20\1', regex=True)
+        self.raw.loc[self.raw.index[5::89], 'Origin / Age'] = 'AUS'
+        self.raw.loc[self.raw.index[7::83], 'Pla.'] = 'WXNR'
+
+    def assert_same_as_notebook(self, raw, start_date='04/09/20'):
+        expected = notebook_clean_race_data(raw.copy(), start_date)
+        got = clean_race_data(raw.copy(), start_date)
+        pd.testing.assert_frame_equal(got, expected)
+
+    def test_fixture_has_every_kind_of_row(self):
+        tracks = self.raw['RC/Track/Course'].str.contains('AWT')
+        self.assertTrue(tracks.any() and not tracks.all())
+        self.assertTrue(self.raw['Pla.'].isin(['WV', 'WX', 'WV-A', 'WXNR']).any())
+        self.assertTrue(self.raw['Pla.'].str.endswith('DH').any())
+
+    def test_matches_notebook(self):
+        self.assert_same_as_notebook(self.raw)
+        self.assert_same_as_notebook(self.raw, start_date=None)
+
+    def test_matches_notebook_when_every_race_is_on_the_awt(self):
+        awt = self.raw[self.raw['RC/Track/Course'].str.contains('AWT')]
+        self.assert_same_as_notebook(awt, start_date=None)
+        self.assertEqual(clean_race_data(awt, start_date=None)['course'].dtype, np.float64)
+
+    def test_matches_notebook_when_every_race_is_on_turf(self):
+        turf = self.raw[~self.raw['RC/Track/Course'].str.contains('AWT')]
+        self.assert_same_as_notebook(turf, start_date=None)
+
+    def test_compute_target(self):
+        places = pd.Series(['1', '2', '4', '5', '3 DH', 'PU', np.nan])
+        expected = [1.0, np.exp(-0.5), np.exp(-1.5), 0.0, 0.0, 0.0, 0.0]
+        np.testing.assert_allclose(compute_target(places), expected)
+
+    def test_convert_dates(self):
+        dates = convert_dates(pd.Series(['22/10/25', '01/09/2024']))
+        self.assertEqual(list(dates), [pd.Timestamp('2025-10-22'), pd.Timestamp('2024-09-01')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from common import notebook_history_features, small_history
+
+from py.cv import temporal_cv_folds, temporal_cv_split
+from py.feature_matrix import FeatureMatrix, build_feature_matrix
+
+
+class TemporalCvTest(unittest.TestCase):
+
+    def setUp(self):
+        # sorted by jockey and date, the races of a day are interleaved the way training.ipynb has them
+        self.df = notebook_history_features(small_history())
+        self.folder = tempfile.TemporaryDirectory()
+        build_feature_matrix(self.df, self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_folds_match_the_split(self):
+        fm = FeatureMatrix(self.folder.name)
+        folds = temporal_cv_folds(fm.n_groups, n_splits=5)
+        splits = list(temporal_cv_split(self.df, n_splits=5))
+        self.assertEqual(len(folds), len(splits))
+
+        for (train_start, train_end, val_end), (train_races, val_races) in zip(folds, splits):
+            train = np.unique(np.asarray(fm.groups(train_start, train_end).group_id))
+            val = np.unique(np.asarray(fm.groups(train_end, val_end).group_id))
+            self.assertEqual(set(train), set(train_races))
+            self.assertEqual(set(val), set(val_races))
+
+    def test_split_ignores_the_row_order(self):
+        shuffled = self.df.sample(frac=1, random_state=0)
+        for (train, val), (shuffled_train, shuffled_val) in zip(temporal_cv_split(self.df),
+                                                                 temporal_cv_split(shuffled)):
+            np.testing.assert_array_equal(train, shuffled_train)
+            np.testing.assert_array_equal(val, shuffled_val)
+
+
+if __name__ == '__main__':
+    unittest.main()
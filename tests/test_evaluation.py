@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+from sklearn.metrics import ndcg_score
+
+from py.evaluation import mean_ndcg, race_results
+
+
+def random_races(seed=0, n_races=300):
+    # races of 1 to 14 runners, notebook targets, some races without a top-4 finisher and tied scores
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 15, n_races)
+    groups = np.repeat(rng.permutation(n_races) * 7 + 1000, sizes)
+    y_true = np.concatenate([
+        np.where(np.arange(size) < 4, np.exp(-np.arange(size) / 2), 0.0)[rng.permutation(size)] for size in sizes
+    ])
+    y_true[np.isin(groups, groups[::9])] = 0.0
+    y_pred = np.round(rng.normal(0, 1, len(groups)), 1)
+    return y_true, y_pred, groups
+
+
+class RaceResultsTest(unittest.TestCase):
+
+    def test_ndcg_matches_sklearn_per_race(self):
+        y_true, y_pred, groups = random_races()
+        for k in (1, 3, 4, 10):
+            results = race_results(y_true, y_pred, groups, k=k).set_index('race_index')
+            expected = {}
+            for race in np.unique(groups):
+                mask = groups == race
+                if mask.sum() < 2:
+                    continue
+                expected[race] = ndcg_score([y_true[mask]], [y_pred[mask]], k=min(k, mask.sum()))
+
+            self.assertEqual(sorted(results.index), sorted(expected))
+            np.testing.assert_allclose(results.loc[list(expected), f'ndcg@{k}'], list(expected.values()),
+                                       rtol=1e-12, atol=1e-12, err_msg=f'k={k}')
+
+    def test_mean_ndcg_matches_the_notebook_average(self):
+        y_true, y_pred, groups = random_races(seed=1)
+        scores = []
+        for race in np.unique(groups):
+            mask = groups == race
+            if mask.sum() >= 2:
+                scores.append(ndcg_score([y_true[mask]], [y_pred[mask]], k=min(4, mask.sum())))
+        self.assertAlmostEqual(mean_ndcg(y_true, y_pred, groups, k=4), np.mean(scores), places=12)
+
+    def test_hit_and_top1(self):
+        y_true = np.array([1.0, 0.6, 0.0, 0.0, 0.0, 1.0, 0.6, 0.0])
+        y_pred = np.array([0.1, 0.9, 0.5, 0.3, 0.2, 0.9, 0.1, 0.2])
+        groups = np.array([1, 1, 1, 1, 1, 2, 2, 2])
+        results = race_results(y_true, y_pred, groups, k=2)
+        # race 1: the winner is predicted last, race 2: predicted first
+        self.assertEqual(list(results['hit@2']), [0.0, 1.0])
+        self.assertEqual(list(results['top1']), [0.0, 1.0])
+        self.assertEqual(list(results['runners']), [5, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
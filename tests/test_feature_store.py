@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from common import notebook_race_features, small_history, split_last_race
+
+from py.feature_store import FeatureStore
+from py.features import history_feature_cols, runner_history_features
+
+
+def assert_features_equal(got, expected):
+    for col in history_feature_cols:
+        np.testing.assert_allclose(got[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                                   rtol=1e-12, atol=1e-12, err_msg=col)
+
+
+class FeatureStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history, self.runners = split_last_race(small_history())
+        # a few results count as target 4 so the fill value is not zero
+        self.history.loc[self.history.index[::50], 'target'] = 4.0
+
+    def test_matches_notebook_features(self):
+        store = FeatureStore.from_history(self.history)
+        expected = notebook_race_features(self.history, self.runners)
+        assert_features_equal(store.features_for(self.runners), expected)
+        assert_features_equal(runner_history_features(self.history, self.runners), expected)
+
+    def test_incremental_update_matches_rebuild(self):
+        dates = np.sort(self.history['Date'].unique())
+        store = FeatureStore.from_history(self.history[self.history['Date'] < dates[12]])
+        for date in dates[12:]:
+            store.update(self.history[self.history['Date'] == date])
+
+        rebuilt = FeatureStore.from_history(self.history)
+        self.assertEqual(store.n_rows, rebuilt.n_rows)
+        self.assertEqual(dict(store.horse_runs), dict(rebuilt.horse_runs))
+
+        expected = notebook_race_features(self.history, self.runners)
+        assert_features_equal(store.features_for(self.runners), expected)
+
+    def test_missing_targets_are_skipped(self):
+        history = self.history.copy()
+        history.loc[history.index[3::7], 'target'] = np.nan
+
+        dates = np.sort(history['Date'].unique())
+        store = FeatureStore.from_history(history[history['Date'] < dates[12]])
+        store.update(history[history['Date'] >= dates[12]])
+
+        expected = notebook_race_features(history, self.runners)
+        assert_features_equal(store.features_for(self.runners), expected)
+        assert_features_equal(runner_history_features(history, self.runners), expected)
+
+    def test_save_and_load(self):
+        store = FeatureStore.from_history(self.history)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'feature_store.pkl')
+            store.save(path)
+            loaded = FeatureStore.load(path)
+        assert_features_equal(loaded.features_for(self.runners), store.features_for(self.runners))
+
+    def test_rejects_older_results(self):
+        store = FeatureStore.from_history(self.history)
+        with self.assertRaises(ValueError):
+            store.update(self.history[self.history['Date'] == self.history['Date'].min()])
+
+
+if __name__ == '__main__':
+    unittest.main()
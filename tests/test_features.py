@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from common import notebook_history_features, notebook_race_features, small_history, split_last_meeting
+
+from py.feature_store import FeatureStore
+from py.features import add_history_features, history_feature_cols, race_sizes, runner_history_features
+
+
+def assert_features_equal(got, expected):
+    for col in history_feature_cols:
+        np.testing.assert_allclose(got[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                                   rtol=1e-12, atol=1e-12, err_msg=col)
+
+
+class AddHistoryFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = small_history()
+        self.history.loc[self.history.index[::50], 'target'] = 4.0
+
+    def test_matches_notebook(self):
+        got = add_history_features(self.history.copy())
+        expected = notebook_history_features(self.history.copy())
+        # both come back sorted by Jockey and Date
+        self.assertEqual(list(got.index), list(expected.index))
+        assert_features_equal(got, expected)
+
+    def test_matches_notebook_with_missing_values(self):
+        history = self.history.copy()
+        history.loc[history.index[3::7], 'target'] = np.nan
+        history.loc[history.index[5::31], 'Jockey'] = np.nan
+        history.loc[history.index[2::43], 'Trainer'] = np.nan
+
+        got = add_history_features(history.copy())
+        expected = notebook_history_features(history.copy())
+        assert_features_equal(got.sort_index(), expected.sort_index())
+
+
+class RunnerHistoryFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        history = small_history()
+        history.loc[history.index[::50], 'target'] = 4.0
+        self.history, runners = split_last_meeting(history)
+        self.runners = runners.sort_values('race_index', kind='stable').reset_index(drop=True)
+
+    def expected(self):
+        # every race of the meeting appended to the history on its own, as the inference notebook does
+        races = [notebook_race_features(self.history, race) for _, race in self.runners.groupby('race_index', sort=False)]
+        return pd.concat(races, ignore_index=True)
+
+    def test_meeting_matches_notebook_race_by_race(self):
+        runners = self.runners
+        self.assertGreater(runners['race_index'].nunique(), 1)
+        expected = self.expected()
+
+        assert_features_equal(runner_history_features(self.history, runners), expected)
+        assert_features_equal(FeatureStore.from_history(self.history).features_for(runners), expected)
+
+        # the inference engine tells races apart by race_no
+        by_race_no = runners.rename(columns={'race_index': 'race_no'})
+        assert_features_equal(runner_history_features(self.history, by_race_no), expected)
+
+    def test_race_sizes(self):
+        runners = pd.DataFrame({'race_no': [1, 1, 2, 1, 2, np.nan]})
+        self.assertEqual(list(race_sizes(runners)), [3, 3, 2, 3, 2, 1])
+        self.assertEqual(list(race_sizes(runners.rename(columns={'race_no': 'other'}))), [6] * 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+
+from common import small_race_data
+
+from py.cleaning import convert_dates
+from py.history_store import HistoryStore
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(self.folder.name)
+        self.raw = small_race_data(n_seasons=2, meetings_per_season=6)
+        self.raw['Act.Wt.'] = self.raw['Act.Wt.'].astype(int)
+        self.dates = convert_dates(self.raw['Date'])
+        self.days = sorted(self.dates.unique())
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def meetings(self, first, last=None):
+        last = self.days[-1] if last is None else last
+        return self.raw[(self.dates >= first) & (self.dates <= last)].copy()
+
+    def test_round_trip(self):
+        self.store.append_meeting(self.meetings(self.days[0]))
+        self.store.compact()
+        df = self.store.read()
+        self.assertEqual(len(df), len(self.raw))
+        self.assertEqual(list(df['Horse_id']), list(self.raw['Horse_id']))
+        self.assertEqual(list(df['Act.Wt.']), list(self.raw['Act.Wt.']))
+
+    def test_values_that_do_not_fit_raise(self):
+        self.store.append_meeting(self.meetings(self.days[0], self.days[3]))
+        bad = self.meetings(self.days[4])
+        bad['Act.Wt.'] = bad['Act.Wt.'].astype(object)
+        bad.iloc[0, bad.columns.get_loc('Act.Wt.')] = '--'
+
+        with self.assertRaisesRegex(ValueError, r"'Act\.Wt\.'.*'--'"):
+            self.store.append_meeting(bad)
+        # nothing of the meetings was written
+        self.assertEqual(len(self.store.dates()), 4)
+
+        self.store.append_meeting(bad, coerce=True)
+        df = self.store.read()
+        self.assertEqual(len(df), len(self.raw))
+        self.assertEqual(df['Act.Wt.'].isna().sum(), 1)
+
+    def test_hkjc_text_columns_are_text(self):
+        # the first meetings only have numeric places, draws and ratings, later ones do not
+        first = self.meetings(self.days[0], self.days[3])
+        first = first[first['Pla.'].str.fullmatch(r'\d+')]
+        for col in ['Pla.', 'Dr.', 'Rtg.']:
+            first[col] = first[col].astype(int)
+        self.store.append_meeting(first)
+
+        later = self.meetings(self.days[4])
+        later.iloc[0, later.columns.get_loc('Pla.')] = 'WV'
+        later.iloc[1, later.columns.get_loc('Pla.')] = '3 DH'
+        later.iloc[2, later.columns.get_loc('Rtg.')] = '--'
+        self.store.append_meeting(later)
+
+        df = self.store.read()
+        self.assertEqual(list(df['Pla.']), list(first['Pla.'].map(str)) + list(later['Pla.']))
+        self.assertEqual(list(df['Rtg.']), list(first['Rtg.'].map(str)) + list(later['Rtg.']))
+
+    def test_new_columns_extend_the_schema(self):
+        self.store.append_meeting(self.meetings(self.days[0], self.days[7]))
+        self.store.compact()
+        self.store.append_meeting(self.meetings(self.days[8]).assign(Extra=1.5))
+
+        self.assertIn('Extra', self.store.schema().names)
+        df = self.store.read()
+        later = convert_dates(df['Date']) >= self.days[8]
+        self.assertTrue((df.loc[later, 'Extra'] == 1.5).all())
+        self.assertTrue(df.loc[~later, 'Extra'].isna().all())
+
+        # an older meeting without the column still fits
+        self.store.append_meeting(self.meetings(self.days[0], self.days[0]), overwrite=True)
+        self.assertEqual(len(self.store.read()), len(self.raw))
+
+    def test_meetings_already_stored_are_skipped(self):
+        self.store.append_meeting(self.meetings(self.days[0], self.days[2]))
+        written = self.store.append_meeting(self.meetings(self.days[0], self.days[3]))
+        self.assertEqual(len(written), 1)
+        self.assertEqual(len(self.store.read()), len(self.meetings(self.days[0], self.days[3])))
+
+
+if __name__ == '__main__':
+    unittest.main()
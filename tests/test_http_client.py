@@ -0,0 +1,68 @@
+import socket
+import time
+import unittest
+
+from common import root  # noqa: F401
+
+from stand_in import StandInServer, card_path, results_path
+
+from py.http_client import HostRateLimiter, fetch_all
+
+
+def closed_port():
+    # a port nothing listens on, requests to it fail to connect
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class FetchAllTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(races_per_meeting=3, latency=0.02).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_keeps_the_order_of_the_urls(self):
+        urls = [self.server.base_url + results_path + f'?RaceNo={race_no}' for race_no in range(1, 13)]
+        responses = fetch_all(urls, max_workers=6)
+
+        self.assertEqual([r.url for r in responses], urls)
+        self.assertEqual([r.content == self.server.results for r in responses], [True] * 3 + [False] * 9)
+        self.assertEqual(self.server.counts['results'], 12)
+
+    def test_failed_requests_are_none(self):
+        card = self.server.base_url + card_path
+        unreachable = f'http://127.0.0.1:{closed_port()}' + card_path
+        responses = fetch_all([card, unreachable, self.server.base_url + '/missing'], max_workers=3, timeout=2)
+
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertIsNone(responses[1])
+        # an error page is a response, only requests that get none are None
+        self.assertEqual(responses[2].status_code, 404)
+
+    def test_respects_the_rate_limit(self):
+        urls = [self.server.base_url + card_path] * 12
+        started = time.perf_counter()
+        responses = fetch_all(urls, max_workers=4, rate_limiter=HostRateLimiter(40, burst=2))
+        elapsed = time.perf_counter() - started
+
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        # 2 requests of the burst, then 10 more at 40 per second
+        self.assertGreaterEqual(elapsed, 10 / 40)
+
+    def test_shared_limiter_spans_calls(self):
+        limiter = HostRateLimiter(40, burst=1)
+        urls = [self.server.base_url + card_path] * 6
+        started = time.perf_counter()
+        fetch_all(urls, max_workers=3, rate_limiter=limiter)
+        fetch_all(urls, max_workers=3, rate_limiter=limiter)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(self.server.counts['card'], 12)
+        self.assertGreaterEqual(elapsed, 11 / 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import threading
+import time
+import unittest
+
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
+
+from common import root  # noqa: F401
+
+from stand_in import StandInServer
+
+from py.odds import BrowserPool, FallbackOddsSource, HttpOddsSource, OddsSource, SeleniumOddsSource
+
+expected_odds = ['6.2', '33', '23', '4.8', '11', '33', '19', '45', '33', 'Unknown', '33', '2.1', '12', '19']
+
+
+class StandInDriver:
+    """
+    stands in for a chrome webdriver, loads the pages over plain http without running their scripts
+    """
+
+    def __init__(self):
+        self.page_source = ''
+        self.quit_calls = 0
+
+    def get(self, url):
+        self.page_source = requests.get(url, timeout=5).text
+
+    def find_element(self, by, value):
+        element = BeautifulSoup(self.page_source, 'html.parser').select_one(value)
+        if element is None:
+            raise NoSuchElementException(value)
+        return element
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+class StandInPool(BrowserPool):
+
+    def __init__(self, size=1, poll=0.05):
+        super().__init__(size=size, poll=poll)
+        self.started = []
+
+    def _new_driver(self):
+        driver = StandInDriver()
+        self.started.append(driver)
+        return driver
+
+
+class FailingSource(OddsSource):
+
+    def fetch(self, odds_url):
+        raise ConnectionError('no odds here')
+
+
+class EmptySource(OddsSource):
+
+    def fetch(self, odds_url):
+        return FallbackOddsSource([]).fetch(odds_url)
+
+
+class BrowserPoolTest(unittest.TestCase):
+
+    def test_reuses_released_drivers(self):
+        pool = StandInPool(size=2)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(len(pool.started), 1)
+
+    def test_broken_driver_frees_its_slot_for_a_waiter(self):
+        pool = StandInPool(size=1)
+        driver = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        time.sleep(0.1)
+        pool.release(driver, broken=True)
+        waiter.join(2)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(driver.quit_calls, 1)
+        self.assertIs(got[0], pool.started[1])
+
+    def test_close_quits_every_driver_and_stops_acquire(self):
+        pool = StandInPool(size=2)
+        idle, checked_out = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close()
+
+        self.assertEqual([idle.quit_calls, checked_out.quit_calls], [1, 1])
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        # released after close, it is quit again instead of going back to the idle queue
+        pool.release(checked_out)
+        self.assertEqual(checked_out.quit_calls, 2)
+        self.assertTrue(pool.idle.empty())
+
+    def test_close_wakes_up_waiting_acquire(self):
+        pool = StandInPool(size=1)
+        pool.acquire()
+        errors = []
+
+        def wait():
+            try:
+                pool.acquire()
+            except RuntimeError as e:
+                errors.append(e)
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.1)
+        pool.close()
+        waiter.join(2)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(len(errors), 1)
+
+
+class OddsSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.odds_url = self.server.odds_url()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_http_source_reads_the_json_endpoint(self):
+        source = HttpOddsSource(endpoint=self.server.odds_endpoint)
+        self.assertEqual(list(source.fetch(self.odds_url)['Win Odds']), expected_odds)
+        self.assertEqual(self.server.counts['odds'], 1)
+
+    def test_selenium_source_reads_the_odds_table(self):
+        pool = StandInPool()
+        source = SeleniumOddsSource(pool=pool, wait=2)
+        for _ in range(3):
+            self.assertEqual(list(source.fetch(self.odds_url)['Win Odds']), expected_odds)
+
+        # one browser for every race
+        self.assertEqual(len(pool.started), 1)
+        self.assertEqual(self.server.counts['odds_page'], 3)
+        source.close()
+        self.assertEqual(pool.started[0].quit_calls, 1)
+
+    def test_selenium_timeout_keeps_the_driver(self):
+        pool = StandInPool()
+        source = SeleniumOddsSource(pool=pool, wait=0.2)
+        with self.assertRaises(Exception) as caught:
+            source.fetch(self.server.base_url + '/missing/2025-09-07/ST/2')
+
+        self.assertEqual(type(caught.exception).__name__, 'TimeoutException')
+        self.assertEqual(pool.started[0].quit_calls, 0)
+        self.assertIs(pool.acquire(), pool.started[0])
+
+    def test_fallback_uses_the_next_source(self):
+        pool = StandInPool()
+        source = FallbackOddsSource([FailingSource(), EmptySource(), SeleniumOddsSource(pool=pool, wait=2)])
+        self.assertEqual(list(source.fetch(self.odds_url)['Win Odds']), expected_odds)
+
+        source.close()
+        self.assertTrue(pool.closed)
+
+    def test_fallback_stops_at_the_first_odds(self):
+        pool = StandInPool()
+        source = FallbackOddsSource([HttpOddsSource(endpoint=self.server.odds_endpoint),
+                                     SeleniumOddsSource(pool=pool)])
+        self.assertEqual(list(source.fetch(self.odds_url)['Win Odds']), expected_odds)
+        self.assertEqual(pool.started, [])
+        self.assertEqual(self.server.counts['odds_page'], 0)
+
+    def test_fallback_without_odds_is_empty(self):
+        source = FallbackOddsSource([FailingSource(), EmptySource()])
+        odds = source.fetch(self.odds_url)
+        self.assertEqual(list(odds.columns), ['Win Odds'])
+        self.assertEqual(len(odds), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from common import small_history, split_last_race
+
+from py.feature_store import FeatureStore
+from py.service import PredictionService
+
+
+class StandInModel:
+    feature_names_ = ['form']
+
+    def predict(self, X):
+        return X['form'].to_numpy(dtype=float)
+
+
+class StandInEngine:
+    """
+    scrapes every race as two runners whose 'form' is the number of results added so far,
+    'scrape_wait' holds each scrape back so requests can overlap
+    """
+
+    max_workers = 4
+    model = StandInModel()
+
+    def __init__(self, scrape_wait=0.0):
+        self.scrape_wait = scrape_wait
+        self.history = 0
+        self.scrapes = 0
+
+    def scrape_race(self, date, venue, race_no):
+        self.scrapes += 1
+        time.sleep(self.scrape_wait)
+        return pd.DataFrame({'Horse_name': ['A', 'B']})
+
+    def model_input(self, runners, date):
+        runners = runners.assign(form=[self.history, self.history + 1])
+        return runners, runners[['form']]
+
+    def add_results(self, results):
+        self.history += 1
+
+    @staticmethod
+    def ranked(runners):
+        return runners.sort_values('Predicted_Score', ascending=False)
+
+
+def best_score(body):
+    return json.loads(body)['runners'][0]['Predicted_Score']
+
+
+class PredictionServiceTest(unittest.TestCase):
+
+    def test_waiting_request_keeps_its_race_lock(self):
+        service = PredictionService(StandInEngine(scrape_wait=0.2), card_ttl=0.05)
+        threads = [threading.Thread(target=service.score_race, args=('2025-10-22', 'HV', 1)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        # a purge while the requests hold or wait for the lock leaves it to them
+        with service.lock:
+            service.purged_at = 0
+            service._purge(time.monotonic())
+            self.assertIn(('2025-10-22', 'HV', 1), service.race_locks)
+        for thread in threads:
+            thread.join()
+
+        # the first request scraped, the others waited on the same lock and got its card
+        self.assertEqual(service.engine.scrapes, 1)
+        self.assertEqual(service.race_locks[('2025-10-22', 'HV', 1)][1], 0)
+
+    def test_race_scored_across_add_results_is_not_cached(self):
+        engine = StandInEngine(scrape_wait=0.2)
+        service = PredictionService(engine, card_ttl=60)
+        scored = []
+        thread = threading.Thread(target=lambda: scored.append(service.score_race('2025-10-22', 'HV', 1)))
+        thread.start()
+        time.sleep(0.1)
+        service.add_results(None)
+        thread.join()
+
+        self.assertEqual(service.stats()['cached_races'], 0)
+        self.assertEqual(best_score(service.score_race('2025-10-22', 'HV', 1)), 2.0)
+        self.assertEqual(best_score(service.score_race('2025-10-22', 'HV', 1)), 2.0)
+        self.assertEqual(engine.scrapes, 2)
+
+
+class FeatureStoreCopyTest(unittest.TestCase):
+
+    def test_update_of_a_copy_leaves_the_store_as_it_was(self):
+        history, runners = split_last_race(small_history())
+        dates = np.sort(history['Date'].unique())
+        store = FeatureStore.from_history(history[history['Date'] < dates[-1]])
+        before = store.features_for(runners)
+
+        updated = store.copy()
+        updated.update(history[history['Date'] == dates[-1]])
+
+        pd.testing.assert_frame_equal(store.features_for(runners), before)
+        pd.testing.assert_frame_equal(updated.features_for(runners),
+                                      FeatureStore.from_history(history).features_for(runners))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+
+import pandas as pd
+
+from common import root  # noqa: F401
+
+from stand_in import StandInServer
+
+from py.history_store import HistoryStore
+from py.updater import fetch_meetings, update_history
+
+# the stand-in serves the recorded results of 14/09/2025 for every meeting, so the runs on the
+# recorded horse pages only fill the second one
+first, second = (pd.Timestamp(2025, 9, 7), 'ST'), (pd.Timestamp(2025, 9, 14), 'ST')
+
+
+class UpdaterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(races_per_meeting=2).start()
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(self.folder.name)
+        self.fixtures = pd.DataFrame({'Date': [first[0], second[0]], 'Venue': [first[1], second[1]]})
+
+    def tearDown(self):
+        self.server.stop()
+        self.folder.cleanup()
+
+    def update(self):
+        return update_history(self.store, self.fixtures, today=second[0], max_race_no=3, max_workers=4,
+                              rate_limit=None, results_base_url=self.server.results_url)
+
+    def test_fetch_meetings(self):
+        df, found, incomplete = fetch_meetings([first, second], max_race_no=3, max_workers=4,
+                                               results_base_url=self.server.results_url)
+        self.assertEqual(found, [first, second])
+        self.assertEqual(incomplete, [])
+        self.assertEqual(len(df), 14)
+        self.assertEqual(set(df['Date']), {'14/09/25'})
+        # one record page per horse for both meetings
+        self.assertEqual(self.server.counts['horse'], 14)
+
+    def test_failed_record_page_makes_meetings_incomplete(self):
+        self.server.failing.add('J180')
+        df, found, incomplete = fetch_meetings([first, second], max_race_no=3, max_workers=4,
+                                               results_base_url=self.server.results_url)
+        self.assertEqual(found, [first, second])
+        self.assertEqual(incomplete, [first, second])
+        self.assertNotIn('J180', set(df['Horse_id']))
+
+    def test_stores_complete_meetings(self):
+        added = self.update()
+        self.assertEqual(len(added), 14)
+        self.assertEqual(self.store.dates(), [second[0]])
+        self.assertEqual(len(self.store.read()), 14)
+
+    def test_stops_before_a_meeting_with_a_failed_result_page(self):
+        self.server.failing.add('RaceDate=2025/09/07&Racecourse=ST&RaceNo=2')
+        self.assertEqual(len(self.update()), 0)
+        self.assertEqual(self.store.dates(), [])
+
+        # the next run fetches the meeting again
+        self.server.failing.clear()
+        self.assertEqual(len(self.update()), 14)
+
+    def test_stops_before_a_meeting_with_a_failed_record_page(self):
+        self.server.failing.add('J180')
+        self.assertEqual(len(self.update()), 0)
+        self.assertEqual(self.store.dates(), [])
+
+        self.server.failing.clear()
+        added = self.update()
+        self.assertIn('J180', set(added['Horse_id']))
+        self.assertEqual(len(self.store.read()), 14)
+
+
+if __name__ == '__main__':
+    unittest.main()